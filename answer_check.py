@@ -1,17 +1,12 @@
-import editdistance
 import sys
 
+from textmining.editdist import is_close
+
 
-def scaled_editdist(ans, cor):
-    ans = ans.lower()
-    cor = cor.lower()
-    
-    return editdistance.eval(ans, cor) / len(cor)
-    
 def single_match(a, c):
     if c.isdecimal():
         return a == c
-    return scaled_editdist(a, c) < 0.5
+    return is_close(a, c, strict=True)
         
 def match(ans, cor):
     return any(single_match(ans, c) for c in cor)
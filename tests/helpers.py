@@ -0,0 +1,41 @@
+from textmining.index import (
+    DiskIndex,
+    DiskPositionIndex,
+    Document,
+    Index,
+    PositionIndex,
+)
+
+DOCUMENTS = [
+    Document("Kot", "Kot siedzi na płocie."),
+    Document("Pies", "Pies szczeka na kota, a kot ucieka."),
+    Document("Płot", "Stary płot stoi przy drodze."),
+    Document("Droga", "Droga prowadzi do lasu, gdzie pies biega."),
+]
+
+_DISK_INDEX_CLS = {Index: DiskIndex, PositionIndex: DiskPositionIndex}
+
+
+def lemmatize(word: str):
+    return {
+        "kota": ("kot",),
+        "koty": ("kot",),
+        "psa": ("pies",),
+        "psy": ("pies",),
+        "lesie": ("las",),
+    }.get(word, (word,))
+
+
+def build(index_cls=Index, documents=DOCUMENTS):
+    index = index_cls(lemmatize)
+    index.extend(documents)
+    return index
+
+
+def save(dir, index_cls=Index, documents=DOCUMENTS):
+    """
+    Build index of the documents, save it in the directory
+    and return it opened from there.
+    """
+    build(index_cls, documents).save(dir, progress=False)
+    return _DISK_INDEX_CLS[index_cls](lemmatize, dir)
@@ -0,0 +1,36 @@
+from textmining.benchmark import (
+    compare,
+    run,
+    synthetic_documents,
+    synthetic_vocabulary,
+)
+
+
+def test_synthetic_corpus_is_deterministic():
+    vocabulary = synthetic_vocabulary(200, seed=1)
+    assert vocabulary == synthetic_vocabulary(200, seed=1)
+    assert len(vocabulary.lemmas) == 200
+    words_to_lemmas = vocabulary.words_to_lemmas()
+    assert all(
+        lemma in words_to_lemmas[form]
+        for lemma, forms in zip(vocabulary.lemmas, vocabulary.forms)
+        for form in forms
+    )
+    documents = list(synthetic_documents(vocabulary, 20, seed=1))
+    assert documents == list(synthetic_documents(vocabulary, 20, seed=1))
+    assert documents != list(synthetic_documents(vocabulary, 20, seed=2))
+
+
+def test_run(tmp_path):
+    results = run(tmp_path, n_documents=100, n_lemmas=300, n_queries=10)
+    assert results["build_index"]["docs_per_s"] > 0
+    assert results["build_index"]["size_bytes"] > 0
+    for stage in ["and_index_search", "phrase_index_search", "broad_engine_ranked"]:
+        stats = results[stage]
+        assert 0 < stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+    assert "qa_answer" not in results
+
+    report = {"results": results}
+    table = compare(report, report)
+    assert "build_index.docs_per_s" in table
+    assert "+0.0%" in table
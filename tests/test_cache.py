@@ -0,0 +1,51 @@
+from textmining.cache import LRUCache, PrefixedCache
+
+
+def test_lru_cache_evicts_by_size():
+    cache = LRUCache(10)
+    cache.put("a", 1, 4)
+    cache.put("b", 2, 4)
+    assert cache.get("a") == 1
+    cache.put("c", 3, 4)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.evictions) == (3, 1, 1)
+    assert (stats.size, stats.capacity) == (8, 10)
+
+
+def test_lru_cache_replace_and_oversized():
+    cache = LRUCache(10)
+    cache.put("a", 1, 4)
+    cache.put("a", 2, 6)
+    cache.put("big", 3, 11)
+
+    assert len(cache) == 1
+    assert cache.get("a") == 2
+    assert cache.get("big") is None
+    assert cache.stats().size == 6
+
+
+def test_disabled_lru_cache():
+    cache = LRUCache(0)
+    cache.put("a", 1, 1)
+    assert cache.get("a") is None
+    assert cache.stats().misses == 1
+
+
+def test_prefixed_caches_share_capacity():
+    cache = LRUCache(10)
+    first, second = PrefixedCache(cache, "first"), PrefixedCache(cache, "second")
+    first.put("a", 1, 4)
+    second.put("a", 2, 4)
+    assert first.get("a") == 1
+    second.put("b", 3, 4)
+
+    assert "a" in first
+    assert "a" not in second
+    assert second.get("b") == 3
+    assert first.stats() == cache.stats()
+    assert (cache.stats().size, cache.stats().evictions) == (8, 1)
@@ -0,0 +1,100 @@
+import gzip
+
+import pytest
+from helpers import lemmatize
+
+from textmining.corpus import (
+    Document,
+    SourceDocuments,
+    map_corpus,
+    read_document_at,
+    read_documents,
+)
+from textmining.index import DiskIndex, DiskPositionIndex, Index, PositionIndex
+
+CORPUS = (
+    "TITLE: \n"
+    "Kot\n"
+    "Kot siedzi\n"
+    "  na płocie.\n"
+    "\n"
+    "TITLE: \n"
+    "Żółw\n"
+    "Żółw idzie powoli.\n"
+    "\n"
+    "TITLE: \n"
+    "Pies\n"
+    "Pies szczeka.\n"
+    "\n"
+)
+DOCUMENTS = [
+    Document("Kot", "Kot siedzi na płocie."),
+    Document("Żółw", "Żółw idzie powoli."),
+    Document("Pies", "Pies szczeka."),
+]
+
+
+@pytest.fixture
+def corpus_path(tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_text(CORPUS)
+    return path
+
+
+def test_read_documents(corpus_path):
+    documents = list(read_documents(corpus_path))
+    assert documents == DOCUMENTS
+    assert sum(document.nbytes for document in documents) == len(CORPUS.encode())
+
+
+def test_read_documents_gzip(tmp_path):
+    path = tmp_path / "corpus.txt.gz"
+    with gzip.open(path, "wt") as f:
+        f.write(CORPUS)
+    assert list(read_documents(path)) == DOCUMENTS
+
+
+def test_read_documents_without_ending_line(tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_text(CORPUS + "TITLE: \nNiedokończony\nTreść\n")
+    assert list(read_documents(path)) == DOCUMENTS
+
+
+def test_read_document_at(corpus_path):
+    buffer = map_corpus(corpus_path)
+    for document in read_documents(corpus_path):
+        assert read_document_at(buffer, document.offset) == document
+
+
+def test_source_documents(corpus_path):
+    documents = SourceDocuments(corpus_path)
+    for document in read_documents(corpus_path):
+        documents.append(document)
+    assert len(documents) == len(DOCUMENTS)
+    assert [documents[idx] for idx in range(len(documents))] == DOCUMENTS
+
+
+@pytest.mark.parametrize(
+    "index_cls, disk_index_cls",
+    [(Index, DiskIndex), (PositionIndex, DiskPositionIndex)],
+)
+def test_source_backed_index(tmp_path, corpus_path, index_cls, disk_index_cls):
+    index = index_cls(lemmatize, corpus_path)
+    index.extend(read_documents(corpus_path))
+    index.save(tmp_path / "index")
+
+    disk_index = disk_index_cls(lemmatize, tmp_path / "index")
+    docs = disk_index.search("żółw idzie")
+    assert docs == [DOCUMENTS[1]]
+    assert docs[0].id == 1
+
+
+def test_source_backed_index_from_relative_path(tmp_path, corpus_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    index = Index(lemmatize, corpus_path.relative_to(tmp_path))
+    index.extend(read_documents(corpus_path))
+    index.save(tmp_path / "index")
+
+    (tmp_path / "elsewhere").mkdir()
+    monkeypatch.chdir(tmp_path / "elsewhere")
+    assert DiskIndex(lemmatize, tmp_path / "index").search("pies") == [DOCUMENTS[2]]
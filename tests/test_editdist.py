@@ -0,0 +1,39 @@
+import random
+
+import pytest
+
+from textmining.editdist import Matcher, is_close, scaled_editdist
+
+
+def random_words(rng, n):
+    return ["".join(rng.choices("abkotą", k=rng.randint(1, 8))) for _ in range(n)]
+
+
+@pytest.mark.parametrize("strict", [False, True])
+def test_is_close_matches_scaled_editdist(strict):
+    rng = random.Random(0)
+    words = random_words(rng, 60)
+    for word in words:
+        for target in words:
+            ratio = scaled_editdist(word, target)
+            expected = ratio < 0.5 if strict else ratio <= 0.5
+            assert is_close(word, target, strict=strict) == expected, (word, target)
+
+
+def test_is_close():
+    assert is_close("Kot", "kot")
+    assert is_close("kota", "kot")
+    assert not is_close("kotka", "kot")
+    assert is_close("ab", "abcd")
+    assert not is_close("ab", "abcd", strict=True)
+    assert is_close("kotka", "kot", ratio=1.0)
+
+
+def test_matcher():
+    matcher = Matcher(["Kot", "pies", "x"])
+    assert matcher.matches("kota") == [True, False, False]
+    assert matcher.matches("piesa") == [False, True, False]
+    assert matcher.matches("x") == [False, False, True]
+    assert matcher.matches_any("piesków") is False
+    assert matcher.matches_any("PIES") is True
+    assert Matcher([]).matches_any("kot") is False
@@ -0,0 +1,138 @@
+import pytest
+from helpers import DOCUMENTS, lemmatize
+
+from textmining.incremental import IncrementalIndex
+from textmining.index import Document, Index, PositionIndex
+from textmining.search import SearchEngine
+
+DOCUMENTS = DOCUMENTS + [Document("Las", "W lesie pies szuka kota.")]
+
+QUERIES = ["kot", "pies kota", "na", "płot", "żyrafa", "pies"]
+
+
+def titles(index, query):
+    return sorted(doc.title for doc in index.search(query))
+
+
+@pytest.mark.parametrize("position", [False, True])
+def test_search_matches_index(tmp_path, position):
+    index = IncrementalIndex(lemmatize, tmp_path, position, buffer_size=2)
+    index.extend(DOCUMENTS)
+    assert len(index.segments) == 2
+    reference = (PositionIndex if position else Index)(lemmatize)
+    reference.extend(DOCUMENTS)
+    for query in QUERIES:
+        assert titles(index, query) == sorted(
+            DOCUMENTS[doc_idx].title
+            for doc_idx in reference._get_docs_idxs(query.lower())
+        )
+        if position:
+            assert sorted(
+                index.load_doc(doc_idx).title
+                for doc_idx in index._get_near_docs_idxs(query, 3, False)
+            ) == sorted(
+                DOCUMENTS[doc_idx].title
+                for doc_idx in reference._get_near_docs_idxs(query, 3, False)
+            )
+
+
+def test_segments_share_caches(tmp_path):
+    index = IncrementalIndex(lemmatize, tmp_path, buffer_size=2)
+    index.extend(DOCUMENTS)
+    assert len(index.segments) == 2
+    for segment in index.segments:
+        assert segment.postings_cache.cache is index.postings_cache
+        assert segment.results_cache.cache is index.results_cache
+
+    assert titles(index, "pies kota") == ["Las", "Pies"]
+    assert titles(index, "kot psa") == ["Las", "Pies"]
+    stats = index.cache_stats()
+    assert (stats["results"].hits, stats["results"].misses) == (2, 2)
+
+
+def test_delete_update_and_reopen(tmp_path):
+    index = IncrementalIndex(lemmatize, tmp_path, buffer_size=2)
+    index.extend(DOCUMENTS)
+    assert index.delete("Pies") == 1
+    assert index.delete("Las") == 1
+    assert index.delete("Żyrafa") == 0
+    assert titles(index, "pies") == ["Droga"]
+    assert index.update(Document("Kot", "Kot śpi w domu.")) == 1
+    assert titles(index, "kot") == ["Kot"]
+    assert len(index) == 3
+
+    index.flush(merge=False)
+    reopened = IncrementalIndex(lemmatize, tmp_path)
+    assert len(reopened) == 3
+    assert titles(reopened, "kot") == ["Kot"]
+    assert reopened.load_doc(reopened.find("Kot")[0]).content == "Kot śpi w domu."
+
+
+def test_merge(tmp_path):
+    index = IncrementalIndex(lemmatize, tmp_path, buffer_size=1, merge_factor=100)
+    index.extend(DOCUMENTS)
+    index.delete("Pies")
+    index.flush()
+    old_names = list(index.names)
+    index.merge()
+    assert len(index.segments) == 1
+    assert len(index.segments[0].segment) == len(DOCUMENTS) - 1
+    assert not any((tmp_path / name).exists() for name in old_names)
+    assert titles(index, "pies") == ["Droga", "Las"]
+    assert titles(IncrementalIndex(lemmatize, tmp_path), "kot") == ["Kot", "Las"]
+
+
+def test_merge_policy(tmp_path):
+    index = IncrementalIndex(lemmatize, tmp_path, buffer_size=1, merge_factor=2)
+    index.extend(DOCUMENTS)
+    assert len(index.segments) <= 2
+    assert len(index) == len(DOCUMENTS)
+    for query in QUERIES:
+        assert len(index.search(query)) == len(set(titles(index, query)))
+
+    index.delete("Kot")
+    index.delete("Pies")
+    index.delete("Droga")
+    index.flush()
+    assert all(
+        2 * len(deleted) <= len(segment.segment)
+        for segment, deleted in zip(index.segments, index.deleted)
+    )
+    assert titles(index, "pies") == ["Las"]
+
+
+@pytest.mark.parametrize("buffer_size", [1, 2, 4, 10])
+def test_top_k_collection_statistics(tmp_path, buffer_size):
+    index = IncrementalIndex(lemmatize, tmp_path, buffer_size=buffer_size)
+    index.extend(DOCUMENTS)
+    index.delete("Droga")
+    reference = Index(lemmatize)
+    reference.extend(DOCUMENTS)
+    for query in ["kot", "pies kot", "płot las droga", "na"]:
+        target = [entry for entry in reference.top_k(query, 10) if entry[0] != 3]
+        ranking = index.top_k(query, 10)
+        assert [doc_idx for doc_idx, _ in ranking] == [doc_idx for doc_idx, _ in target]
+        assert [score for _, score in ranking] == pytest.approx(
+            [score for _, score in target]
+        )
+        assert index.top_k(query, 2) == ranking[:2]
+
+
+def test_top_k_and_engine(tmp_path):
+    index = IncrementalIndex(lemmatize, tmp_path, buffer_size=2)
+    index.extend(DOCUMENTS)
+    index.delete("Pies")
+    ranking = index.top_k("pies kot", 10)
+    ranked_titles = {index.load_doc(doc_idx).title for doc_idx, _ in ranking}
+    assert ranked_titles == {"Kot", "Droga", "Las"}
+    assert [score for _, score in ranking] == sorted(
+        (score for _, score in ranking), reverse=True
+    )
+    assert len(index.top_k("pies kot", 1)) == 1
+
+    engine = SearchEngine(index)
+    assert {doc.title for doc in engine.search("kot", color=False)} == {"Kot", "Las"}
+    assert {doc.title for doc in engine.search_ranked("kot", color=False)} == {
+        "Kot",
+        "Las",
+    }
@@ -0,0 +1,175 @@
+from itertools import product
+
+import pytest
+from helpers import DOCUMENTS, build, lemmatize
+
+from textmining.array_index import ArrayIndex, ArrayPositionIndex
+from textmining.index import (
+    DiskIndex,
+    DiskPositionIndex,
+    Document,
+    Index,
+    PositionIndex,
+    build_parallel,
+)
+from textmining.tokenization import tokenize
+
+
+@pytest.mark.parametrize(
+    "query, target",
+    [
+        ("kot", {0, 1}),
+        ("pies kota", {1}),
+        ("na", {0, 1}),
+        ("żyrafa", set()),
+        ("", set()),
+    ],
+)
+def test_index_search(query, target):
+    assert build(Index).search(query) == target
+
+
+@pytest.mark.parametrize(
+    "query, target",
+    [("na płocie", [0]), ("kot", [0, 1]), ("kot pies", []), ("płot stoi", [2])],
+)
+def test_position_index_search(query, target):
+    index = build(PositionIndex)
+    assert index.search(query) == [DOCUMENTS[doc_idx] for doc_idx in target]
+
+
+@pytest.mark.parametrize("query", ["kot", "pies na", "płot", "na", "żyrafa", ""])
+def test_disk_index(tmp_path, query):
+    index = build(Index)
+    index.save(tmp_path)
+    disk_index = DiskIndex(lemmatize, tmp_path)
+
+    docs = disk_index.search(query)
+    assert [doc.id for doc in docs] == sorted(index.search(query))
+    for doc in docs:
+        assert doc.title == DOCUMENTS[doc.id].title
+        assert doc.content == DOCUMENTS[doc.id].content
+
+
+@pytest.mark.parametrize("query", ["kot", "na płocie", "pies szczeka", "płot na", ""])
+def test_disk_position_index(tmp_path, query):
+    index = build(PositionIndex)
+    index.save(tmp_path)
+    disk_index = DiskPositionIndex(lemmatize, tmp_path)
+
+    assert disk_index.search(query) == index.search(query)
+
+
+@pytest.mark.parametrize("query", ["kot", "pies kota", "na", "żyrafa", ""])
+def test_array_index(query):
+    index = build(Index)
+    array_index = ArrayIndex.from_index(index)
+
+    docs = array_index.search(query)
+    assert [doc.id for doc in docs] == sorted(index.search(query))
+
+
+@pytest.mark.parametrize("query", ["kot", "na płocie", "kot pies", "płot stoi", ""])
+def test_array_position_index(query):
+    index = build(PositionIndex)
+    array_index = ArrayPositionIndex.from_index(index)
+
+    assert array_index.search(query) == index.search(query)
+
+
+@pytest.mark.parametrize("position", [False, True])
+def test_build_parallel(tmp_path, position):
+    build_parallel(DOCUMENTS, tmp_path / "index", lemmatize, position, 2, 1)
+    if position:
+        index = build(PositionIndex)
+        disk_index = DiskPositionIndex(lemmatize, tmp_path / "index")
+        queries = ["kot", "na płocie", "pies biega", "kot pies"]
+    else:
+        index = build(Index)
+        disk_index = DiskIndex(lemmatize, tmp_path / "index")
+        queries = ["kot", "pies na", "droga", "żyrafa"]
+
+    for query in queries:
+        docs = disk_index.search(query)
+        assert [doc.id for doc in docs] == sorted(index._get_docs_idxs(query))
+        assert [doc.title for doc in docs] == [DOCUMENTS[doc.id].title for doc in docs]
+
+
+def test_disk_index_caches(tmp_path):
+    build(Index).save(tmp_path)
+    disk_index = DiskIndex(lemmatize, tmp_path)
+
+    first = disk_index.search("pies kota")
+    assert disk_index.search("kot psa") == first
+    stats = disk_index.cache_stats()
+    assert stats["results"].hits == 1
+    # Results are kept as arrays of 4-byte document indices.
+    assert stats["results"].size == 4 * len(first)
+    assert stats["postings"].misses == 2
+    assert disk_index.top_k("kot", 2) == disk_index.top_k("kota", 2)
+    assert disk_index.cache_stats()["results"].hits == 2
+
+
+def test_disk_position_index_caches(tmp_path):
+    index = build(PositionIndex)
+    index.save(tmp_path)
+    disk_index = DiskPositionIndex(lemmatize, tmp_path, results_cache_size=0)
+
+    assert disk_index.search("na płocie") == index.search("na płocie")
+    assert disk_index.search("na płocie") == index.search("na płocie")
+    stats = disk_index.cache_stats()
+    assert stats["results"].hits == 0
+    assert stats["postings"].hits == 2
+
+
+def brute_near(query, k, ordered):
+    tokens_lemmas = [set(lemmatize(token)) for token in tokenize(query.lower())]
+    docs_idxs = set()
+    for doc_idx, document in enumerate(DOCUMENTS):
+        words = tokenize(document.title.lower()) + tokenize(document.content.lower())
+        words_lemmas = [set(lemmatize(word)) for word in words]
+        tokens_positions = [
+            [position for position, lemmas in enumerate(words_lemmas) if lemmas & token]
+            for token in tokens_lemmas
+        ]
+        for positions in product(*tokens_positions):
+            if ordered and any(a >= b for a, b in zip(positions, positions[1:])):
+                continue
+            if len(set(positions)) < len(positions):
+                continue
+            if positions and max(positions) - min(positions) - len(positions) < k:
+                docs_idxs.add(doc_idx)
+    return docs_idxs
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+@pytest.mark.parametrize("k", [0, 1, 3, 10])
+def test_near(tmp_path, k, ordered):
+    index = build(PositionIndex)
+    index.save(tmp_path)
+    disk_index = DiskPositionIndex(lemmatize, tmp_path)
+    array_index = ArrayPositionIndex.from_index(index)
+    queries = ["kot płocie", "płocie kot", "kot pies", "pies kota", "pies biega"]
+    queries += ["droga pies lasu", "na kota", "żyrafa kot", "kot", ""]
+    queries += ["kot kot", "kota kot", "pies pies"]
+    for query in queries:
+        target = brute_near(query, k, ordered)
+        assert index._get_near_docs_idxs(query, k, ordered) == target, query
+        assert disk_index._get_near_docs_idxs(query, k, ordered) == target, query
+        assert array_index._get_near_docs_idxs(query, k, ordered) == target, query
+        # Phrases read global positions of the same terms from the shared cache.
+        assert disk_index._get_docs_idxs(query) == index._get_docs_idxs(query)
+    assert [doc.id for doc in disk_index.search_near("pies kot", 3)] == [1]
+    assert disk_index.search_near("kot pies", 3, ordered=True) == []
+
+
+def test_near_shared_positions():
+    index = PositionIndex(
+        lambda word: {"zamek": ["zamek", "zamknąć"]}.get(word, [word])
+    )
+    index.add(Document("Brama", "zamek"))
+    index.add(Document("Zamek", "zamek stary"))
+    for ordered in [False, True]:
+        assert index._get_near_docs_idxs("zamek zamknąć", 0, ordered) == {1}
+        assert index._get_near_docs_idxs("zamek zamek", 0, ordered) == {1}
+        assert index._get_near_docs_idxs("zamek zamek zamek", 1, ordered) == set()
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+from helpers import lemmatize, save
+
+from textmining import instrument
+from textmining.corpus import read_documents
+from textmining.index import DiskIndex, Index
+from textmining.search import SearchEngine
+
+
+@pytest.fixture
+def enabled():
+    instrument.reset()
+    instrument.enable(trace=True)
+    yield
+    instrument.disable()
+    instrument.reset()
+
+
+def test_disabled_records_nothing():
+    instrument.reset()
+
+    @instrument.timed("decorated")
+    def double(x):
+        return 2 * x
+
+    with instrument.timer("block"):
+        assert double(2) == 4
+    instrument.count("block", "items", 3)
+    assert instrument.stats() == {}
+
+
+def test_timers_and_counters(enabled, tmp_path):
+    @instrument.timed("decorated")
+    def double(x):
+        return 2 * x
+
+    with instrument.timer("block"):
+        assert double(2) == 4
+        assert double(3) == 6
+    instrument.count("block", "items", 3)
+    instrument.count("block", "items")
+
+    stats = instrument.stats()
+    assert stats["decorated"]["calls"] == 2
+    assert stats["block"]["calls"] == 1
+    assert stats["block"]["items"] == 4
+    assert stats["block"]["seconds"] >= stats["decorated"]["seconds"]
+    assert "items=4" in instrument.summary()
+
+    instrument.write_trace(tmp_path / "trace.json")
+    with (tmp_path / "trace.json").open() as f:
+        trace = json.load(f)
+    assert [event["name"] for event in trace["traceEvents"]] == [
+        "decorated",
+        "decorated",
+        "block",
+    ]
+    assert trace["stages"]["block"]["items"] == 4
+
+
+def test_search_stages(enabled, tmp_path):
+    engine = SearchEngine(save(tmp_path / "index"))
+
+    engine.search("kot", color=True)
+    engine.search("kot", color=False)
+    stats = instrument.stats()
+    assert stats["index.search"]["calls"] == 2
+    assert stats["engine.rank"]["calls"] == 2
+    assert stats["engine.highlight"]["calls"] == 2
+    assert stats["index.load_doc"]["calls"] == 4
+    assert stats["results_cache"] == {
+        "calls": 0,
+        "seconds": 0.0,
+        "misses": 1,
+        "hits": 1,
+    }
+    assert stats["postings_cache"]["misses"] == 1
+    assert stats["segment.postings"]["bytes"] > 0
+    assert stats["segment.documents"]["bytes"] > 0
+
+
+def test_source_documents_bytes(enabled, tmp_path):
+    path = tmp_path / "corpus.txt"
+    path.write_text("TITLE: \nKot\nKot siedzi na płocie.\n\n")
+    index = Index(lemmatize, path)
+    index.extend(read_documents(path))
+    index.save(tmp_path / "index", progress=False)
+
+    DiskIndex(lemmatize, tmp_path / "index").load_doc(0)
+    assert instrument.stats()["segment.documents"]["bytes"] == path.stat().st_size
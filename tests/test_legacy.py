@@ -0,0 +1,57 @@
+import json
+import pickle
+
+import pytest
+from helpers import build, lemmatize
+
+from textmining.index import DiskIndex, DiskPositionIndex, Index, PositionIndex
+from textmining.legacy import convert_legacy, get_hash
+
+
+def save_legacy(index, dir, beginnings=None):
+    (dir / "index").mkdir(parents=True)
+    (dir / "docs").mkdir()
+    for lemma, postings in index.inverse_mapping.items():
+        with (dir / "index" / f"{get_hash(lemma)}.pickle").open("wb") as f:
+            pickle.dump(list(postings), f)
+    for doc_idx, document in enumerate(index.documents):
+        with (dir / "docs" / f"{doc_idx}.json").open("wt") as f:
+            json.dump({"title": document.title, "content": document.content}, f)
+    if beginnings is not None:
+        with (dir / "beginings.pickle").open("wb") as f:
+            pickle.dump(beginnings, f)
+
+
+def test_convert_legacy(tmp_path):
+    index = build(Index)
+    save_legacy(index, tmp_path / "legacy")
+    assert convert_legacy(tmp_path / "legacy", tmp_path / "converted", lemmatize) == (
+        len(index.inverse_mapping),
+        len(index.documents),
+    )
+    disk_index = DiskIndex(lemmatize, tmp_path / "converted")
+
+    for query in ["kot", "pies na", "droga"]:
+        assert [doc.id for doc in disk_index.search(query)] == sorted(
+            index.search(query)
+        )
+    assert disk_index.top_k("pies kot", 2) == index.top_k("pies kot", 2)
+
+
+def test_convert_legacy_position(tmp_path):
+    index = build(PositionIndex)
+    save_legacy(index, tmp_path / "legacy", index.beginnings)
+    convert_legacy(tmp_path / "legacy", tmp_path / "converted", lemmatize)
+    disk_index = DiskPositionIndex(lemmatize, tmp_path / "converted")
+
+    assert list(disk_index.beginnings) == index.beginnings
+    for query in ["kot", "na płocie", "pies biega"]:
+        assert disk_index.search(query) == index.search(query)
+
+
+def test_convert_legacy_other_lemmatizer(tmp_path):
+    save_legacy(build(Index), tmp_path / "legacy")
+    with pytest.raises(ValueError):
+        convert_legacy(
+            tmp_path / "legacy", tmp_path / "converted", lambda word: (word,)
+        )
@@ -0,0 +1,86 @@
+import pytest
+
+from textmining.lemmatization import (
+    CompactLemmasDict,
+    Lemmas,
+    create_compact,
+    create_dict,
+)
+
+WORDS_TO_LEMMAS = {
+    "kota": ["kot"],
+    "koty": ["kot"],
+    "psa": ["pies"],
+    "żółwie": ["żółw"],
+    "mam": ["mieć", "mama"],
+    "a": ["a"],
+}
+
+
+@pytest.fixture
+def lemmas(tmp_path):
+    Lemmas(WORDS_TO_LEMMAS).save(tmp_path / "lemmas.bin")
+    return Lemmas.from_file(tmp_path / "lemmas.bin")
+
+
+@pytest.mark.parametrize(
+    "word, target",
+    [(word, lemmas) for word, lemmas in WORDS_TO_LEMMAS.items()]
+    + [("żyrafa", ["żyrafa"]), ("", [""]), ("kot", ["kot"]), ("ą", ["ą"])],
+)
+def test_compact_lemmatize(lemmas, word, target):
+    assert lemmas.lemmatize(word) == tuple(target)
+
+
+def test_lemmatize_cache():
+    lemmas = Lemmas(WORDS_TO_LEMMAS, cache_size=2)
+    for word in ["kota", "kota", "psa", "mam", "kota"]:
+        lemmas.lemmatize(word)
+    stats = lemmas.cache_stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.size) == (1, 4, 2, 2)
+
+
+def test_compact_items(tmp_path, lemmas):
+    assert dict(lemmas._words_to_lemmas.items()) == WORDS_TO_LEMMAS
+
+
+def test_compact_roundtrip(tmp_path, lemmas):
+    lemmas.save(tmp_path / "lemmas.pickle")
+    assert Lemmas.from_file(tmp_path / "lemmas.pickle")._words_to_lemmas == (
+        WORDS_TO_LEMMAS
+    )
+
+
+def test_compact_bad_file(tmp_path):
+    (tmp_path / "lemmas.bin").write_bytes(b"x" * 32)
+    with pytest.raises(ValueError):
+        CompactLemmasDict(tmp_path / "lemmas.bin")
+
+
+POLIMORFIK = """\
+kot;kot;subst:sg:nom:m2
+kot;kota;subst:sg:gen:m2
+kot;kota;subst:sg:acc:m2
+Kraków;Krakowa;subst:sg:gen:m3
+mieć;mam;verb:fin:sg:pri
+mama;mam;subst:pl:gen:f
+nan;nan;subst:sg:nom:m3
+"""
+
+
+def test_create_dict(tmp_path):
+    (tmp_path / "polimorfik.txt").write_text(POLIMORFIK)
+    assert create_dict(tmp_path / "polimorfik.txt") == {
+        "kot": ["kot"],
+        "kota": ["kot"],
+        "krakowa": ["kraków"],
+        "mam": ["mieć", "mama"],
+        "nan": ["nan"],
+    }
+
+
+def test_create_compact(tmp_path):
+    (tmp_path / "polimorfik.txt").write_text(POLIMORFIK)
+    create_compact(tmp_path / "polimorfik.txt", tmp_path / "lemmas.bin")
+    compact = CompactLemmasDict(tmp_path / "lemmas.bin")
+    assert dict(compact.items()) == create_dict(tmp_path / "polimorfik.txt")
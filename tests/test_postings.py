@@ -0,0 +1,151 @@
+import random
+
+import pytest
+
+from textmining.cache import LRUCache
+from textmining.postings import (
+    BLOCK_SIZE,
+    CachedPostingsList,
+    FrequenciesList,
+    PositionsCursor,
+    PositionsList,
+    PostingsFrequenciesCursor,
+    PostingsList,
+    SequenceCursor,
+    UnionCursor,
+    UnionPositionsCursor,
+    encode,
+    encode_frequencies,
+    encode_positions,
+    group_positions,
+    intersect,
+)
+
+
+def random_postings(rng, n, high):
+    return sorted(rng.sample(range(high), n))
+
+
+@pytest.mark.parametrize("n", [0, 1, BLOCK_SIZE - 1, BLOCK_SIZE, 5 * BLOCK_SIZE + 3])
+def test_roundtrip(n):
+    postings = random_postings(random.Random(n), n, 100 * n + 1)
+    postings_list = PostingsList(encode(postings))
+    assert len(postings_list) == n
+    assert list(postings_list) == postings
+
+
+def test_compression():
+    postings = list(range(0, 10_000, 3))
+    assert len(encode(postings)) < 4 * len(postings) / 3
+
+
+def test_next_geq():
+    rng = random.Random(0)
+    postings = random_postings(rng, 1000, 100_000)
+    cursor = PostingsList(encode(postings)).cursor()
+    for target in sorted(rng.sample(range(110_000), 200)):
+        expected = next((value for value in postings if value >= target), None)
+        assert cursor.next_geq(target) == expected
+
+
+def test_cached_postings_decode_reached_blocks():
+    postings = list(range(0, 30 * BLOCK_SIZE, 3))
+    cache = LRUCache(2**20)
+    cursor = CachedPostingsList(PostingsList(encode(postings)), cache, "a").cursor()
+    assert cursor.next_geq(0) == 0
+    assert cursor.next_geq(9 * BLOCK_SIZE + 1) == 9 * BLOCK_SIZE + 3
+    assert len(cache) == 2
+
+    cached = CachedPostingsList(PostingsList(encode(postings)), cache, "a")
+    assert list(cached) == postings
+    assert cache.stats().hits == 2
+    assert len(cache) == 10
+
+
+def test_intersect():
+    rng = random.Random(1)
+    lists = [random_postings(rng, n, 5000) for n in [2000, 700, 3000]]
+    cursors = [PostingsList(encode(values)).cursor() for values in lists]
+    assert list(intersect(cursors)) == sorted(set.intersection(*map(set, lists)))
+
+
+def test_intersect_shifted():
+    first = [1, 5, 10, 20, 33]
+    second = [2, 7, 11, 21, 40]
+    cursors = [SequenceCursor(first), PostingsList(encode(second)).cursor()]
+    assert list(intersect(cursors, [0, 1])) == [1, 10, 20]
+
+
+def test_union_cursor():
+    cursor = UnionCursor([SequenceCursor([1, 8]), SequenceCursor([3, 4, 9])])
+    assert [cursor.next_geq(t) for t in [0, 2, 4, 5, 9, 10]] == [1, 3, 4, 8, 9, None]
+
+
+def test_sequence_cursor_galloping():
+    rng = random.Random(2)
+    postings = random_postings(rng, 3000, 50_000)
+    cursor = SequenceCursor(postings)
+    for target in sorted(rng.sample(range(60_000), 300)):
+        expected = next((value for value in postings if value >= target), None)
+        assert cursor.next_geq(target) == expected
+
+
+@pytest.mark.parametrize("n", [0, 1, BLOCK_SIZE, 3 * BLOCK_SIZE + 7])
+def test_frequencies_cursor(n):
+    rng = random.Random(n)
+    postings = random_postings(rng, n, 10 * n + 1)
+    frequencies = [rng.randint(1, 300) for _ in range(n)]
+    assert list(FrequenciesList(encode_frequencies(frequencies))) == frequencies
+
+    cursor = PostingsFrequenciesCursor(
+        PostingsList(encode(postings)),
+        FrequenciesList(encode_frequencies(frequencies)),
+    )
+    for idx in range(0, n, 7):
+        assert cursor.next_geq(postings[idx]) == postings[idx]
+        assert cursor.frequency() == frequencies[idx]
+
+
+def test_group_positions():
+    beginnings = [0, 4, 5, 9]
+    assert group_positions([1, 2, 4, 9, 12], beginnings) == (
+        [0, 1, 3],
+        [[1, 2], [0], [0, 3]],
+    )
+    assert group_positions([], beginnings) == ([], [])
+
+
+@pytest.mark.parametrize("n", [0, 1, BLOCK_SIZE, 3 * BLOCK_SIZE + 7])
+def test_positions_cursor(n):
+    rng = random.Random(n)
+    docs = random_postings(rng, n, 10 * n + 1)
+    docs_positions = [random_postings(rng, rng.randint(1, 20), 1000) for _ in range(n)]
+    positions = PositionsList(encode_positions(docs_positions))
+    assert len(positions) == n
+    assert list(positions) == docs_positions
+    for idx in rng.sample(range(n), min(n, 50)):
+        assert positions[idx] == docs_positions[idx]
+
+    for postings in [docs, PostingsList(encode(docs))]:
+        cursor = PositionsCursor(
+            postings, PositionsList(encode_positions(docs_positions))
+        )
+        for idx in range(0, n, 7):
+            assert cursor.next_geq(docs[idx]) == docs[idx]
+            assert cursor.positions() == docs_positions[idx]
+
+
+def test_union_positions_cursor():
+    cursor = UnionPositionsCursor(
+        [
+            PositionsCursor([1, 3], [[5], [0, 2]]),
+            PositionsCursor([3, 4], [[1, 2], [7]]),
+        ]
+    )
+    assert cursor.next_geq(0) == 1
+    assert cursor.positions() == [5]
+    assert cursor.next_geq(2) == 3
+    assert cursor.positions() == [0, 1, 2]
+    assert cursor.next_geq(4) == 4
+    assert cursor.positions() == [7]
+    assert cursor.next_geq(5) is None
@@ -0,0 +1,116 @@
+from itertools import product
+
+import pytest
+
+from textmining.proverbs import ProverbsHandler, QuestionAnswerer
+
+PROVERBS = """Gdzie kucharek sześć, tam nie ma co jeść.
+Kto rano wstaje, temu Pan Bóg daje.
+Nie chwal dnia przed zachodem słońca.
+"""
+
+
+class Lemmas:
+    def lemmatize(self, word: str):
+        return {"dokończ": ("dokończyć",), "kucharek": ("kucharka",)}.get(word, (word,))
+
+
+class CountingAnswerer(QuestionAnswerer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    def load(self):
+        pass
+
+    def _answer_batch(self, pairs):
+        self.batches.append(pairs)
+        return [
+            None if "kto" in question else context[:3] for question, context in pairs
+        ]
+
+
+@pytest.fixture
+def handler(tmp_path):
+    path = tmp_path / "proverbs.txt"
+    path.write_text(PROVERBS)
+    return ProverbsHandler(Lemmas(), path, CountingAnswerer(batch_size=2))
+
+
+def test_complete_proverb(handler):
+    question = "Dokończ przysłowie: „Kto rano wstaje...”"
+    assert handler.complete_proverb(question) == "temu pan bóg daje"
+    assert handler.complete_proverb("Ile jest kucharek?") is None
+
+
+@pytest.mark.parametrize(
+    "question, target",
+    [
+        ("Dokończ: „Nie chwal dnia…”", "przed zachodem słońca"),
+        ("Dokończ: „Gdzie kucharek sześć, tam...”", "nie ma co jeść"),
+        ("Dokończ: „Kto rano (wstaje...”", "temu pan bóg daje"),
+        ("Dokończ: „[...”", None),
+    ],
+)
+def test_complete_proverb_prefix(handler, question, target):
+    assert handler.complete_proverb(question) == target
+
+
+def test_find_proverb(handler):
+    assert handler.find_proverb("gdzie kucharek") == handler.lines[0]
+    assert handler.find_proverb("nie chwal dnia przed zachodem słońca.") == (
+        handler.lines[2]
+    )
+    assert handler.find_proverb("nie ma") is None
+
+
+def test_batched_answers_are_cached(handler):
+    questions = ["Ile kucharek?", "Kto wstaje?", "Ile kucharek?", "Co przed zachodem?"]
+    answers = handler.handle_proverb_questions(questions)
+
+    assert answers[1] is None
+    assert answers[0] == answers[2] is not None
+    assert [len(batch) for batch in handler.answerer.batches] == [2, 1]
+
+    assert handler.handle_proverb_questions(questions) == answers
+    assert len(handler.answerer.batches) == 2
+    assert handler.answerer.cache_stats().hits == 4
+
+
+def test_completed_batch(handler):
+    questions = ["Dokończ przysłowie: „Kto rano wstaje...”", "Dokończ: „Nie chwal…”"]
+    answers = handler.handle_proverb_questions(questions)
+
+    assert answers == ["temu pan bóg daje", "dnia przed zachodem słońca"]
+    assert handler.handle_proverb_question(questions[0]) == answers[0]
+    assert handler.answerer.batches == []
+    assert handler.get_most_similar_proverbs_batch([]) == []
+
+
+@pytest.mark.parametrize("k", [1, 2, 3])
+def test_most_similar_proverbs(handler, k):
+    questions = ["ile kucharek nie ma", "kto daje", "żyrafa"]
+    batch = handler.get_most_similar_proverbs_batch(questions, k)
+
+    for question, proverbs in zip(questions, batch):
+        terms = handler.TFIDF_VECTORIZER.transform([question]).nonzero()[1]
+        scores = handler.PROVERBS_TFIDF[:, terms].sum(1).A1
+        target = sorted(
+            (idx for idx, score in enumerate(scores) if score > 0),
+            key=lambda idx: (-scores[idx], idx),
+        )[:k]
+        assert proverbs == [handler.lines[idx] for idx in target]
+        assert proverbs == handler.get_most_similar_proverbs(question, k)
+
+
+def test_most_similar_proverbs_ties(tmp_path):
+    names = ["".join(letters) for letters in product("abcdefghij", repeat=3)]
+    path = tmp_path / "proverbs.txt"
+    path.write_text(PROVERBS + "".join(f"Kot {name}.\n" for name in names[:300]))
+    handler = ProverbsHandler(Lemmas(), path, CountingAnswerer())
+
+    assert handler.get_most_similar_proverbs("kot", 3) == [
+        "kot aaa.",
+        "kot aab.",
+        "kot aac.",
+    ]
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+from helpers import DOCUMENTS, build, lemmatize
+
+from textmining.array_index import ArrayIndex
+from textmining.index import DiskIndex, Document, Index, build_parallel
+from textmining.postings import SequenceFrequenciesCursor
+from textmining.ranking import BM25, TITLE_BOOST, ScoredTerm, top_k
+
+DOCUMENTS = DOCUMENTS + [Document("Las", "W lesie nie ma kota ani psa.")]
+
+
+def exhaustive(inverse_mapping, frequencies, lengths, lemmas, k):
+    bm25 = BM25.from_lengths(lengths)
+    scores = {}
+    for lemma in lemmas:
+        postings = inverse_mapping.get(lemma, ())
+        idf = bm25.idf(len(postings))
+        for doc_idx, frequency in zip(postings, frequencies.get(lemma, ())):
+            score = bm25.score(frequency, lengths[doc_idx], idf)
+            scores[doc_idx] = scores.get(doc_idx, 0.0) + score
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return build(Index, DOCUMENTS)
+
+
+def test_frequencies(index):
+    assert list(index.inverse_mapping["kot"]) == [0, 1, 4]
+    assert list(index.frequencies["kot"]) == [TITLE_BOOST + 1, 2, 1]
+    assert index.lengths[0] == TITLE_BOOST + 4
+
+
+@pytest.mark.parametrize("query", ["kot", "kot pies", "płot las droga", "żyrafa"])
+@pytest.mark.parametrize("k", [1, 2, 10])
+def test_disk_top_k(tmp_path, index, query, k):
+    index.save(tmp_path, progress=False)
+    disk_index = DiskIndex(lemmatize, tmp_path)
+    lemmas = {lemma for token in query.split() for lemma in lemmatize(token)}
+
+    ranking = disk_index.top_k(query, k)
+    target = exhaustive(
+        index.inverse_mapping, index.frequencies, index.lengths, lemmas, k
+    )
+    assert [doc_idx for doc_idx, _ in ranking] == [doc_idx for doc_idx, _ in target]
+    assert [score for _, score in ranking] == pytest.approx(
+        [score for _, score in target]
+    )
+
+
+def test_merged_top_k(tmp_path, index):
+    build_parallel(DOCUMENTS, tmp_path / "index", lemmatize, False, 2, 2)
+    merged = DiskIndex(lemmatize, tmp_path / "index")
+    index.save(tmp_path / "sequential", progress=False)
+    sequential = DiskIndex(lemmatize, tmp_path / "sequential")
+
+    assert list(merged.segment.bounds) == list(sequential.segment.bounds)
+    for query in ["kot", "pies las", "na płocie"]:
+        assert merged.top_k(query, 3) == sequential.top_k(query, 3)
+
+
+@pytest.mark.parametrize("k", [1, 5, 20])
+def test_wand_random(k):
+    rng = random.Random(k)
+    n_documents = 2000
+    lengths = [rng.randint(1, 50) for _ in range(n_documents)]
+    bm25 = BM25.from_lengths(lengths)
+    inverse_mapping = {}
+    frequencies = {}
+    for term, df in enumerate([5, 40, 300, 1500]):
+        inverse_mapping[term] = sorted(rng.sample(range(n_documents), df))
+        frequencies[term] = [rng.randint(1, 5) for _ in range(df)]
+
+    terms = []
+    for term, postings in inverse_mapping.items():
+        bound = bm25.upper_bound(postings, frequencies[term], lengths)
+        cursor = SequenceFrequenciesCursor(postings, frequencies[term])
+        terms.append(ScoredTerm(cursor, bm25.idf(len(postings)), bound))
+
+    ranking = top_k(terms, k, bm25, lengths)
+    target = exhaustive(inverse_mapping, frequencies, lengths, inverse_mapping, k)
+    assert [doc_idx for doc_idx, _ in ranking] == [doc_idx for doc_idx, _ in target]
+
+
+@pytest.mark.parametrize("query", ["kot", "pies las", "żyrafa"])
+def test_memory_top_k(tmp_path, index, query):
+    index.save(tmp_path, progress=False)
+    assert index.top_k(query, 3) == DiskIndex(lemmatize, tmp_path).top_k(query, 3)
+
+
+@pytest.mark.parametrize("query", ["kot", "kot pies", "płot las droga", "żyrafa"])
+def test_array_top_k(tmp_path, index, query):
+    array_index = ArrayIndex.from_index(index)
+    ranking = array_index.top_k(query, 3)
+    assert [doc_idx for doc_idx, _ in ranking] == [
+        doc_idx for doc_idx, _ in index.top_k(query, 3)
+    ]
+    assert [score for _, score in ranking] == pytest.approx(
+        [score for _, score in index.top_k(query, 3)]
+    )
+
+    array_index.save(tmp_path)
+    assert DiskIndex(lemmatize, tmp_path).top_k(query, 3) == pytest.approx(ranking)
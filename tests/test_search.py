@@ -0,0 +1,151 @@
+from dataclasses import replace
+
+import pytest
+from colorama import Fore, Style
+from helpers import build, lemmatize, save
+
+from textmining.array_index import ArrayIndex, ArrayPositionIndex
+from textmining.index import DiskIndex, Document, Index, PositionIndex
+from textmining.search import SearchEngine, highlight
+from textmining.tokenization import tokenize_with_offsets
+
+DOCUMENTS = [
+    Document("Kot", "Kot siedzi na płocie, a pies śpi."),
+    Document("Pies", "Pies szczeka na kota, a kot ucieka."),
+    Document("Kot i koty", "Koty i psy. Kot, kot, kot."),
+    Document("Płot", "Stary płot stoi przy drodze."),
+]
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    return SearchEngine(save(tmp_path_factory.mktemp("index"), documents=DOCUMENTS))
+
+
+def test_process(engine):
+    docs = engine.process([replace(doc) for doc in DOCUMENTS], "kot pies")
+    matching = {doc.title: (doc.title_matching, doc.exact_matching) for doc in docs}
+    assert matching == {
+        "Kot": (1, 3),
+        "Pies": (1, 3),
+        "Kot i koty": (2, 4),
+        "Płot": (0, 0),
+    }
+    assert [doc.title for doc in docs] == ["Kot i koty", "Kot", "Pies", "Płot"]
+
+
+def test_search(engine):
+    docs = engine.search("kot pies", color=False)
+    assert [doc.title for doc in docs] == ["Kot i koty", "Kot", "Pies"]
+    assert [doc.id for doc in docs] == [2, 0, 1]
+
+
+def test_rank_matches_process(engine):
+    processed = engine.process([replace(doc) for doc in DOCUMENTS[:3]], "kot pies")
+    assert [
+        (doc.title, doc.title_matching, doc.exact_matching) for doc in processed
+    ] == [
+        (DOCUMENTS[doc_idx].title, title_matching, exact_matching)
+        for doc_idx, title_matching, exact_matching in engine.rank("kot pies")
+    ]
+
+
+def test_search_top_k(engine):
+    docs = engine.search("kot", color=False, k=2)
+    assert [doc.title for doc in docs] == ["Kot i koty", "Kot"]
+    assert [doc.title_matching for doc in docs] == [2, 1]
+
+
+def test_search_ranked(engine):
+    docs = engine.search_ranked("koty", k=2, color=False)
+    assert [doc.title for doc in docs] == ["Kot i koty", "Kot"]
+    assert docs[0].score > docs[1].score
+
+
+def test_search_ranked_array_index(engine):
+    array_engine = SearchEngine(ArrayIndex.from_index(build(Index, DOCUMENTS)))
+    docs = array_engine.search_ranked("koty", k=2, color=False)
+    target = engine.search_ranked("koty", k=2, color=False)
+    assert [doc.id for doc in docs] == [doc.id for doc in target]
+    assert [doc.score for doc in docs] == pytest.approx([doc.score for doc in target])
+    assert len(array_engine.results("kot", ranked=True)) == 3
+
+
+def test_highlight():
+    text = "Kot (a.b*c) kotek, aXbbc kot."
+    tokens = tokenize_with_offsets(text)
+    matching = {token: token.lower() in {"kot", "a.b*c"} for token, _, _ in tokens}
+    assert highlight(text, tokens, matching, start="<", end=">") == (
+        "<Kot> (<a.b*c>) kotek, aXbbc <kot>."
+    )
+
+
+def test_highlight_snippet():
+    text = "Ala ma psa. Kot siedzi, kot śpi, pies szczeka."
+    tokens = tokenize_with_offsets(text)
+    matching = {token: token.lower() == "kot" for token, _, _ in tokens}
+    assert highlight(text, tokens, matching, 3, "<", ">") == "…<Kot> siedzi, <kot>…"
+    assert highlight(text, tokens, matching, 20, "<", ">") == (
+        "Ala ma psa. <Kot> siedzi, <kot> śpi, pies szczeka."
+    )
+
+
+def test_search_highlight(engine):
+    docs = engine.search("kota", k=1, snippet=2)
+    assert docs[0].title == (
+        f"{Fore.RED}Kot{Style.RESET_ALL} i {Fore.RED}koty{Style.RESET_ALL}"
+    )
+    assert (
+        docs[0].content
+        == f"…{Fore.RED}Kot{Style.RESET_ALL}, {Fore.RED}kot{Style.RESET_ALL}…"
+    )
+
+
+class CountingDiskIndex(DiskIndex):
+    loaded = 0
+
+    def load_doc(self, doc_idx: int):
+        self.loaded += 1
+        return super().load_doc(doc_idx)
+
+
+@pytest.mark.parametrize("ranked", [False, True])
+def test_results_pages(engine, ranked):
+    results = engine.results("kot", ranked=ranked, color=False)
+    all_docs = results.page(0, None)
+    assert len(results) == len(all_docs) == 3
+    assert [doc.id for doc in results.page(1, 1)] == [all_docs[1].id]
+    assert [doc.id for doc in results] == [doc.id for doc in all_docs]
+    assert results.page(3, 10) == []
+
+
+def test_results_are_lazy(engine):
+    index = CountingDiskIndex(lemmatize, engine.index.dir)
+    results = SearchEngine(index).results("kot pies", ranked=True)
+    first = next(iter(results))
+    assert first.id == index.top_k("kot pies", 1)[0][0]
+    assert index.loaded == 1
+
+
+def test_search_near(engine, tmp_path):
+    position_engine = SearchEngine(save(tmp_path, PositionIndex, DOCUMENTS))
+
+    docs = position_engine.search("pies kot", color=False, near=2)
+    assert [doc.title for doc in docs] == ["Kot i koty", "Pies"]
+    docs = position_engine.search("pies kot", color=False, near=4)
+    assert [doc.title for doc in docs] == ["Kot i koty", "Kot", "Pies"]
+    docs = position_engine.search("kot pies", color=False, near=4, ordered=True)
+    assert [doc.title for doc in docs] == ["Kot i koty", "Kot"]
+    docs = position_engine.search("kot pies", color=False, near=0, ordered=True)
+    assert docs == []
+    with pytest.raises(ValueError):
+        position_engine.results("kot pies", ranked=True, near=2)
+    with pytest.raises(ValueError):
+        position_engine.search_ranked("kot pies")
+    with pytest.raises(ValueError):
+        engine.search("kot pies", near=2)
+
+    array_index = ArrayPositionIndex.from_index(build(PositionIndex, DOCUMENTS))
+    array_engine = SearchEngine(array_index)
+    docs = array_engine.search("pies kot", color=False, near=2)
+    assert [doc.title for doc in docs] == ["Kot i koty", "Pies"]
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from helpers import lemmatize, save
+
+from textmining.client import Client, ServerError
+from textmining.index import DiskIndex
+from textmining.search import SearchEngine
+from textmining.server import Server, Service
+
+
+@pytest.fixture(scope="module")
+def socket_path(tmp_path_factory):
+    dir = tmp_path_factory.mktemp("server")
+    engine = SearchEngine(save(dir / "index"))
+    service = Service(engine, answer=lambda question: question.upper())
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    with ThreadPoolExecutor(2) as executor:
+        server = Server(service, executor)
+        path = dir / "server.sock"
+        started = asyncio.run_coroutine_threadsafe(server.start(path), loop)
+        aio_server = started.result(5)
+        yield path
+        loop.call_soon_threadsafe(aio_server.close)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+
+
+def test_search(socket_path):
+    engine = SearchEngine(DiskIndex(lemmatize, socket_path.parent / "index"))
+    with Client(socket_path) as client:
+        docs = client.search("kota", k=None)
+        assert docs == engine.search("kota", color=False)
+        assert [doc.id for doc in docs] == [doc.id for doc in engine.search("kot")]
+        assert [doc.title_matching for doc in docs] == [1, 0]
+
+        ranked = client.search("kot płot", k=2, ranked=True)
+        assert [(doc.id, doc.score) for doc in ranked] == engine.index.top_k(
+            "kot płot", 2
+        )
+
+
+def test_answer_and_errors(socket_path):
+    with Client(socket_path) as client:
+        assert client.answer("kto?") == "KTO?"
+        with pytest.raises(ServerError, match="Unknown method"):
+            client.call("shutdown")
+        with pytest.raises(ServerError, match="TypeError"):
+            client.call("search", question="kot")
+        assert "results" in client.stats()
+
+
+def test_concurrent_clients(socket_path):
+    def search(query):
+        with Client(socket_path) as client:
+            return [doc.id for doc in client.search(query)]
+
+    queries = ["kot", "płot", "pies", "na"] * 5
+    with ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(search, queries)) == list(map(search, queries))
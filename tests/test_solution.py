@@ -0,0 +1,99 @@
+import pytest
+from helpers import lemmatize, save
+
+from textmining.poleval import solution
+from textmining.proverbs import ProverbsHandler, QuestionAnswerer
+from textmining.search import SearchEngine
+
+PROVERBS = """Kto rano wstaje, temu Pan Bóg daje.
+Nie chwal dnia przed zachodem słońca.
+"""
+
+QUESTIONS = [
+    "Czy kot siedzi na płocie?",
+    "Dokończ przysłowie: „Kto rano wstaje...”",
+    "Kto daje temu, kto rano wstaje?",
+    "Kto szczeka na kota?",
+    "",
+    "Co stoi przy drodze?",
+]
+
+
+class Lemmas:
+    def lemmatize(self, word: str):
+        return lemmatize(word)
+
+
+class FakeAnswerer(QuestionAnswerer):
+    def load(self):
+        pass
+
+    def _answer_batch(self, pairs):
+        return ["pan bóg" if "daje" in question else None for question, _ in pairs]
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    path = tmp_path / "proverbs.txt"
+    path.write_text(PROVERBS)
+    index = save(tmp_path / "index")
+    state = solution.State(
+        Lemmas(),
+        index,
+        SearchEngine(index),
+        ProverbsHandler(Lemmas(), path, FakeAnswerer()),
+    )
+    monkeypatch.setattr(solution, "_state", state)
+    return state
+
+
+def test_answer_chunk(state):
+    results = solution.answer_chunk(QUESTIONS)
+    assert [answer for answer, _ in results] == [
+        "Tak",
+        "temu pan bóg daje",
+        "pan bóg",
+        "Pies",
+        solution.NO_ANSWER,
+        "Płot",
+    ]
+    assert results[0][1] == {}
+    assert set(results[1][1]) == {"proverbs"}
+    assert set(results[3][1]) == {"proverbs", "search"}
+    assert solution.answer(QUESTIONS[2]) == "pan bóg"
+
+
+def test_answer_completed_proverbs(state):
+    assert solution.answer(QUESTIONS[1]) == "temu pan bóg daje"
+    results = solution.answer_chunk(QUESTIONS[:2])
+    assert [answer for answer, _ in results] == ["Tak", "temu pan bóg daje"]
+    assert solution.answer_chunk([]) == []
+
+
+def test_answer_batch_order(state):
+    questions = QUESTIONS * 3
+    target = [answer for answer, _ in solution.answer_chunk(questions)]
+    for workers in [1, 2]:
+        answers = solution.answer_batch(questions, workers, chunksize=2)
+        assert [answer for answer, _ in answers] == target
+
+
+def test_summarize():
+    stages_timings = [{"proverbs": 0.25, "search": 0.5}, {"proverbs": 0.25}, {}]
+    assert solution.summarize(stages_timings, 3, 1.5).splitlines() == [
+        "total: 3 questions in 1.5s (2.00 questions/s)",
+        "proverbs: 2 questions in 0.5s (4.00 questions/s per worker)",
+        "search: 1 questions in 0.5s (2.00 questions/s per worker)",
+    ]
+
+
+def test_search_loads_documents_lazily(state, monkeypatch):
+    loaded = []
+    load_doc = state.index.load_doc
+    monkeypatch.setattr(
+        state.index,
+        "load_doc",
+        lambda doc_idx: loaded.append(doc_idx) or load_doc(doc_idx),
+    )
+    assert solution.answer(QUESTIONS[3]) == "Pies"
+    assert len(loaded) == 1
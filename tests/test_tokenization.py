@@ -1,3 +1,5 @@
+import random
+
 import pytest
 
 from textmining.tokenization import (
@@ -5,6 +7,9 @@ from textmining.tokenization import (
     rstrip_punctuation,
     strip_notalnum,
     strip_punctuation,
+    tokenize,
+    tokenize_batch,
+    tokenize_with_offsets,
 )
 
 
@@ -66,3 +71,40 @@ def test_strip_punctuation(word, target):
 )
 def test_strip_notalnum(word, target):
     assert strip_notalnum(word) == target
+
+
+def split_tokenize(text: str):
+    return [word for word in map(strip_notalnum, text.split()) if word]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_tokenize_matches_split_and_strip(seed):
+    rng = random.Random(seed)
+    alphabet = "aźŻ9²½_-.,!?„”'()é́ \t\n  \x1c　"
+    text = "".join(rng.choice(alphabet) for _ in range(500))
+    assert tokenize(text) == split_tokenize(text)
+
+
+@pytest.mark.parametrize(
+    "text, target",
+    [
+        ("Kot siedzi na płocie.", ["Kot", "siedzi", "na", "płocie"]),
+        ("``awk'' -- (sed)", ["awk", "sed"]),
+        ("a_b _c_ __", ["a_b", "c"]),
+        ("  ", []),
+    ],
+)
+def test_tokenize(text, target):
+    assert tokenize(text) == target
+
+
+def test_tokenize_with_offsets():
+    text = "„Kot”  siedzi, na płocie."
+    tokens = tokenize_with_offsets(text)
+    assert [token for token, _, _ in tokens] == tokenize(text)
+    assert all(text[start:end] == token for token, start, end in tokens)
+
+
+def test_tokenize_batch():
+    texts = ["Kot siedzi.", "", "Pies, szczeka!"]
+    assert tokenize_batch(texts) == [tokenize(text) for text in texts]
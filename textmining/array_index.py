@@ -0,0 +1,267 @@
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+from textmining.features import DocumentFeatures
+from textmining.index import (
+    DEFAULT_INDEX_DIR,
+    DEFAULT_POSITION_INDEX_DIR,
+    Document,
+    Index,
+    PositionIndex,
+)
+from textmining.postings import SequenceFrequenciesCursor
+from textmining.query import near
+from textmining.ranking import BM25, ScoredTerm, top_k
+from textmining.segment import INDEX_KIND, POSITION_INDEX_KIND, write_segment
+from textmining.tokenization import tokenize
+
+POSTINGS_DTYPE = np.uint32
+
+
+def _pack(inverse_mapping):
+    """
+    Return term ids, offsets and postings of CSR representation.
+
+    Postings of the i-th term are `postings[offsets[i] : offsets[i + 1]]`.
+    """
+    terms = sorted(inverse_mapping)
+    lengths = np.fromiter(
+        (len(inverse_mapping[term]) for term in terms), dtype=np.int64, count=len(terms)
+    )
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    postings = np.empty(offsets[-1], dtype=POSTINGS_DTYPE)
+    for term, start, end in zip(terms, offsets[:-1], offsets[1:]):
+        postings[start:end] = inverse_mapping[term]
+    return {term: term_id for term_id, term in enumerate(terms)}, offsets, postings
+
+
+class ArrayIndex:
+    """
+    Read-only, in-memory index with postings of all terms
+    stored in one contiguous array.
+
+    Frequencies of terms, if given, are stored in an array
+    aligned with postings.
+    """
+
+    def __init__(
+        self,
+        lemmatize,
+        terms: Dict[str, int],
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        documents: List[Document],
+        features: List[bytes],
+        frequencies=None,
+        lengths=None,
+    ):
+        self.lemmatize = lemmatize
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.documents = documents
+        self.features = features
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.bm25 = None if lengths is None else BM25.from_lengths(lengths)
+
+    @classmethod
+    def from_index(cls, index: Index):
+        terms, offsets, postings = _pack(index.inverse_mapping)
+        _, _, frequencies = _pack(index.frequencies)
+        return cls(
+            index.lemmatize,
+            terms,
+            offsets,
+            postings,
+            index.documents,
+            index.features,
+            frequencies,
+            np.asarray(index.lengths, dtype=POSTINGS_DTYPE),
+        )
+
+    @property
+    def inverse_mapping(self):
+        return {term: self._get_term_postings(term) for term in self.terms}
+
+    def _get_term_postings(self, term) -> np.ndarray:
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return self.postings[:0]
+        return self.postings[self.offsets[term_id] : self.offsets[term_id + 1]]
+
+    def _get_term_frequencies(self, term) -> np.ndarray:
+        term_id = self.terms.get(term)
+        if term_id is None:
+            return self.frequencies[:0]
+        return self.frequencies[self.offsets[term_id] : self.offsets[term_id + 1]]
+
+    def _get_token_postings(self, token) -> np.ndarray:
+        postings = [self._get_term_postings(term) for term in self.lemmatize(token)]
+        if len(postings) == 1:
+            return postings[0]
+        return np.unique(np.concatenate(postings))
+
+    def _get_tokens_postings(self, query: str) -> List[np.ndarray]:
+        return [self._get_token_postings(token) for token in tokenize(query)]
+
+    def _get_docs_idxs(self, query: str) -> Set[int]:
+        tokens_postings = sorted(self._get_tokens_postings(query), key=len)
+        if not tokens_postings:
+            return set()
+
+        docs_idxs = tokens_postings[0]
+        for postings in tokens_postings[1:]:
+            if not len(docs_idxs):
+                break
+            docs_idxs = np.intersect1d(docs_idxs, postings, assume_unique=True)
+        return set(docs_idxs.tolist())
+
+    def _get_scored_term(self, term) -> ScoredTerm:
+        postings = self._get_term_postings(term)
+        frequencies = self._get_term_frequencies(term)
+        bm25 = self.bm25
+        idf = bm25.idf(len(postings))
+        lengths = self.lengths[postings]
+        norms = bm25.k1 * (1 - bm25.b + bm25.b * lengths / bm25.avgdl)
+        bound = float(np.max(idf * frequencies * (bm25.k1 + 1) / (frequencies + norms)))
+        # Views of the arrays yield Python ints to the cursor.
+        cursor = SequenceFrequenciesCursor(
+            memoryview(postings), memoryview(frequencies)
+        )
+        return ScoredTerm(cursor, idf, bound)
+
+    def top_k(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Return indices and BM25 scores of k best documents
+        containing any lemma of the query, best first.
+        """
+        lemmas = {
+            lemma
+            for token in tokenize(query.lower())
+            for lemma in self.lemmatize(token)
+        }
+        terms = [
+            self._get_scored_term(lemma)
+            for lemma in lemmas
+            if len(self._get_term_postings(lemma))
+        ]
+        return top_k(terms, k, self.bm25, memoryview(self.lengths))
+
+    def load_doc(self, doc_idx: int) -> Document:
+        doc = replace(self.documents[doc_idx])
+        doc.id = doc_idx
+        return doc
+
+    def load_features(self, doc_idx: int) -> DocumentFeatures:
+        return DocumentFeatures.decode(self.features[doc_idx])
+
+    def search(self, query: str) -> List[Document]:
+        query = query.lower()
+        docs_idxs = self._get_docs_idxs(query)
+        return [self.load_doc(doc_idx) for doc_idx in sorted(docs_idxs)]
+
+    def save(self, dir: Path = DEFAULT_INDEX_DIR):
+        frequencies = None
+        if self.frequencies is not None:
+            frequencies = {
+                term: self._get_term_frequencies(term) for term in self.terms
+            }
+        write_segment(
+            dir,
+            INDEX_KIND,
+            self.inverse_mapping,
+            self.documents,
+            self.features,
+            frequencies=frequencies,
+            lengths=None if self.lengths is None else self.lengths.tolist(),
+        )
+
+
+class ArrayPositionIndex(ArrayIndex):
+    def __init__(
+        self,
+        lemmatize,
+        terms: Dict[str, int],
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        documents: List[Document],
+        features: List[bytes],
+        beginnings: np.ndarray,
+        n_positions: int,
+    ):
+        super().__init__(lemmatize, terms, offsets, postings, documents, features)
+        self.beginnings = beginnings
+        self.n_positions = n_positions
+
+    @classmethod
+    def from_index(cls, index: PositionIndex):
+        terms, offsets, postings = _pack(index.inverse_mapping)
+        beginnings = np.asarray(index.beginnings, dtype=POSTINGS_DTYPE)
+        return cls(
+            index.lemmatize,
+            terms,
+            offsets,
+            postings,
+            index.documents,
+            index.features,
+            beginnings,
+            index.word_idx,
+        )
+
+    def _get_docs_idxs(self, query: str) -> Set[int]:
+        tokens_postings = self._get_tokens_postings(query)
+        if not tokens_postings:
+            return set()
+
+        shifts = sorted(
+            range(len(tokens_postings)), key=lambda idx: len(tokens_postings[idx])
+        )
+        starts = tokens_postings[shifts[0]].astype(np.int64) - shifts[0]
+        for shift in shifts[1:]:
+            positions = tokens_postings[shift]
+            if not len(starts) or not len(positions):
+                return set()
+            wanted = starts + shift
+            found = np.searchsorted(positions, wanted)
+            found[found == len(positions)] = 0
+            starts = starts[positions[found] == wanted]
+
+        docs_idxs = np.searchsorted(self.beginnings, starts, side="right") - 1
+        return set(docs_idxs.tolist())
+
+    def _get_term_doc_positions(self, term) -> Tuple[List[int], List[List[int]]]:
+        positions = self._get_term_postings(term)
+        docs_idxs = np.searchsorted(self.beginnings, positions, side="right") - 1
+        starts = np.flatnonzero(np.diff(docs_idxs, prepend=-1)).tolist()
+        local = (positions - self.beginnings[docs_idxs]).tolist()
+        ends = starts[1:] + [len(local)]
+        docs_positions = [local[start:end] for start, end in zip(starts, ends)]
+        return docs_idxs[starts].tolist(), docs_positions
+
+    def _get_near_docs_idxs(self, query: str, k: int, ordered: bool) -> Set[int]:
+        groups = [
+            [self._get_term_doc_positions(term) for term in self.lemmatize(token)]
+            for token in tokenize(query.lower())
+        ]
+        return set(near(groups, k, ordered))
+
+    def search_near(self, query: str, k: int, ordered: bool = False) -> List[Document]:
+        docs_idxs = self._get_near_docs_idxs(query.lower(), k, ordered)
+        return [self.load_doc(doc_idx) for doc_idx in sorted(docs_idxs)]
+
+    def save(self, dir: Path = DEFAULT_POSITION_INDEX_DIR):
+        write_segment(
+            dir,
+            POSITION_INDEX_KIND,
+            self.inverse_mapping,
+            self.documents,
+            self.features,
+            self.beginnings.tolist(),
+            self.n_positions,
+        )
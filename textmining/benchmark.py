@@ -0,0 +1,398 @@
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass, field
+from itertools import accumulate, chain
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from textmining.corpus import Document
+from textmining.index import DiskIndex, DiskPositionIndex, Index, PositionIndex
+from textmining.lemmatization import Lemmas
+from textmining.proverbs import ProverbsHandler
+from textmining.search import SearchEngine
+from textmining.tokenization import tokenize
+
+DEFAULT_N_DOCUMENTS = 20_000
+DEFAULT_N_LEMMAS = 5_000
+DEFAULT_N_QUERIES = 200
+DEFAULT_SEED = 0
+
+_ONSETS = ["", "b", "br", "c", "ch", "cz", "d", "dz", "g", "gr", "k", "kr", "l"]
+_ONSETS += ["ł", "m", "n", "p", "pr", "r", "s", "st", "sz", "ś", "t", "tr", "w", "z"]
+_ONSETS += ["ż"]
+_VOWELS = ["a", "e", "i", "o", "u", "y", "ó", "ą", "ę"]
+_CODAS = ["", "", "k", "n", "r", "sk", "t", "ł", "m", "ść"]
+_ENDINGS = ["a", "u", "owi", "em", "ie", "y", "ów", "ami", "ach", "om", "ę", "ą"]
+
+# Exponent of the Zipf distribution of lemmas in the synthetic corpus.
+_ZIPF_EXPONENT = 1.1
+
+
+@dataclass
+class Vocabulary:
+    """
+    Synthetic Polish-like lemmas, most frequent first, with their forms.
+    """
+
+    lemmas: List[str]
+    forms: List[List[str]]
+    _cum_weights: List[float] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        weights = (1 / rank**_ZIPF_EXPONENT for rank in range(1, len(self.lemmas) + 1))
+        self._cum_weights = list(accumulate(weights))
+
+    def words_to_lemmas(self) -> Dict[str, List[str]]:
+        words_to_lemmas = {}
+        for lemma, forms in zip(self.lemmas, self.forms):
+            for form in forms:
+                words_to_lemmas.setdefault(form, []).append(lemma)
+        return words_to_lemmas
+
+    def sample(self, rng: random.Random, k: int) -> List[str]:
+        """
+        Return k words with lemmas drawn from the Zipf distribution.
+        """
+        lemmas_idxs = rng.choices(
+            range(len(self.lemmas)), cum_weights=self._cum_weights, k=k
+        )
+        return [rng.choice(self.forms[lemma_idx]) for lemma_idx in lemmas_idxs]
+
+
+def synthetic_vocabulary(
+    n_lemmas: int = DEFAULT_N_LEMMAS, seed: int = DEFAULT_SEED
+) -> Vocabulary:
+    """
+    Return vocabulary of lemmas built of Polish-like syllables,
+    each with a few inflected forms. Some forms are shared
+    by different lemmas, like in a real dictionary.
+    """
+    rng = random.Random(seed)
+    lemmas = {}
+    while len(lemmas) < n_lemmas:
+        syllables = rng.randint(1, 3)
+        stem = "".join(
+            rng.choice(_ONSETS) + rng.choice(_VOWELS) for _ in range(syllables)
+        )
+        lemma = stem + rng.choice(_CODAS)
+        if len(lemma) > 1 and lemma not in lemmas:
+            endings = rng.sample(_ENDINGS, rng.randint(3, 6))
+            lemmas[lemma] = [lemma] + [lemma + ending for ending in endings]
+    return Vocabulary(list(lemmas), list(lemmas.values()))
+
+
+def synthetic_documents(
+    vocabulary: Vocabulary,
+    n_documents: int = DEFAULT_N_DOCUMENTS,
+    seed: int = DEFAULT_SEED,
+) -> Iterator[Document]:
+    """
+    Yield documents with titles of a few words and contents
+    of sentences of words drawn from the vocabulary.
+    """
+    rng = random.Random(seed)
+    for _ in range(n_documents):
+        title = " ".join(
+            word.capitalize() for word in vocabulary.sample(rng, rng.randint(1, 3))
+        )
+        sentences = []
+        for _ in range(rng.randint(1, 20)):
+            words = vocabulary.sample(rng, rng.randint(4, 15))
+            if len(words) > 6 and rng.random() < 0.3:
+                words[len(words) // 2] += ","
+            sentences.append(" ".join(words).capitalize() + ".")
+        yield Document(title, " ".join(sentences))
+
+
+def synthetic_proverbs(
+    vocabulary: Vocabulary, n_proverbs: int = 500, seed: int = DEFAULT_SEED
+) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        " ".join(vocabulary.sample(rng, rng.randint(4, 8))) for _ in range(n_proverbs)
+    ]
+
+
+@dataclass
+class Queries:
+    conjunctive: List[str]
+    phrase: List[str]
+    broad: List[str]
+    questions: List[str]
+    proverb_questions: List[str]
+
+
+def synthetic_queries(
+    vocabulary: Vocabulary,
+    documents: Sequence[Document],
+    proverbs: Sequence[str],
+    n_queries: int = DEFAULT_N_QUERIES,
+    seed: int = DEFAULT_SEED,
+) -> Queries:
+    """
+    Return queries of every kind: two words of a document (AND),
+    a few consecutive words of a document (phrase), one of the most
+    frequent words (broad) and questions about documents and proverbs.
+    """
+    rng = random.Random(seed)
+    documents_tokens = [
+        tokenize(document.content.lower())
+        for document in rng.sample(documents, min(50, len(documents)))
+    ]
+
+    def document_tokens():
+        return rng.choice(documents_tokens)
+
+    conjunctive = [" ".join(rng.sample(document_tokens(), 2)) for _ in range(n_queries)]
+    phrase = []
+    for _ in range(n_queries):
+        tokens = document_tokens()
+        length = rng.randint(2, 3)
+        start = rng.randrange(len(tokens) - length + 1)
+        phrase.append(" ".join(tokens[start : start + length]))
+    broad = [rng.choice(vocabulary.forms[rng.randrange(20)]) for _ in range(n_queries)]
+    questions = [
+        f"Co to jest {' '.join(rng.sample(document_tokens(), 3))}?"
+        for _ in range(n_queries)
+    ]
+    proverb_questions = []
+    for _ in range(n_queries):
+        words = rng.choice(proverbs).split()
+        beginning = " ".join(words[: len(words) // 2])
+        proverb_questions.append(f"Dokończ przysłowie: „{beginning}…”")
+    return Queries(conjunctive, phrase, broad, questions, proverb_questions)
+
+
+def latencies(function: Callable[[str], object], queries: Sequence[str]) -> Dict:
+    """
+    Return percentiles of latencies of calls of the function
+    with every query and its throughput.
+    """
+    seconds = []
+    for query in queries:
+        start = time.perf_counter()
+        function(query)
+        seconds.append(time.perf_counter() - start)
+    ms = 1000 * np.array(seconds)
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "mean_ms": ms.mean(),
+        "per_s": len(seconds) / sum(seconds),
+    }
+
+
+def peak_rss_mb() -> float:
+    """
+    Return peak resident memory of the process so far, in MiB.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def dir_size(dir: Path) -> int:
+    return sum(path.stat().st_size for path in dir.rglob("*") if path.is_file())
+
+
+def _build(index, documents: Sequence[Document], dir: Path) -> Dict:
+    start = time.perf_counter()
+    index.extend(documents)
+    add_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    index.save(dir, progress=False)
+    save_seconds = time.perf_counter() - start
+    return {
+        "docs_per_s": len(documents) / add_seconds,
+        "save_s": save_seconds,
+        "size_bytes": dir_size(dir),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run(
+    dir: Path,
+    n_documents: int = DEFAULT_N_DOCUMENTS,
+    n_lemmas: int = DEFAULT_N_LEMMAS,
+    n_queries: int = DEFAULT_N_QUERIES,
+    seed: int = DEFAULT_SEED,
+    bert: bool = False,
+) -> Dict[str, Dict]:
+    """
+    Build indices of a synthetic corpus in the directory,
+    run queries and questions against them and return the results.
+
+    Results caches are disabled, so every query is evaluated,
+    while caches of lemmas and decoded postings stay on.
+    Peak RSS is the highest so far in the process.
+    """
+    vocabulary = synthetic_vocabulary(n_lemmas, seed)
+    lemmas = Lemmas(vocabulary.words_to_lemmas())
+    documents = list(synthetic_documents(vocabulary, n_documents, seed))
+    proverbs = synthetic_proverbs(vocabulary, seed=seed)
+    queries = synthetic_queries(vocabulary, documents, proverbs, n_queries, seed)
+    results = {"corpus": {"peak_rss_mb": peak_rss_mb()}}
+
+    texts = [
+        text for document in documents for text in (document.title, document.content)
+    ]
+    start = time.perf_counter()
+    n_tokens = sum(len(tokenize(text)) for text in texts)
+    seconds = time.perf_counter() - start
+    results["tokenize"] = {
+        "tokens_per_s": n_tokens / seconds,
+        "mb_per_s": sum(len(text.encode()) for text in texts) / 2**20 / seconds,
+    }
+
+    results["build_index"] = _build(Index(lemmas.lemmatize), documents, dir / "index")
+    results["build_position_index"] = _build(
+        PositionIndex(lemmas.lemmatize), documents, dir / "position_index"
+    )
+
+    index = DiskIndex(lemmas.lemmatize, dir / "index", results_cache_size=0)
+    position_index = DiskPositionIndex(
+        lemmas.lemmatize, dir / "position_index", results_cache_size=0
+    )
+    engine = SearchEngine(index)
+    position_engine = SearchEngine(position_index)
+    results["and_index_search"] = latencies(index.search, queries.conjunctive)
+    results["and_engine_process"] = latencies(
+        lambda query: engine.process(index.search(query), query), queries.conjunctive
+    )
+    results["and_engine_search"] = latencies(
+        lambda query: engine.search(query, color=False, k=10), queries.conjunctive
+    )
+    results["phrase_index_search"] = latencies(position_index.search, queries.phrase)
+    results["near_index_search"] = latencies(
+        lambda query: position_index.search_near(query, 5), queries.conjunctive
+    )
+    results["phrase_engine_search"] = latencies(
+        lambda query: position_engine.search(query, color=False, k=10), queries.phrase
+    )
+    results["broad_index_search"] = latencies(index.search, queries.broad)
+    results["broad_engine_search"] = latencies(
+        lambda query: engine.search(query, color=False, k=10), queries.broad
+    )
+    results["broad_engine_ranked"] = latencies(
+        lambda query: engine.search_ranked(query, 10, color=False), queries.broad
+    )
+    results["queries"] = {"peak_rss_mb": peak_rss_mb()}
+
+    from textmining.poleval import solution
+
+    proverbs_path = dir / "proverbs.txt"
+    proverbs_path.write_text("\n".join(proverbs))
+    proverbs_handler = ProverbsHandler(lemmas, proverbs_path)
+    results["qa_proverbs"] = latencies(
+        proverbs_handler.complete_proverb, queries.proverb_questions
+    )
+    results["qa_search"] = latencies(
+        lambda question: solution._search_answer(
+            engine, [token for token in tokenize(question.lower()) if len(token) > 1]
+        ),
+        queries.questions,
+    )
+    if bert:
+        proverbs_handler.answerer.load()
+        state = solution.State(lemmas, index, engine, proverbs_handler)
+        questions = list(chain(queries.questions, queries.proverb_questions))
+        rng = random.Random(seed)
+        rng.shuffle(questions)
+        start = time.perf_counter()
+        solution.answer_chunk(questions, state)
+        results["qa_answer"] = {
+            "questions_per_s": len(questions) / (time.perf_counter() - start)
+        }
+    results["qa"] = {"peak_rss_mb": peak_rss_mb()}
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict, current: Dict) -> str:
+    """
+    Return table of metrics of both reports with their relative changes.
+    """
+    lines = [f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for stage, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            name = f"{stage}.{metric}"
+            old = baseline["results"].get(stage, {}).get(metric)
+            if old is None:
+                lines.append(f"{name:<40} {'-':>12} {value:>12.3f} {'-':>8}")
+            else:
+                change = f"{100 * (value - old) / old:+.1f}%" if old else "-"
+                lines.append(f"{name:<40} {old:>12.3f} {value:>12.3f} {change:>8}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--documents", type=int, default=DEFAULT_N_DOCUMENTS)
+    parser.add_argument("-l", "--lemmas", type=int, default=DEFAULT_N_LEMMAS)
+    parser.add_argument("-q", "--queries", type=int, default=DEFAULT_N_QUERIES)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument(
+        "-d",
+        "--dir",
+        type=Path,
+        default=None,
+        help="directory for indices (a temporary one by default)",
+    )
+    parser.add_argument(
+        "--bert",
+        action="store_true",
+        help="also answer questions end to end, which needs the BERT model",
+    )
+    parser.add_argument("-o", "--output", type=Path, default=None)
+    parser.add_argument(
+        "-c", "--compare", type=Path, default=None, help="report to compare with"
+    )
+    args = parser.parse_args()
+
+    params = dict(
+        n_documents=args.documents,
+        n_lemmas=args.lemmas,
+        n_queries=args.queries,
+        seed=args.seed,
+        bert=args.bert,
+    )
+    if args.dir is None:
+        with tempfile.TemporaryDirectory() as dir:
+            results = run(Path(dir), **params)
+    else:
+        results = run(args.dir, **params)
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": params,
+        "results": results,
+    }
+
+    if args.output is not None:
+        with args.output.open("wt") as f:
+            json.dump(report, f, indent=2)
+    if args.compare is not None:
+        with args.compare.open("rt") as f:
+            print(compare(json.load(f), report))
+    else:
+        print(json.dumps(report, indent=2))
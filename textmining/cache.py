@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+    capacity: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self):
+        return (
+            f"hits: {self.hits}, misses: {self.misses}, "
+            f"hit rate: {self.hit_rate:.1%}, evictions: {self.evictions}, "
+            f"size: {self.size}/{self.capacity}"
+        )
+
+
+def lru_cache_stats(cached_function) -> CacheStats:
+    """
+    Return statistics of a function wrapped with `functools.lru_cache`.
+    """
+    info = cached_function.cache_info()
+    return CacheStats(
+        hits=info.hits,
+        misses=info.misses,
+        evictions=max(info.misses - info.currsize, 0),
+        size=info.currsize,
+        capacity=info.maxsize,
+    )
+
+
+class LRUCache:
+    """
+    Least recently used cache bounded by the total size of its values in bytes.
+
+    Sizes are given by the caller, values larger than
+    the whole capacity are not cached. The cache can be shared by threads.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    def get(self, key: Hashable):
+        """
+        Return cached value or None if it is missing.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value, nbytes: int):
+        if nbytes > self.capacity:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self._size += nbytes
+            while self._size > self.capacity:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._size -= evicted_nbytes
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            size=self._size,
+            capacity=self.capacity,
+        )
+
+
+class PrefixedCache:
+    """
+    View of a cache keeping entries under keys qualified by a prefix,
+    so that several indexes can share one cache without key collisions.
+    """
+
+    def __init__(self, cache: LRUCache, prefix: Hashable):
+        self.cache = cache
+        self.prefix = prefix
+
+    def __contains__(self, key: Hashable):
+        return (self.prefix, key) in self.cache
+
+    def get(self, key: Hashable):
+        return self.cache.get((self.prefix, key))
+
+    def put(self, key: Hashable, value, nbytes: int):
+        self.cache.put((self.prefix, key), value, nbytes)
+
+    def stats(self) -> CacheStats:
+        return self.cache.stats()
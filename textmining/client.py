@@ -0,0 +1,100 @@
+import argparse
+import json
+import socket
+from dataclasses import fields
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from textmining.corpus import Document
+from textmining.server import DEFAULT_SOCKET_PATH
+
+
+class ServerError(Exception):
+    pass
+
+
+class Client:
+    """
+    Blocking client of `textmining.server`.
+
+    Search results are returned as documents,
+    so it can replace a local `SearchEngine`.
+    """
+
+    def __init__(self, path: Path = DEFAULT_SOCKET_PATH):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(str(path))
+        self._file = self._socket.makefile("rwb")
+        self._request_id = 0
+
+    def call(self, method: str, **params):
+        self._request_id += 1
+        request = {"id": self._request_id, "method": method, "params": params}
+        self._file.write(json.dumps(request, ensure_ascii=False).encode() + b"\n")
+        self._file.flush()
+        response = json.loads(self._file.readline())
+        if "error" in response:
+            raise ServerError(response["error"])
+        return response["result"]
+
+    def search(
+        self,
+        query: str,
+        k: Optional[int] = 10,
+        offset: int = 0,
+        ranked: bool = False,
+        color: bool = False,
+        snippet: Optional[int] = None,
+        near: Optional[int] = None,
+        ordered: bool = False,
+    ) -> List[Document]:
+        docs = []
+        for attributes in self.call(
+            "search",
+            query=query,
+            k=k,
+            offset=offset,
+            ranked=ranked,
+            color=color,
+            snippet=snippet,
+            near=near,
+            ordered=ordered,
+        ):
+            doc = Document(*(attributes.pop(field.name) for field in fields(Document)))
+            for name, value in attributes.items():
+                setattr(doc, name, value)
+            docs.append(doc)
+        return docs
+
+    def answer(self, question: str) -> str:
+        return self.call("answer", question=question)
+
+    def stats(self) -> Dict[str, str]:
+        return self.call("stats")
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query")
+    parser.add_argument("-s", "--socket", type=Path, default=DEFAULT_SOCKET_PATH)
+    parser.add_argument("-a", "--answer", action="store_true")
+    parser.add_argument("-r", "--ranked", action="store_true")
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    with Client(args.socket) as client:
+        if args.answer:
+            print(client.answer(args.query))
+        else:
+            for doc in client.search(args.query, args.k, ranked=args.ranked):
+                print(f"[{doc.id}]  {doc.title}", doc.content, sep="\n", end="\n\n")
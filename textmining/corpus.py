@@ -0,0 +1,110 @@
+import gzip
+import mmap
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Tuple
+
+DEFAULT_CORPUS_PATH = Path("data/fp_wiki.txt")
+
+
+@dataclass
+class Document:
+    title: str
+    content: str
+
+
+def _lines_with_offsets(f) -> Iterator[Tuple[int, bytes]]:
+    offset = 0
+    for line in f:
+        yield offset, line
+        offset += len(line)
+
+
+def _buffer_lines(buffer, offset: int) -> Iterator[Tuple[int, bytes]]:
+    while offset < len(buffer):
+        end = buffer.find(b"\n", offset)
+        end = len(buffer) if end == -1 else end + 1
+        yield offset, buffer[offset:end]
+        offset = end
+
+
+def _parse(lines: Iterator[Tuple[int, bytes]]) -> Iterator[Document]:
+    """
+    Parse documents from lines of the corpus.
+
+    Every document starts with a "TITLE: " line, followed by
+    a line with the title and lines of content ended by an empty line.
+    """
+    try:
+        while True:
+            offset, line = next(lines)
+            if not line.startswith(b"TITLE: "):
+                return
+            title = next(lines)[1].decode().strip()
+            content_lines = []
+            while True:
+                end_offset, line = next(lines)
+                if not (content_line := line.decode().strip()):
+                    break
+                content_lines.append(content_line)
+            document = Document(title, " ".join(content_lines))
+            document.offset = offset
+            document.nbytes = end_offset + len(line) - offset
+            yield document
+    except StopIteration:
+        return
+
+
+def open_corpus(path: Path):
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    return path.open("rb")
+
+
+def read_documents(path: Path = DEFAULT_CORPUS_PATH) -> Iterator[Document]:
+    """
+    Lazily read documents of the corpus, optionally gzipped.
+
+    Every document gets `offset` attribute with the position
+    of its first byte in the (uncompressed) corpus
+    and `nbytes` attribute with the number of its bytes.
+    """
+    with open_corpus(path) as f:
+        yield from _parse(_lines_with_offsets(f))
+
+
+def read_document_at(buffer, offset: int) -> Document:
+    """
+    Return document starting at the offset of the corpus
+    loaded into a buffer, e.g. `mmap`.
+    """
+    return next(_parse(_buffer_lines(buffer, offset)))
+
+
+def map_corpus(path: Path) -> mmap.mmap:
+    with path.open("rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class SourceDocuments:
+    """
+    List-like store of documents of an uncompressed corpus,
+    which keeps only their offsets and reads them back from the corpus.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.offsets = array("Q")
+        self._buffer = None
+
+    def append(self, document: Document):
+        self.offsets.append(document.offset)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, doc_idx: int) -> Document:
+        if self._buffer is None:
+            self._buffer = map_corpus(self.path)
+        return read_document_at(self._buffer, self.offsets[doc_idx])
@@ -0,0 +1,80 @@
+import math
+from typing import Iterable, List
+
+import editdistance
+
+# Highest edit distance of matching words, relative to the target length.
+DEFAULT_RATIO = 0.5
+
+
+def scaled_editdist(ans, cor):
+    ans = ans.lower()
+    cor = cor.lower()
+
+    return editdistance.eval(ans, cor) / len(cor)
+
+
+def _max_distance(length: int, ratio: float, strict: bool) -> int:
+    if strict:
+        return math.ceil(ratio * length) - 1
+    return math.floor(ratio * length)
+
+
+def _within(word: str, target: str, max_distance: int) -> bool:
+    if word == target:
+        return max_distance >= 0
+    # Every character of length difference needs an insertion or deletion.
+    if max_distance <= 0 or abs(len(word) - len(target)) > max_distance:
+        return False
+    return editdistance.eval_criterion(word, target, max_distance)
+
+
+def is_close(
+    word: str, target: str, ratio: float = DEFAULT_RATIO, strict: bool = False
+) -> bool:
+    """
+    Return whether `scaled_editdist(word, target)` is at most
+    the ratio (below it if strict).
+
+    Distance is computed only up to the bound, so it stops
+    as soon as the ratio cannot be met.
+    """
+    target = target.lower()
+    return _within(word.lower(), target, _max_distance(len(target), ratio, strict))
+
+
+class Matcher:
+    """
+    Matcher of words against many targets by `is_close`.
+
+    Targets are lowercased and their distance bounds computed once,
+    so every word is checked against all of them in one call.
+    """
+
+    def __init__(
+        self,
+        targets: Iterable[str],
+        ratio: float = DEFAULT_RATIO,
+        strict: bool = False,
+    ):
+        self.targets = [target.lower() for target in targets]
+        self.max_distances = [
+            _max_distance(len(target), ratio, strict) for target in self.targets
+        ]
+
+    def matches(self, word: str) -> List[bool]:
+        """
+        Return whether the word is close to every target.
+        """
+        word = word.lower()
+        return [
+            _within(word, target, max_distance)
+            for target, max_distance in zip(self.targets, self.max_distances)
+        ]
+
+    def matches_any(self, word: str) -> bool:
+        word = word.lower()
+        return any(
+            _within(word, target, max_distance)
+            for target, max_distance in zip(self.targets, self.max_distances)
+        )
@@ -0,0 +1,61 @@
+import json
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, Set
+
+
+@dataclass
+class DocumentFeatures:
+    """
+    Frequencies of lowercased tokens of the title and the content of a document.
+    """
+
+    title: Dict[str, int]
+    body: Dict[str, int]
+
+    @classmethod
+    def from_tokens(cls, title_tokens: Iterable[str], body_tokens: Iterable[str]):
+        return cls(Counter(title_tokens), Counter(body_tokens))
+
+    def encode(self) -> bytes:
+        return json.dumps([self.title, self.body], ensure_ascii=False).encode()
+
+    @classmethod
+    def decode(cls, blob) -> "DocumentFeatures":
+        title, body = json.loads(bytes(blob))
+        return cls(title, body)
+
+    def length(self, title_boost: int) -> int:
+        """
+        Return number of tokens with title tokens counted `title_boost` times.
+        """
+        return title_boost * sum(self.title.values()) + sum(self.body.values())
+
+    def lemma_frequencies(self, lemmatize, title_boost: int) -> Counter:
+        """
+        Return frequencies of lemmas with title tokens counted `title_boost` times.
+        """
+        frequencies = Counter()
+        for tokens, weight in [(self.title, title_boost), (self.body, 1)]:
+            for token, count in tokens.items():
+                for lemma in set(lemmatize(token)):
+                    frequencies[lemma] += weight * count
+        return frequencies
+
+    def title_matching(self, qlemmas: Set[str], lemmatize) -> int:
+        """
+        Return number of title tokens sharing a lemma with the query.
+        """
+        return sum(
+            count
+            for token, count in self.title.items()
+            if not qlemmas.isdisjoint(lemmatize(token))
+        )
+
+    def exact_matching(self, qtokens: Set[str]) -> int:
+        """
+        Return number of tokens equal to any of the query tokens.
+        """
+        return sum(
+            self.title.get(token, 0) + self.body.get(token, 0) for token in qtokens
+        )
@@ -0,0 +1,455 @@
+import argparse
+import heapq
+import json
+import os
+import shutil
+from bisect import bisect
+from dataclasses import replace
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from tqdm import tqdm
+
+from textmining.cache import CacheStats, LRUCache
+from textmining.corpus import Document, read_documents
+from textmining.features import DocumentFeatures
+from textmining.index import (
+    DEFAULT_POSTINGS_CACHE_SIZE,
+    DEFAULT_RESULTS_CACHE_SIZE,
+    DiskIndex,
+    DiskPositionIndex,
+    Index,
+    PositionIndex,
+)
+from textmining.lemmatization import DEFAULT_CACHE_SIZE, Lemmas
+from textmining.postings import SequenceFrequenciesCursor
+from textmining.ranking import BM25, ScoredTerm, top_k
+from textmining.segment import merge_segments
+from textmining.tokenization import tokenize
+
+DEFAULT_INCREMENTAL_INDEX_DIR = Path("data/incremental_index")
+DEFAULT_BUFFER_SIZE = 10_000
+DEFAULT_MERGE_FACTOR = 10
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+class IncrementalIndex:
+    """
+    Index made of immutable segments on disk and an in-memory buffer.
+
+    New documents are added to the buffer, which is flushed into
+    a new segment when it holds `buffer_size` documents. Deleted
+    documents get tombstones and are dropped when their segments
+    are merged. Queries fan out to all segments and the buffer.
+
+    Document indices run over segments in the order of the manifest
+    and then over the buffer, so merges change them.
+    Changes are persisted by `flush`.
+
+    All segments share one postings cache and one results cache,
+    with keys qualified by the segment, so the memory they take
+    does not grow with the number of segments.
+    """
+
+    def __init__(
+        self,
+        lemmatize,
+        dir: Path = DEFAULT_INCREMENTAL_INDEX_DIR,
+        position: bool = False,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        merge_factor: int = DEFAULT_MERGE_FACTOR,
+        postings_cache_size: int = DEFAULT_POSTINGS_CACHE_SIZE,
+        results_cache_size: int = DEFAULT_RESULTS_CACHE_SIZE,
+    ):
+        self.lemmatize = lemmatize
+        self.dir = dir
+        self.position = position
+        self.buffer_size = buffer_size
+        self.merge_factor = merge_factor
+        self.postings_cache = LRUCache(postings_cache_size)
+        self.results_cache = LRUCache(results_cache_size)
+
+        manifest_path = dir / MANIFEST_FILE
+        entries = []
+        self._next_segment = 0
+        if manifest_path.exists():
+            with manifest_path.open("rt") as f:
+                manifest = json.load(f)
+            if manifest["version"] != MANIFEST_VERSION:
+                raise ValueError(
+                    f"Unsupported manifest version ({manifest['version']})."
+                )
+            if manifest["position"] != position:
+                raise ValueError(f"Index in {dir} has position={manifest['position']}.")
+            entries = manifest["segments"]
+            self._next_segment = manifest["next_segment"]
+        else:
+            dir.mkdir(parents=True, exist_ok=True)
+
+        self.names = [entry["name"] for entry in entries]
+        self.segments = [self._open(name) for name in self.names]
+        self.deleted = [set(entry["deleted"]) for entry in entries]
+        self._new_buffer()
+        self._update_bases()
+
+    def _open(self, name: str):
+        index_cls = DiskPositionIndex if self.position else DiskIndex
+        caches = (self.postings_cache, self.results_cache)
+        return index_cls(self.lemmatize, self.dir / name, caches=caches)
+
+    def _new_buffer(self):
+        index_cls = PositionIndex if self.position else Index
+        self.buffer = index_cls(self.lemmatize)
+        self.buffer_deleted = set()
+
+    def _new_name(self) -> str:
+        name = f"{self._next_segment:06}"
+        self._next_segment += 1
+        return name
+
+    def _update_bases(self):
+        sizes = (len(segment.segment) for segment in self.segments)
+        self._bases = list(accumulate(sizes, initial=0))
+
+    def _save_manifest(self):
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "position": self.position,
+            "next_segment": self._next_segment,
+            "segments": [
+                {"name": name, "deleted": sorted(deleted)}
+                for name, deleted in zip(self.names, self.deleted)
+            ],
+        }
+        tmp_path = self.dir / f"{MANIFEST_FILE}.tmp"
+        with tmp_path.open("wt") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.dir / MANIFEST_FILE)
+
+    def _locate(self, doc_idx: int) -> Tuple[Optional[int], int]:
+        """
+        Return index of the segment of the document (None for the buffer)
+        and index of the document in it.
+        """
+        shard = bisect(self._bases, doc_idx) - 1
+        if shard == len(self.segments):
+            return None, doc_idx - self._bases[-1]
+        return shard, doc_idx - self._bases[shard]
+
+    def __len__(self):
+        n_segments_documents = sum(
+            len(segment.segment) - len(deleted)
+            for segment, deleted in zip(self.segments, self.deleted)
+        )
+        return (
+            n_segments_documents + len(self.buffer.documents) - len(self.buffer_deleted)
+        )
+
+    def add(self, document: Document):
+        self.buffer.add(document)
+        if len(self.buffer.documents) >= self.buffer_size:
+            self.flush()
+
+    def extend(self, documents: Iterable[Document]):
+        for document in documents:
+            self.add(document)
+
+    def find(self, title: str) -> List[int]:
+        """
+        Return indices of live documents with the title.
+        """
+        return [
+            doc_idx
+            for doc_idx in sorted(self._get_docs_idxs(title))
+            if self.load_doc(doc_idx).title == title
+        ]
+
+    def delete(self, title: str) -> int:
+        """
+        Delete documents with the title and return their number.
+        """
+        doc_idxs = self.find(title)
+        for doc_idx in doc_idxs:
+            shard, local_idx = self._locate(doc_idx)
+            if shard is None:
+                self.buffer_deleted.add(local_idx)
+            else:
+                self.deleted[shard].add(local_idx)
+        return len(doc_idxs)
+
+    def update(self, document: Document) -> int:
+        """
+        Replace documents with the title of the document by it
+        and return the number of replaced documents.
+        """
+        n_deleted = self.delete(document.title)
+        self.add(document)
+        return n_deleted
+
+    def flush(self, merge: bool = True):
+        """
+        Write the buffer into a new segment, save the manifest
+        and merge segments if the merge policy says so.
+        """
+        if self.buffer.documents:
+            name = self._new_name()
+            self.buffer.save(self.dir / name, progress=False)
+            self.names.append(name)
+            self.segments.append(self._open(name))
+            self.deleted.append(self.buffer_deleted)
+            self._new_buffer()
+            self._update_bases()
+        self._save_manifest()
+        if merge:
+            self.maybe_merge()
+
+    def merge(self, start: int = 0, end: Optional[int] = None):
+        """
+        Merge segments from start to end into one, dropping deleted documents.
+        """
+        end = len(self.segments) if end is None else end
+        if end <= start:
+            return
+        old_names = self.names[start:end]
+        n_live = sum(
+            len(segment.segment) - len(deleted)
+            for segment, deleted in zip(
+                self.segments[start:end], self.deleted[start:end]
+            )
+        )
+        if n_live:
+            name = self._new_name()
+            merge_segments(
+                [self.dir / old_name for old_name in old_names],
+                self.dir / name,
+                progress=False,
+                deleted=self.deleted[start:end],
+            )
+            self.names[start:end] = [name]
+            self.segments[start:end] = [self._open(name)]
+            self.deleted[start:end] = [set()]
+        else:
+            del self.names[start:end]
+            del self.segments[start:end]
+            del self.deleted[start:end]
+        self._update_bases()
+        self._save_manifest()
+        for old_name in old_names:
+            shutil.rmtree(self.dir / old_name)
+
+    def maybe_merge(self) -> int:
+        """
+        Merge segments according to the merge policy
+        and return the number of merges.
+
+        Segments with more than half of documents deleted are compacted.
+        While there are more than `merge_factor` segments,
+        the `merge_factor` adjacent ones with the fewest documents are merged.
+        """
+        n_merges = 0
+        for shard in reversed(range(len(self.segments))):
+            if 2 * len(self.deleted[shard]) > len(self.segments[shard].segment):
+                self.merge(shard, shard + 1)
+                n_merges += 1
+
+        while len(self.segments) > self.merge_factor:
+            sizes = [
+                len(segment.segment) - len(deleted)
+                for segment, deleted in zip(self.segments, self.deleted)
+            ]
+            starts = range(len(sizes) - self.merge_factor + 1)
+            start = min(
+                starts, key=lambda start: sum(sizes[start : start + self.merge_factor])
+            )
+            self.merge(start, start + self.merge_factor)
+            n_merges += 1
+        return n_merges
+
+    def _fan_out(self, get_docs_idxs) -> Set[int]:
+        """
+        Return live documents found by `get_docs_idxs` in segments and the buffer.
+        """
+        parts = list(zip(self.segments, self.deleted, self._bases))
+        parts.append((self.buffer, self.buffer_deleted, self._bases[-1]))
+        docs_idxs = set()
+        for part, deleted, base in parts:
+            docs_idxs.update(
+                base + doc_idx
+                for doc_idx in get_docs_idxs(part)
+                if doc_idx not in deleted
+            )
+        return docs_idxs
+
+    def _get_docs_idxs(self, query: str) -> Set[int]:
+        query = query.lower()
+        return self._fan_out(lambda part: part._get_docs_idxs(query))
+
+    def _get_near_docs_idxs(self, query: str, k: int, ordered: bool) -> Set[int]:
+        if not self.position:
+            raise ValueError("Proximity queries need an index of positions.")
+        query = query.lower()
+        return self._fan_out(lambda part: part._get_near_docs_idxs(query, k, ordered))
+
+    def load_doc(self, doc_idx: int) -> Document:
+        shard, local_idx = self._locate(doc_idx)
+        if shard is None:
+            doc = replace(self.buffer.documents[local_idx])
+        else:
+            doc = self.segments[shard].load_doc(local_idx)
+        doc.id = doc_idx
+        return doc
+
+    def load_features(self, doc_idx: int) -> DocumentFeatures:
+        shard, local_idx = self._locate(doc_idx)
+        if shard is None:
+            return self.buffer.load_features(local_idx)
+        return self.segments[shard].load_features(local_idx)
+
+    def search(self, query: str) -> List[Document]:
+        docs_idxs = self._get_docs_idxs(query)
+        return [self.load_doc(doc_idx) for doc_idx in sorted(docs_idxs)]
+
+    def cache_stats(self) -> Dict[str, CacheStats]:
+        return {
+            "postings": self.postings_cache.stats(),
+            "results": self.results_cache.stats(),
+        }
+
+    def _collection_bm25(self) -> BM25:
+        n_documents = sum(len(segment.segment) for segment in self.segments)
+        total_length = sum(
+            segment.segment.bm25.avgdl * len(segment.segment)
+            for segment in self.segments
+        )
+        n_documents += len(self.buffer.lengths)
+        total_length += sum(self.buffer.lengths)
+        return BM25(n_documents, total_length / n_documents if n_documents else 0.0)
+
+    def _buffer_scored_term(
+        self, term: str, bm25: BM25, df: int
+    ) -> Optional[ScoredTerm]:
+        postings = self.buffer.inverse_mapping.get(term)
+        if not postings:
+            return None
+        frequencies = self.buffer.frequencies[term]
+        idf = bm25.idf(df)
+        bound = bm25.upper_bound(postings, frequencies, self.buffer.lengths, idf)
+        cursor = SequenceFrequenciesCursor(postings, frequencies)
+        return ScoredTerm(cursor, idf, bound)
+
+    def top_k(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Return indices and BM25 scores of k best documents
+        containing any lemma of the query, best first.
+
+        Documents of all segments and the buffer are scored with
+        the number of documents, their average length and document
+        frequencies of terms of the whole index, as if it were one segment.
+        Like in merges, deleted documents count until they are dropped.
+        """
+        if self.position:
+            raise ValueError("BM25 ranking needs an index of documents.")
+        lemmas = {
+            lemma
+            for token in tokenize(query.lower())
+            for lemma in self.lemmatize(token)
+        }
+        dfs = {
+            lemma: sum(
+                len(segment.segment.get_postings(lemma)) for segment in self.segments
+            )
+            + len(self.buffer.inverse_mapping.get(lemma, ()))
+            for lemma in lemmas
+        }
+        bm25 = self._collection_bm25()
+
+        ranking = []
+        for segment, deleted, base in zip(self.segments, self.deleted, self._bases):
+            terms = [
+                segment.segment.get_scored_term(lemma, bm25, dfs[lemma])
+                for lemma in lemmas
+            ]
+            ranking.extend(
+                (base + doc_idx, score)
+                for doc_idx, score in top_k(
+                    filter(None, terms), k + len(deleted), bm25, segment.segment.lengths
+                )
+                if doc_idx not in deleted
+            )
+        terms = [self._buffer_scored_term(lemma, bm25, dfs[lemma]) for lemma in lemmas]
+        ranking.extend(
+            (self._bases[-1] + doc_idx, score)
+            for doc_idx, score in top_k(
+                filter(None, terms),
+                k + len(self.buffer_deleted),
+                bm25,
+                self.buffer.lengths,
+            )
+            if doc_idx not in self.buffer_deleted
+        )
+        return heapq.nsmallest(k, ranking, key=lambda entry: (-entry[1], entry[0]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--dir", type=Path, default=DEFAULT_INCREMENTAL_INDEX_DIR)
+    parser.add_argument("-p", "--position", action="store_true")
+    parser.add_argument("-b", "--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE)
+    parser.add_argument("-m", "--merge-factor", type=int, default=DEFAULT_MERGE_FACTOR)
+    parser.add_argument("--lemma-cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    add_parser = commands.add_parser("add", help="add documents of a corpus")
+    add_parser.add_argument("input", type=Path)
+    add_parser.add_argument(
+        "-r",
+        "--replace",
+        action="store_true",
+        help="replace documents with the same titles",
+    )
+    delete_parser = commands.add_parser("delete", help="delete documents by title")
+    delete_parser.add_argument("titles", nargs="+")
+    merge_parser = commands.add_parser("merge", help="merge segments")
+    merge_parser.add_argument(
+        "-a", "--all", action="store_true", help="merge all segments into one"
+    )
+    commands.add_parser("info", help="show segments")
+    args = parser.parse_args()
+
+    lemmas = None
+    if args.command in ("add", "delete"):
+        print("Loading lemmas")
+        lemmas = Lemmas.from_file(cache_size=args.lemma_cache_size)
+        print("Lemmas loaded")
+    index = IncrementalIndex(
+        None if lemmas is None else lemmas.lemmatize,
+        args.dir,
+        args.position,
+        args.buffer_size,
+        args.merge_factor,
+    )
+
+    if args.command == "add":
+        n_replaced = 0
+        for document in tqdm(read_documents(args.input)):
+            if args.replace:
+                n_replaced += index.update(document)
+            else:
+                index.add(document)
+        index.flush()
+        print(f"Replaced {n_replaced} documents.")
+    elif args.command == "delete":
+        n_deleted = sum(map(index.delete, args.titles))
+        index.flush()
+        print(f"Deleted {n_deleted} documents.")
+    elif args.command == "merge":
+        if args.all:
+            index.merge()
+        else:
+            print(f"Made {index.maybe_merge()} merges.")
+
+    for name, segment, deleted in zip(index.names, index.segments, index.deleted):
+        print(f"{name}: {len(segment.segment)} documents, {len(deleted)} deleted")
+    print(f"{len(index)} live documents")
@@ -1,150 +1,182 @@
 import argparse
-import hashlib
-import json
-import pickle
-from collections import defaultdict
-from dataclasses import asdict, dataclass
+import multiprocessing as mp
+import sys
+import tempfile
+from array import array
+from collections import defaultdict, deque
+from functools import partial
+from itertools import chain, islice
 from pathlib import Path
-from typing import Set
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from tqdm import tqdm
 
-from textmining.lemmatization import Lemmas
+from textmining.cache import CacheStats, LRUCache, PrefixedCache
+from textmining.corpus import (
+    DEFAULT_CORPUS_PATH,
+    Document,
+    SourceDocuments,
+    read_documents,
+)
+from textmining import instrument
+from textmining.features import DocumentFeatures
+from textmining.lemmatization import DEFAULT_CACHE_SIZE, Lemmas
+from textmining.query import conjunction, near, phrase
+from textmining.postings import (
+    CachedPostingsList,
+    SequenceFrequenciesCursor,
+    group_positions,
+)
+from textmining.ranking import BM25, TITLE_BOOST, ScoredTerm, top_k
+from textmining.segment import (
+    INDEX_KIND,
+    POSITION_INDEX_KIND,
+    Segment,
+    merge_segments,
+    write_segment,
+)
 from textmining.tokenization import tokenize
-import bisect
 
 DEFAULT_INDEX_DIR = Path("data/index")
 DEFAULT_POSITION_INDEX_DIR = Path("data/position_index")
-
-
-def get_hash(word: str):
-    return hashlib.md5(word.encode()).hexdigest()
-
-
-@dataclass
-class Document:
-    title: str
-    content: str
+DEFAULT_POSTINGS_CACHE_SIZE = 64 * 2**20
+DEFAULT_RESULTS_CACHE_SIZE = 16 * 2**20
 
 
 class Index:
-    def __init__(self, lemmatize):
+    def __init__(self, lemmatize, source: Optional[Path] = None):
         self.lemmatize = lemmatize
 
-        self.documents = []
-        self.inverse_mapping = defaultdict(list)
+        self.documents = [] if source is None else SourceDocuments(source)
+        self.features = []
+        self.lengths = array("I")
+        self.inverse_mapping = defaultdict(partial(array, "I"))
+        self.frequencies = defaultdict(partial(array, "I"))
 
     def add(self, document: Document):
         document_idx = len(self.documents)
         self.documents.append(document)
 
-        lemmas = set()
-        for element in [document.title, document.content]:
-            for token in tokenize(element.lower()):
-                lemmas.update(self.lemmatize(token))
+        title_tokens = tokenize(document.title.lower())
+        content_tokens = tokenize(document.content.lower())
+        features = DocumentFeatures.from_tokens(title_tokens, content_tokens)
+        self.features.append(features.encode())
+        self.lengths.append(features.length(TITLE_BOOST))
 
-        for lemma in lemmas:
+        lemma_frequencies = features.lemma_frequencies(self.lemmatize, TITLE_BOOST)
+        for lemma, frequency in lemma_frequencies.items():
             self.inverse_mapping[lemma].append(document_idx)
+            self.frequencies[lemma].append(frequency)
 
-    def _get_docs(self, token):
-        lemmas = self.lemmatize(token)
-        docs = set()
-        for term in lemmas:
-            docs.update(self.inverse_mapping[term])
-        return docs
+    def extend(self, documents: Iterable[Document]):
+        for document in documents:
+            self.add(document)
 
-    def search(self, query: str) -> Set:
-        docs = set()
+    def _get_term_docs(self, term):
+        return self.inverse_mapping.get(term, ())
 
-        tokens = tokenize(query.lower())
-        if tokens:
-            docs = self._get_docs(tokens[0])
-        else:
-            return set()
+    def _get_docs_idxs(self, query: str) -> Set[int]:
+        groups = [
+            [self._get_term_docs(term) for term in self.lemmatize(token)]
+            for token in tokenize(query)
+        ]
+        return set(conjunction(groups))
 
-        for token in tokens[1:]:
-            if docs:
-                docs.intersection_update(self._get_docs(token))
-            else:
-                return docs
-        return docs
+    def load_features(self, doc_idx: int) -> DocumentFeatures:
+        return DocumentFeatures.decode(self.features[doc_idx])
+
+    def search(self, query: str) -> Set:
+        return self._get_docs_idxs(query.lower())
+
+    def top_k(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Return indices and BM25 scores of k best documents
+        containing any lemma of the query, best first.
+        """
+        bm25 = BM25.from_lengths(self.lengths)
+        lemmas = {
+            lemma
+            for token in tokenize(query.lower())
+            for lemma in self.lemmatize(token)
+        }
+        terms = []
+        for lemma in lemmas:
+            postings = self.inverse_mapping.get(lemma)
+            if postings:
+                frequencies = self.frequencies[lemma]
+                cursor = SequenceFrequenciesCursor(postings, frequencies)
+                bound = bm25.upper_bound(postings, frequencies, self.lengths)
+                terms.append(ScoredTerm(cursor, bm25.idf(len(postings)), bound))
+        return top_k(terms, k, bm25, self.lengths)
+
+    def save(self, dir: Path = DEFAULT_INDEX_DIR, progress: bool = True):
+        write_segment(
+            dir,
+            INDEX_KIND,
+            self.inverse_mapping,
+            self.documents,
+            self.features,
+            frequencies=self.frequencies,
+            lengths=self.lengths,
+            progress=progress,
+        )
 
-    def save(self, dir: Path = DEFAULT_INDEX_DIR):
-        dir.mkdir(exist_ok=True)
-
-        index_dir = dir / "index"
-        index_dir.mkdir(exist_ok=True)
-        print("Saving inverse mapping to", index_dir)
-        for lemma, docs_idxs in tqdm(
-            self.inverse_mapping.items(), total=len(self.inverse_mapping)
-        ):
-            with (index_dir / str(get_hash(lemma))).with_suffix(".pickle").open(
-                "wb"
-            ) as f:
-                pickle.dump(docs_idxs, f)
-
-        docs_dir = dir / "docs"
-        docs_dir.mkdir(exist_ok=True)
-        print("Saving docs to", docs_dir)
-        for doc_idx, document in tqdm(
-            enumerate(self.documents), total=len(self.documents)
-        ):
-            with (docs_dir / str(doc_idx)).with_suffix(".json").open("wt") as f:
-                json.dump(asdict(document), f)
 
 class PositionIndex:
-    def __init__(self, lemmatize):
+    def __init__(self, lemmatize, source: Optional[Path] = None):
         self.lemmatize = lemmatize
         self.word_idx = 0
         self.beginnings = []
-        self.documents = []
-        self.inverse_mapping = defaultdict(list)
+        self.documents = [] if source is None else SourceDocuments(source)
+        self.features = []
+        self.inverse_mapping = defaultdict(partial(array, "I"))
 
     def add(self, document: Document):
         self.beginnings.append(self.word_idx)
         self.documents.append(document)
 
-        for element in [document.title, document.content]:
-            for token in tokenize(element.lower()):
-                for lemma in self.lemmatize(token):
-                    self.inverse_mapping[lemma].append(self.word_idx)
-                self.word_idx += 1
-        self.word_idx += 1
+        title_tokens = tokenize(document.title.lower())
+        content_tokens = tokenize(document.content.lower())
+        self.features.append(
+            DocumentFeatures.from_tokens(title_tokens, content_tokens).encode()
+        )
 
-    def _get_term_positions(self, term):
-        return self.inverse_mapping[term]
+        for token in chain(title_tokens, content_tokens):
+            for lemma in self.lemmatize(token):
+                self.inverse_mapping[lemma].append(self.word_idx)
+            self.word_idx += 1
+        self.word_idx += 1
 
-    def _get_positions(self, token):
-        lemmas = self.lemmatize(token)
-        positions = set()
-        for term in lemmas:
-            positions.update(self._get_term_positions(term))
-        return positions
+    def extend(self, documents: Iterable[Document]):
+        for document in documents:
+            self.add(document)
 
+    def _get_term_positions(self, term):
+        return self.inverse_mapping.get(term, ())
 
     def _get_docs_idxs(self, query: str) -> Set[int]:
-        tokens = tokenize(query.lower())
-        if tokens:
-            positions = self._get_positions(tokens[0])
-        else:
-            return set()
-
-        for idx, token in enumerate(tokens[1:], 1):
-            if positions:
-                new_positions = self._get_positions(token)
-                positions.intersection_update({pos - idx for pos in new_positions})
-            else:
-                return set()
-
-        docs_idxs = set()
-        for pos in positions:
-            doc_idx = bisect.bisect(self.beginnings, pos) - 1
-            docs_idxs.add(doc_idx)
-        return docs_idxs
+        groups = [
+            [self._get_term_positions(term) for term in self.lemmatize(token)]
+            for token in tokenize(query.lower())
+        ]
+        return set(phrase(groups, self.beginnings))
+
+    def _get_term_doc_positions(self, term):
+        return group_positions(self._get_term_positions(term), self.beginnings)
+
+    def _get_near_docs_idxs(self, query: str, k: int, ordered: bool) -> Set[int]:
+        groups = [
+            [self._get_term_doc_positions(term) for term in self.lemmatize(token)]
+            for token in tokenize(query.lower())
+        ]
+        return set(near(groups, k, ordered))
 
     def load_doc(self, doc_idx: int) -> Document:
         return self.documents[doc_idx]
 
+    def load_features(self, doc_idx: int) -> DocumentFeatures:
+        return DocumentFeatures.decode(self.features[doc_idx])
+
     def search(self, query: str) -> Set:
         query = query.lower()
         docs_idxs = self._get_docs_idxs(query)
@@ -152,103 +184,185 @@ class PositionIndex:
         docs = [self.load_doc(doc_idx) for doc_idx in sorted(docs_idxs)]
         return docs
 
-    def save(self, dir: Path = DEFAULT_POSITION_INDEX_DIR):
-        dir.mkdir(exist_ok=True)
-
-        index_dir = dir / "index"
-        index_dir.mkdir(exist_ok=True)
-        print("Saving inverse mapping to", index_dir)
-        for lemma, words_idxs in tqdm(
-            self.inverse_mapping.items(), total=len(self.inverse_mapping)
-        ):
-            with (index_dir / str(get_hash(lemma))).with_suffix(".pickle").open(
-                "wb"
-            ) as f:
-                pickle.dump(words_idxs, f)
-
-        docs_dir = dir / "docs"
-        docs_dir.mkdir(exist_ok=True)
-        print("Saving docs to", docs_dir)
-        for doc_idx, document in tqdm(
-            enumerate(self.documents), total=len(self.documents)
-        ):
-            with (docs_dir / str(doc_idx)).with_suffix(".json").open("wt") as f:
-                json.dump(asdict(document), f)
-        beginings_path = dir / "beginings.pickle"
-        print("Saving beginnings to", beginings_path)
-        with beginings_path.open("wb") as f:
-            pickle.dump(self.beginnings, f)
+    def search_near(self, query: str, k: int, ordered: bool = False) -> List:
+        """
+        Return documents with query tokens within a span
+        with at most k other words, in the query order if `ordered`.
+        """
+        docs_idxs = self._get_near_docs_idxs(query.lower(), k, ordered)
+        return [self.load_doc(doc_idx) for doc_idx in sorted(docs_idxs)]
+
+    def save(self, dir: Path = DEFAULT_POSITION_INDEX_DIR, progress: bool = True):
+        write_segment(
+            dir,
+            POSITION_INDEX_KIND,
+            self.inverse_mapping,
+            self.documents,
+            self.features,
+            self.beginnings,
+            self.word_idx,
+            progress=progress,
+        )
+
+
+def _cached_postings(get_postings, cache: LRUCache, term: str, key=None):
+    """
+    Return postings of the term with their decoded blocks kept in the cache
+    under the key, by default the term.
+    """
+    return CachedPostingsList(get_postings(term), cache, term if key is None else key)
+
+
+def _open_caches(
+    dir: Path,
+    postings_cache_size: int,
+    results_cache_size: int,
+    caches: Optional[Tuple[LRUCache, LRUCache]],
+):
+    """
+    Return new postings and results caches of the given sizes,
+    or views of the shared `caches` with keys qualified by the directory.
+    """
+    if caches is None:
+        return LRUCache(postings_cache_size), LRUCache(results_cache_size)
+    return tuple(PrefixedCache(cache, str(dir)) for cache in caches)
+
 
 class DiskPositionIndex(PositionIndex):
-    def __init__(self, lemmatize, dir: Path = DEFAULT_POSITION_INDEX_DIR):
+    def __init__(
+        self,
+        lemmatize,
+        dir: Path = DEFAULT_POSITION_INDEX_DIR,
+        postings_cache_size: int = DEFAULT_POSTINGS_CACHE_SIZE,
+        results_cache_size: int = DEFAULT_RESULTS_CACHE_SIZE,
+        caches: Optional[Tuple[LRUCache, LRUCache]] = None,
+    ):
         self.dir = dir
         self.lemmatize = lemmatize
-        beginings_path = self.dir / "beginings.pickle"
-        with beginings_path.open("rb") as f:
-            self.beginnings = pickle.load(f)
+        self.segment = Segment(dir)
+        self.beginnings = self.segment.load_beginnings()
+        self.postings_cache, self.results_cache = _open_caches(
+            dir, postings_cache_size, results_cache_size, caches
+        )
 
     def _get_term_positions(self, term):
-        index_dir = self.dir / "index"
-        term_filepath = (index_dir / str(get_hash(term))).with_suffix(".pickle")
-        if term_filepath.exists():
-            with term_filepath.open("rb") as f:
-                return pickle.load(f)
-        else:
-            return set()
-
+        return _cached_postings(self.segment.get_postings, self.postings_cache, term)
+
+    def _get_term_doc_positions(self, term):
+        if not self.segment.grouped_positions:
+            return super()._get_term_doc_positions(term)
+        # Documents share the cache with positions of the same terms.
+        docs = _cached_postings(
+            self.segment.get_doc_postings, self.postings_cache, term, ("docs", term)
+        )
+        return docs, self.segment.get_doc_positions(term)
+
+    @instrument.timed("position_index.near")
+    def _get_near_docs_idxs(self, query: str, k: int, ordered: bool) -> Set[int]:
+        lemma_sets = tuple(
+            frozenset(self.lemmatize(token)) for token in tokenize(query.lower())
+        )
+        key = (lemma_sets, k, ordered)
+        docs_idxs = self.results_cache.get(key)
+        instrument.count("results_cache", "misses" if docs_idxs is None else "hits")
+        if docs_idxs is None:
+            groups = [
+                [self._get_term_doc_positions(term) for term in lemmas]
+                for lemmas in lemma_sets
+            ]
+            docs_idxs = array("I", sorted(near(groups, k, ordered)))
+            self.results_cache.put(key, docs_idxs, docs_idxs.itemsize * len(docs_idxs))
+        return set(docs_idxs)
+
+    @instrument.timed("position_index.search")
+    def _get_docs_idxs(self, query: str) -> Set[int]:
+        lemma_sets = tuple(
+            frozenset(self.lemmatize(token)) for token in tokenize(query.lower())
+        )
+        docs_idxs = self.results_cache.get(lemma_sets)
+        instrument.count("results_cache", "misses" if docs_idxs is None else "hits")
+        if docs_idxs is None:
+            groups = [
+                [self._get_term_positions(term) for term in lemmas]
+                for lemmas in lemma_sets
+            ]
+            docs_idxs = array("I", sorted(phrase(groups, self.beginnings)))
+            self.results_cache.put(
+                lemma_sets, docs_idxs, docs_idxs.itemsize * len(docs_idxs)
+            )
+        return set(docs_idxs)
+
+    def cache_stats(self) -> Dict[str, CacheStats]:
+        return {
+            "postings": self.postings_cache.stats(),
+            "results": self.results_cache.stats(),
+        }
+
+    @instrument.timed("position_index.load_doc")
     def load_doc(self, doc_idx: int) -> Document:
-        doc_dir = self.dir / "docs"
-        doc_filepath = (doc_dir / str(doc_idx)).with_suffix(".json")
-        with doc_filepath.open("rt") as f:
-            doc = Document(**json.load(f))
-            doc.id = doc_idx
-            return doc
+        doc = self.segment.load_document(doc_idx)
+        doc.id = doc_idx
+        return doc
+
+    def load_features(self, doc_idx: int) -> DocumentFeatures:
+        return self.segment.load_features(doc_idx)
+
 
 class DiskIndex:
-    def __init__(self, lemmatize, dir: Path = DEFAULT_INDEX_DIR):
+    """
+    Index opened from a segment.
+
+    Decoded blocks of postings and results of queries are kept in LRU caches
+    bounded by their sizes in bytes. Results are keyed by
+    the sets of lemmas of query tokens, so queries differing
+    only in token order or inflection share them.
+    Indexes of several segments can share a pair of `caches`
+    instead of having caches of their own.
+    """
+
+    def __init__(
+        self,
+        lemmatize,
+        dir: Path = DEFAULT_INDEX_DIR,
+        postings_cache_size: int = DEFAULT_POSTINGS_CACHE_SIZE,
+        results_cache_size: int = DEFAULT_RESULTS_CACHE_SIZE,
+        caches: Optional[Tuple[LRUCache, LRUCache]] = None,
+    ):
         self.lemmatize = lemmatize
         self.dir = dir
+        self.segment = Segment(dir)
+        self.postings_cache, self.results_cache = _open_caches(
+            dir, postings_cache_size, results_cache_size, caches
+        )
 
     def _get_term_docs(self, term):
-        index_dir = self.dir / "index"
-        term_filepath = (index_dir / str(get_hash(term))).with_suffix(".pickle")
-        if term_filepath.exists():
-            with term_filepath.open("rb") as f:
-                return pickle.load(f)
-        else:
-            return set()
-
-    def _get_token_docs_idxs(self, token):
-        lemmas = self.lemmatize(token)
-        docs = set()
-        for term in lemmas:
-            term_docs = self._get_term_docs(term)
-            docs.update(term_docs)
-        return docs
+        return _cached_postings(self.segment.get_postings, self.postings_cache, term)
 
+    @instrument.timed("index.search")
     def _get_docs_idxs(self, query: str) -> Set[int]:
-        docs_idxs = set()
-
-        tokens = tokenize(query)
-        if tokens:
-            docs_idxs = self._get_token_docs_idxs(tokens[0])
-        else:
-            return set()
-
-        for token in tokens[1:]:
-            if docs_idxs:
-                docs_idxs.intersection_update(self._get_token_docs_idxs(token))
-            else:
-                return docs_idxs
-        return docs_idxs
-
+        lemma_sets = frozenset(
+            frozenset(self.lemmatize(token)) for token in tokenize(query)
+        )
+        docs_idxs = self.results_cache.get(lemma_sets)
+        instrument.count("results_cache", "misses" if docs_idxs is None else "hits")
+        if docs_idxs is None:
+            groups = [
+                [self._get_term_docs(term) for term in lemmas] for lemmas in lemma_sets
+            ]
+            docs_idxs = array("I", sorted(conjunction(groups)))
+            self.results_cache.put(
+                lemma_sets, docs_idxs, docs_idxs.itemsize * len(docs_idxs)
+            )
+        return set(docs_idxs)
+
+    @instrument.timed("index.load_doc")
     def load_doc(self, doc_idx: int) -> Document:
-        doc_dir = self.dir / "docs"
-        doc_filepath = (doc_dir / str(doc_idx)).with_suffix(".json")
-        with doc_filepath.open("rt") as f:
-            doc = Document(**json.load(f))
-            doc.id = doc_idx
-            return doc
+        doc = self.segment.load_document(doc_idx)
+        doc.id = doc_idx
+        return doc
+
+    def load_features(self, doc_idx: int) -> DocumentFeatures:
+        return self.segment.load_features(doc_idx)
 
     def search(self, query: str) -> Set:
         query = query.lower()
@@ -257,13 +371,111 @@ class DiskIndex:
         docs = [self.load_doc(doc_idx) for doc_idx in sorted(docs_idxs)]
         return docs
 
+    @instrument.timed("index.top_k")
+    def top_k(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Return indices and BM25 scores of k best documents
+        containing any lemma of the query, best first.
+        """
+        lemmas = frozenset(
+            lemma
+            for token in tokenize(query.lower())
+            for lemma in self.lemmatize(token)
+        )
+        key = (lemmas, k)
+        ranking = self.results_cache.get(key)
+        instrument.count("results_cache", "misses" if ranking is None else "hits")
+        if ranking is None:
+            terms = filter(None, map(self.segment.get_scored_term, lemmas))
+            ranking = tuple(top_k(terms, k, self.segment.bm25, self.segment.lengths))
+            # Every (index, score) pair takes about 64 bytes.
+            self.results_cache.put(
+                key, ranking, sys.getsizeof(ranking) + 64 * len(ranking)
+            )
+        return list(ranking)
+
+    def cache_stats(self) -> Dict[str, CacheStats]:
+        return {
+            "postings": self.postings_cache.stats(),
+            "results": self.results_cache.stats(),
+        }
+
+
+def _batches(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Set in the parent before forking, so workers share it copy-on-write.
+_shard_lemmatize = None
+
+
+def _build_shard(job) -> Path:
+    position, source, output, documents = job
+    index_cls = PositionIndex if position else Index
+    index = index_cls(_shard_lemmatize, source)
+    index.extend(documents)
+    index.save(output, progress=False)
+    return output
+
+
+def build_parallel(
+    documents: Iterable[Document],
+    output: Path,
+    lemmatize,
+    position: bool = False,
+    workers: int = mp.cpu_count(),
+    shard_size: int = 10_000,
+    source: Optional[Path] = None,
+):
+    """
+    Build index of documents in a pool of forked workers.
+
+    Every worker indexes a shard of `shard_size` consecutive documents
+    into a temporary segment. At most two shards per worker are in flight,
+    so the input is streamed. Shards are merged in input order,
+    which keeps document indices the same as in a sequential build.
+
+    If `source` is given, documents are stored as offsets into it.
+    """
+    global _shard_lemmatize
+    _shard_lemmatize = lemmatize
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=output.parent) as tmp_dir:
+        jobs = (
+            (position, source, Path(tmp_dir) / f"{shard_idx:06}", shard)
+            for shard_idx, shard in enumerate(_batches(documents, shard_size))
+        )
+        shards = []
+        pending = deque()
+        with mp.get_context("fork").Pool(workers) as pool:
+            for job in jobs:
+                pending.append(pool.apply_async(_build_shard, (job,)))
+                if len(pending) >= 2 * workers:
+                    shards.append(pending.popleft().get())
+            while pending:
+                shards.append(pending.popleft().get())
+
+        print(f"Merging {len(shards)} shards")
+        merge_segments(shards, output)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", type=Path, default=DEFAULT_CORPUS_PATH)
     parser.add_argument("-o", "--output", type=Path, default=None)
     parser.add_argument("-f", "--force", action="store_true")
     parser.add_argument("-p", "--position", action="store_true")
-
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("-s", "--shard-size", type=int, default=10_000)
+    parser.add_argument(
+        "--copy-docs",
+        action="store_true",
+        help="store documents in the index instead of offsets into the input",
+    )
+    parser.add_argument("--lemma-cache-size", type=int, default=DEFAULT_CACHE_SIZE)
 
     args = parser.parse_args()
 
@@ -275,29 +487,37 @@ if __name__ == "__main__":
     else:
         output = args.output
 
+    if args.copy_docs or args.input.suffix == ".gz":
+        source = None
+    else:
+        source = args.input
+
     if args.force or not output.exists():
         print("Loading lemmas")
-        lemmas = Lemmas.from_file()
+        lemmas = Lemmas.from_file(cache_size=args.lemma_cache_size)
         print("Lemmas loaded")
 
-        if args.position:
-            index = PositionIndex(lemmas.lemmatize)
+        documents = tqdm(read_documents(args.input))
+        if args.workers > 1:
+            build_parallel(
+                documents,
+                output,
+                lemmas.lemmatize,
+                args.position,
+                args.workers,
+                args.shard_size,
+                source,
+            )
+            print("Index saved")
         else:
-            index = Index(lemmas.lemmatize)
-
-        with open("data/fp_wiki.txt", "rt") as f:
-            lines = iter(tqdm(f.readlines()))
-            try:
-                while (first_line := next(lines)).startswith("TITLE: "):
-                    title = next(lines).strip()
-                    content_lines = []
-                    while l := next(lines).strip():
-                        content_lines.append(l)
-                    content = " ".join(content_lines)
-                    document = Document(title, content)
-                    index.add(document)
-            except StopIteration:
-                print("Index created")
+            if args.position:
+                index = PositionIndex(lemmas.lemmatize, source)
+            else:
+                index = Index(lemmas.lemmatize, source)
+            index.extend(documents)
+            print("Index created")
+
+            print("Lemma cache:", lemmas.cache_stats())
 
             print("Saving index")
             index.save(output)
@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_enabled = False
+_lock = threading.Lock()
+_stages: Dict[str, "_Stage"] = {}
+_events: Optional[List[Dict]] = None
+_origin = time.perf_counter()
+
+
+class _Stage:
+    __slots__ = ("calls", "seconds", "counters")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.counters = {}
+
+
+def _stage(name: str) -> _Stage:
+    stage = _stages.get(name)
+    if stage is None:
+        stage = _stages.setdefault(name, _Stage())
+    return stage
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        with _lock:
+            stage = _stage(self.name)
+            stage.calls += 1
+            stage.seconds += end - self.start
+            if _events is not None:
+                _events.append(
+                    {
+                        "name": self.name,
+                        "ph": "X",
+                        "ts": (self.start - _origin) * 1e6,
+                        "dur": (end - self.start) * 1e6,
+                        "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                    }
+                )
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str):
+    """
+    Return context manager timing its block as the stage.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def timed(name: str):
+    """
+    Decorate function to time its calls as the stage.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Timer(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, counter: str, n: int = 1):
+    """
+    Add n to the counter of the stage.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        counters = _stage(name).counters
+        counters[counter] = counters.get(counter, 0) + n
+
+
+def enable(trace: bool = False):
+    """
+    Start collecting statistics, and trace events if `trace` is set.
+
+    While disabled, timers and counters cost one check of a global flag.
+    Every stage gets its number of calls, total seconds and named
+    counters, e.g. bytes read or cache hits. Times of nested stages
+    are included in times of outer ones. Statistics are per process.
+    """
+    global _enabled, _events
+    if trace and _events is None:
+        _events = []
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    """
+    Forget collected statistics and trace events.
+    """
+    with _lock:
+        _stages.clear()
+        if _events is not None:
+            _events.clear()
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    """
+    Return calls, seconds and counters of every stage.
+    """
+    with _lock:
+        return {
+            name: {"calls": stage.calls, "seconds": stage.seconds, **stage.counters}
+            for name, stage in _stages.items()
+        }
+
+
+def summary() -> str:
+    """
+    Return table of stages, the slowest first.
+    """
+    lines = [f"{'stage':<28} {'calls':>8} {'total s':>9} {'mean ms':>9}  counters"]
+    for name, stage_stats in sorted(
+        stats().items(), key=lambda item: item[1]["seconds"], reverse=True
+    ):
+        calls = stage_stats.pop("calls")
+        seconds = stage_stats.pop("seconds")
+        mean_ms = 1000 * seconds / calls if calls else 0.0
+        counters = " ".join(f"{key}={value}" for key, value in stage_stats.items())
+        lines.append(
+            f"{name:<28} {calls:>8} {seconds:>9.3f} {mean_ms:>9.3f}  {counters}"
+        )
+    return "\n".join(lines)
+
+
+def write_trace(path: Path):
+    """
+    Write stages statistics and trace events in the Chrome trace format,
+    which can be opened in chrome://tracing or Perfetto.
+    """
+    with _lock:
+        events = list(_events or [])
+    with path.open("wt") as f:
+        json.dump({"traceEvents": events, "stages": stats()}, f)
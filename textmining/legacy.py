@@ -0,0 +1,81 @@
+import argparse
+import hashlib
+import json
+import pickle
+from pathlib import Path
+from typing import Iterator, Tuple
+
+from tqdm import tqdm
+
+from textmining.corpus import Document
+from textmining.index import Index, PositionIndex
+from textmining.lemmatization import Lemmas
+from textmining.segment import META_FILE
+
+
+def get_hash(word: str):
+    return hashlib.md5(word.encode()).hexdigest()
+
+
+def _read_legacy_documents(dir: Path) -> Iterator[Document]:
+    docs_dir = dir / "docs"
+    doc_idx = 0
+    while (doc_filepath := (docs_dir / str(doc_idx)).with_suffix(".json")).exists():
+        with doc_filepath.open("rt") as f:
+            yield Document(**json.load(f))
+        doc_idx += 1
+
+
+def _load_legacy(path: Path):
+    if not path.exists():
+        return None
+    with path.open("rb") as f:
+        return pickle.load(f)
+
+
+def convert_legacy(dir: Path, output: Path, lemmatize) -> Tuple[int, int]:
+    """
+    Convert index saved as one pickle file per lemma
+    and one JSON file per document into a segment.
+
+    The stored documents are indexed again, which also gives
+    their features and frequencies of terms. Legacy postings,
+    in files named by lemma hashes, have to match the new ones,
+    so the index has to be converted with the lemmatizer it was built with.
+    """
+    beginings_path = dir / "beginings.pickle"
+    index_cls = PositionIndex if beginings_path.exists() else Index
+    index = index_cls(lemmatize)
+    print("Reading docs from", dir / "docs")
+    index.extend(tqdm(_read_legacy_documents(dir)))
+
+    print("Checking inverse mapping in", dir / "index")
+    for term, postings in tqdm(index.inverse_mapping.items()):
+        legacy_postings = _load_legacy(
+            (dir / "index" / get_hash(term)).with_suffix(".pickle")
+        )
+        if legacy_postings is None or list(legacy_postings) != list(postings):
+            raise ValueError(f"Postings of {term!r} differ from the legacy index.")
+    if index_cls is PositionIndex:
+        if list(_load_legacy(beginings_path)) != index.beginnings:
+            raise ValueError("Beginnings of documents differ from the legacy index.")
+
+    index.save(output)
+    return len(index.inverse_mapping), len(index.documents)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", type=Path)
+    parser.add_argument("-o", "--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    output = args.input if args.output is None else args.output
+    if (output / META_FILE).exists():
+        print("Index already converted.")
+    else:
+        print("Loading lemmas")
+        lemmas = Lemmas.from_file()
+        print("Lemmas loaded")
+        n_terms, n_documents = convert_legacy(args.input, output, lemmas.lemmatize)
+        print(f"Converted {n_terms} terms and {n_documents} documents.")
@@ -1,74 +1,297 @@
 import argparse
 import json
+import mmap
 import pickle
-from collections import defaultdict
+import struct
+import time
+from array import array
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import accumulate
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
+
+from textmining.cache import CacheStats, lru_cache_stats
 
 DEFAULT_POLIMORFIK_PATH = Path("data/polimorfologik-2.1/polimorfologik-2.1.txt")
-DEFAULT_LEMMAS_PATH = Path("data/lemmas.pickle")
+DEFAULT_LEMMAS_PATH = Path("data/lemmas.bin")
+DEFAULT_CACHE_SIZE = 2**18
+
+_MAGIC = b"LEMMAS01"
+_HEADER = struct.Struct("<8sII")
+
+
+def _encode_strings(strings: Iterable[str]) -> Tuple[array, bytes]:
+    encoded = [string.encode() for string in strings]
+    return array("I", accumulate(map(len, encoded), initial=0)), b"".join(encoded)
+
+
+def _write_compact(
+    filepath: Path,
+    words: Sequence[str],
+    lemma_ids_offsets,
+    lemma_ids,
+    lemmas: Sequence[str],
+):
+    """
+    Write compact lemmas dictionary.
+
+    Words have to be sorted. Lemmas of the i-th word are
+    `lemmas[j]` for j in `lemma_ids[lemma_ids_offsets[i]:lemma_ids_offsets[i + 1]]`.
+    Both of these arrays have to be contiguous buffers of uint32.
+    """
+    word_offsets, words_blob = _encode_strings(words)
+    lemma_offsets, lemmas_blob = _encode_strings(lemmas)
+
+    with filepath.open("wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(words), len(lemmas)))
+        f.write(word_offsets)
+        f.write(lemma_ids_offsets)
+        f.write(lemma_offsets)
+        f.write(lemma_ids)
+        f.write(words_blob)
+        f.write(lemmas_blob)
+
+
+def write_compact(filepath: Path, words_to_lemmas: Dict[str, List[str]]):
+    lemmas_ids = {}
+    lemma_ids_offsets = array("I", [0])
+    lemma_ids = array("I")
+    words = sorted(words_to_lemmas)
+    for word in words:
+        for lemma in words_to_lemmas[word]:
+            lemma_ids.append(lemmas_ids.setdefault(lemma, len(lemmas_ids)))
+        lemma_ids_offsets.append(len(lemma_ids))
+    _write_compact(filepath, words, lemma_ids_offsets, lemma_ids, list(lemmas_ids))
+
+
+class CompactLemmasDict:
+    """
+    Read-only, memory-mapped mapping from words to their lemmas.
+
+    Words are kept in a sorted table searched by bisection
+    and lemmas are interned, so every word maps to an array of lemma ids.
+    Opening the file is instant and its pages are shared between processes.
+    """
+
+    def __init__(self, filepath: Path):
+        with filepath.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_words, n_lemmas = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a compact lemmas file ({filepath}).")
+
+        view = memoryview(self._mmap)
+        position = _HEADER.size
+
+        def take(n: int, format: str = "I"):
+            nonlocal position
+            start = position
+            position += 4 * n if format == "I" else n
+            return view[start:position].cast(format)
+
+        self._word_offsets = take(n_words + 1)
+        self._lemma_ids_offsets = take(n_words + 1)
+        self._lemma_offsets = take(n_lemmas + 1)
+        self._lemma_ids = take(self._lemma_ids_offsets[-1])
+        self._words_start = position
+        position += self._word_offsets[-1]
+        self._lemmas_start = position
+
+    def __len__(self):
+        return len(self._word_offsets) - 1
+
+    def _word(self, word_idx: int) -> bytes:
+        return self._mmap[
+            self._words_start
+            + self._word_offsets[word_idx] : self._words_start
+            + self._word_offsets[word_idx + 1]
+        ]
+
+    def _lemma(self, lemma_id: int) -> str:
+        return self._mmap[
+            self._lemmas_start
+            + self._lemma_offsets[lemma_id] : self._lemmas_start
+            + self._lemma_offsets[lemma_id + 1]
+        ].decode()
+
+    def _find(self, word: str) -> int:
+        key = word.encode()
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._word(lo) == key:
+            return lo
+        return -1
+
+    def _lemmas(self, word_idx: int) -> List[str]:
+        return [
+            self._lemma(lemma_id)
+            for lemma_id in self._lemma_ids[
+                self._lemma_ids_offsets[word_idx] : self._lemma_ids_offsets[
+                    word_idx + 1
+                ]
+            ]
+        ]
+
+    def get(self, word: str, default=None):
+        word_idx = self._find(word)
+        if word_idx == -1:
+            return default
+        return self._lemmas(word_idx)
+
+    def __contains__(self, word: str) -> bool:
+        return self._find(word) != -1
+
+    def __getitem__(self, word: str) -> List[str]:
+        word_idx = self._find(word)
+        if word_idx == -1:
+            raise KeyError(word)
+        return self._lemmas(word_idx)
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        for word_idx in range(len(self)):
+            yield self._word(word_idx).decode(), self._lemmas(word_idx)
 
 
 class Lemmas:
-    def __init__(self, lemmas_dict):
+    def __init__(self, lemmas_dict, cache_size: int = DEFAULT_CACHE_SIZE):
         self._words_to_lemmas = lemmas_dict
+        self._cached_lemmatize = lru_cache(maxsize=cache_size)(self._lemmatize)
+
+    def _lemmatize(self, word: str) -> Tuple[str, ...]:
+        return tuple(self._words_to_lemmas.get(word, (word,)))
+
+    def lemmatize(self, word: str) -> Tuple[str, ...]:
+        """
+        Return lemmas of the word or the word itself if it is unknown.
+
+        Results are kept in a bounded LRU cache,
+        see `cache_stats` for its effectiveness.
+        """
+        return self._cached_lemmatize(word)
 
-    def lemmatize(self, word: str):
-        return self._words_to_lemmas.get(word, [word])
+    def cache_stats(self) -> CacheStats:
+        return lru_cache_stats(self._cached_lemmatize)
 
     def save(self, filepath: Path = DEFAULT_LEMMAS_PATH):
         if filepath.suffix == ".json":
             self._save_json(filepath)
         elif filepath.suffix == ".pickle":
             self._save_pickle(filepath)
+        elif filepath.suffix == ".bin":
+            self._save_bin(filepath)
         else:
             raise ValueError(f"Unsupported suffix ({filepath.suffix}).")
 
     def _save_json(self, filepath: Path):
         with filepath.open("wt") as f:
-            json.dump(self._words_to_lemmas, f)
+            json.dump(dict(self._words_to_lemmas.items()), f)
 
     def _save_pickle(self, filepath: Path):
         with filepath.open("wb") as f:
-            pickle.dump(self._words_to_lemmas, f)
+            pickle.dump(dict(self._words_to_lemmas.items()), f)
+
+    def _save_bin(self, filepath: Path):
+        write_compact(filepath, dict(self._words_to_lemmas.items()))
 
     @classmethod
-    def from_file(cls, filepath: Path = DEFAULT_LEMMAS_PATH):
+    def from_file(
+        cls,
+        filepath: Path = DEFAULT_LEMMAS_PATH,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
         if filepath.suffix == ".json":
-            return cls._from_json(filepath)
+            return cls._from_json(filepath, cache_size)
         elif filepath.suffix == ".pickle":
-            return cls._from_pickle(filepath)
+            return cls._from_pickle(filepath, cache_size)
+        elif filepath.suffix == ".bin":
+            return cls._from_bin(filepath, cache_size)
         else:
             raise ValueError(f"Unsupported suffix ({filepath.suffix}).")
 
     @classmethod
-    def _from_json(cls, filepath: Path):
+    def _from_json(cls, filepath: Path, cache_size: int):
         with filepath.open("rt") as f:
-            return cls(json.load(f))
+            return cls(json.load(f), cache_size)
 
     @classmethod
-    def _from_pickle(cls, filepath: Path):
+    def _from_pickle(cls, filepath: Path, cache_size: int):
         with filepath.open("rb") as f:
-            return cls(pickle.load(f))
+            return cls(pickle.load(f), cache_size)
+
+    @classmethod
+    def _from_bin(cls, filepath: Path, cache_size: int):
+        return cls(CompactLemmasDict(filepath), cache_size)
 
     @classmethod
     def from_polimorfik(cls, filepath: Path = DEFAULT_POLIMORFIK_PATH):
         return cls(create_dict(filepath))
 
 
+@contextmanager
+def _report(stage: str):
+    start = time.perf_counter()
+    print(f"{stage}...", end=" ", flush=True)
+    yield
+    print(f"{time.perf_counter() - start:.2f}s")
+
+
 def get_lemmas_df(filepath: Path = DEFAULT_POLIMORFIK_PATH) -> pd.DataFrame:
-    return pd.read_csv(filepath, sep=";", names=["lemma", "word"], usecols=[0, 1])
+    return pd.read_csv(
+        filepath,
+        sep=";",
+        names=["lemma", "word"],
+        usecols=[0, 1],
+        dtype=str,
+        keep_default_na=False,
+    )
+
+
+def get_pairs_df(filepath: Path = DEFAULT_POLIMORFIK_PATH) -> pd.DataFrame:
+    """
+    Return unique, lowercased (word, lemma) pairs
+    in order of their first occurrence.
+    """
+    with _report(f"Reading {filepath}"):
+        df = get_lemmas_df(filepath)
+    with _report(f"Normalizing {len(df)} rows"):
+        df["word"] = df["word"].str.lower()
+        df["lemma"] = df["lemma"].str.lower()
+        df = df.drop_duplicates(ignore_index=True)
+    return df
 
 
 def create_dict(filepath: Path = DEFAULT_POLIMORFIK_PATH) -> Dict:
-    df = get_lemmas_df(filepath)
-    d = defaultdict(list)
-    for _, row in tqdm(df.iterrows(), total=len(df)):
-        d[row["word"].lower()].append(row["lemma"].lower())
-    return d
+    df = get_pairs_df(filepath)
+    with _report(f"Grouping {len(df)} pairs"):
+        return df.groupby("word", sort=False)["lemma"].agg(list).to_dict()
+
+
+def create_compact(
+    filepath: Path = DEFAULT_POLIMORFIK_PATH, output: Path = DEFAULT_LEMMAS_PATH
+):
+    """
+    Write compact lemmas dictionary straight from polimorfologik,
+    without building a Python dict.
+    """
+    df = get_pairs_df(filepath)
+    with _report(f"Interning {len(df)} pairs"):
+        lemma_codes, lemmas = pd.factorize(df["lemma"])
+        word_codes, words = pd.factorize(df["word"], sort=True)
+        order = np.argsort(word_codes, kind="stable")
+        lemma_ids = lemma_codes[order].astype(np.uint32)
+        counts = np.bincount(word_codes, minlength=len(words))
+        lemma_ids_offsets = np.r_[0, np.cumsum(counts)].astype(np.uint32)
+    with _report(f"Writing {len(words)} words to {output}"):
+        _write_compact(output, words, lemma_ids_offsets, lemma_ids, lemmas)
 
 
 if __name__ == "__main__":
@@ -79,8 +302,12 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
     if args.force or not args.output.exists():
-        lemmas = Lemmas.from_polimorfik(args.input)
-        lemmas.save(args.output)
+        if args.input.suffix in {".json", ".pickle", ".bin"}:
+            Lemmas.from_file(args.input).save(args.output)
+        elif args.output.suffix == ".bin":
+            create_compact(args.input, args.output)
+        else:
+            Lemmas.from_polimorfik(args.input).save(args.output)
     else:
         print("Lemmas dictionary already exists.")
         print("Use -f/--force flag to force recreation.")
@@ -1,61 +1,226 @@
-from itertools import product
+import argparse
 import multiprocessing as mp
-import editdistance
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
 from tqdm import tqdm
 
+from textmining import instrument
+from textmining.editdist import Matcher
 from textmining.index import DiskIndex
 from textmining.lemmatization import Lemmas
 from textmining.search import SearchEngine
 from textmining.tokenization import tokenize
 from textmining.proverbs import ProverbsHandler
 
-lemmas = Lemmas.from_file()
-index = DiskIndex(lemmas.lemmatize)
-se = SearchEngine(index)
-proverbs_handler = ProverbsHandler(lemmas)
+DEFAULT_QUESTIONS_PATH = Path("data/poleval/pytania.txt")
+DEFAULT_ANSWERS_PATH = Path("data/poleval/odpowiedzi_solution.txt")
+
+# Number of best BM25 documents checked for a title unlike the question.
+RANKED_K = 50
+
+NO_ANSWER = "nie mam pojęcia, sorry"
+
+
+@dataclass
+class State:
+    """
+    Read-only state shared by all answered questions.
+    """
+
+    lemmas: Lemmas
+    index: DiskIndex
+    se: SearchEngine
+    proverbs_handler: ProverbsHandler
+
 
+_state: Optional[State] = None
 
-def scaled_editdist(ans, cor):
-    ans = ans.lower()
-    cor = cor.lower()
 
-    return editdistance.eval(ans, cor) / len(cor)
+def load_state() -> State:
+    """
+    Load lemmas, index and proverbs once per process.
 
+    Batch answering loads them before forking workers,
+    so the workers share them copy-on-write.
+    """
+    global _state
+    if _state is None:
+        lemmas = Lemmas.from_file()
+        index = DiskIndex(lemmas.lemmatize)
+        _state = State(lemmas, index, SearchEngine(index), ProverbsHandler(lemmas))
+    return _state
 
-def answer(question):
-    question = question.strip()
-    question_tokens = [token for token in tokenize(question.lower()) if len(token) > 1]
-    if question_tokens[0] == "czy":
-        return "Tak"
-    proverbs_answer = proverbs_handler.handle_proverb_question(question)
-    if proverbs_answer is not None:
-        return proverbs_answer
-    while question_tokens:
-        query = " ".join(question_tokens)
 
-        for doc in se.search(query, color=False):
+def _search_answer(se: SearchEngine, question_tokens: List[str]) -> str:
+    query = " ".join(question_tokens)
+    # Titles resembling the question name its subject, not the answer.
+    matcher = Matcher(question_tokens)
+    # Documents are ranked and loaded lazily, until a title is accepted.
+    results = se.results(query, ranked=True, color=False)
+    with instrument.timer("answer.search"):
+        for doc in islice(results, RANKED_K):
+            instrument.count("answer.title_filter", "titles")
             result = doc.title
             res_tokens = tokenize(result.lower())
 
-            for t1, t2 in product(res_tokens, question_tokens):
-                if scaled_editdist(t1, t2) <= 0.5:
-                    break
-            else:
+            if not any(map(matcher.matches_any, res_tokens)):
                 paren_index = result.find("(")
                 if paren_index != -1:
                     result = result[:paren_index]
                 return result
+    return NO_ANSWER
+
+
+@instrument.timed("answer")
+def answer_chunk(
+    questions: List[str], state: Optional[State] = None
+) -> List[Tuple[str, Dict[str, float]]]:
+    """
+    Return answers to the questions and seconds spent
+    in every stage of answering each of them.
+
+    Proverb questions of the chunk go through BERT in batches,
+    so their time is split evenly between them.
+    The state is loaded once per process if it is not given.
+    """
+    state = load_state() if state is None else state
+    questions = [question.strip() for question in questions]
+    results = [None] * len(questions)
+    questions_tokens = []
+    for idx, question in enumerate(questions):
+        question_tokens = [
+            token for token in tokenize(question.lower()) if len(token) > 1
+        ]
+        questions_tokens.append(question_tokens)
+        if question_tokens and question_tokens[0] == "czy":
+            results[idx] = ("Tak", {})
+
+    unanswered = [idx for idx, result in enumerate(results) if result is None]
+    if not unanswered:
+        return results
+    start = time.perf_counter()
+    proverbs_answers = state.proverbs_handler.handle_proverb_questions(
+        [questions[idx] for idx in unanswered]
+    )
+    proverbs_seconds = (time.perf_counter() - start) / len(unanswered)
+
+    for idx, proverbs_answer in zip(unanswered, proverbs_answers):
+        timings = {"proverbs": proverbs_seconds}
+        if proverbs_answer is None:
+            start = time.perf_counter()
+            proverbs_answer = _search_answer(state.se, questions_tokens[idx])
+            timings["search"] = time.perf_counter() - start
+        results[idx] = (proverbs_answer, timings)
+    return results
+
 
-        # if answer not found, remove first token of query
-        del question_tokens[0]
-    return "nie mam pojęcia, sorry"
+def answer(question: str) -> str:
+    return answer_chunk([question])[0][0]
+
+
+def _init_worker():
+    # Workers run side by side, so each of them should use one core.
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(1)
+
+
+def answer_batch(
+    questions: Iterable[str], workers: int = mp.cpu_count(), chunksize: int = 16
+) -> Iterator[Tuple[str, Dict[str, float]]]:
+    """
+    Yield answers to the questions with their stage timings, in input order.
+
+    The state, with the BERT model, is loaded before a pool
+    of workers is forked, and questions are streamed to them
+    in chunks of `chunksize`, answered in one batch each.
+    """
+    load_state().proverbs_handler.answerer.load()
+    questions = iter(questions)
+    chunks = iter(lambda: list(islice(questions, chunksize)), [])
+    if workers <= 1:
+        for results in map(answer_chunk, chunks):
+            yield from results
+        return
+    with mp.get_context("fork").Pool(workers, initializer=_init_worker) as pool:
+        for results in pool.imap(answer_chunk, chunks):
+            yield from results
+
+
+def summarize(
+    stages_timings: Iterable[Dict[str, float]], n_questions: int, elapsed: float
+) -> str:
+    """
+    Return report with the number of questions, time and throughput of every stage.
+
+    Stage times are summed over workers, so their throughput
+    is given per worker.
+    """
+    counts = defaultdict(int)
+    seconds = defaultdict(float)
+    for timings in stages_timings:
+        for stage, stage_seconds in timings.items():
+            counts[stage] += 1
+            seconds[stage] += stage_seconds
+    lines = [
+        f"total: {n_questions} questions in {elapsed:.1f}s "
+        f"({n_questions / elapsed if elapsed else 0.0:.2f} questions/s)"
+    ]
+    for stage in sorted(counts):
+        throughput = counts[stage] / seconds[stage] if seconds[stage] else 0.0
+        lines.append(
+            f"{stage}: {counts[stage]} questions in {seconds[stage]:.1f}s "
+            f"({throughput:.2f} questions/s per worker)"
+        )
+    return "\n".join(lines)
 
 
 if __name__ == "__main__":
-    with open("data/poleval/odpowiedzi_solution.txt", "wt") as o:
-        with open("data/poleval/pytania.txt", "rt") as i:
-            for a in tqdm(map(answer, i.readlines())):
-            # with mp.Pool(6) as p:
-            #     for a in tqdm(p.imap(answer, i.readlines())):
-                o.write(a)
-                o.write("\n")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", type=Path, default=DEFAULT_QUESTIONS_PATH)
+    parser.add_argument("-o", "--output", type=Path, default=DEFAULT_ANSWERS_PATH)
+    parser.add_argument("-w", "--workers", type=int, default=mp.cpu_count())
+    parser.add_argument("-c", "--chunksize", type=int, default=16)
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print time, calls and counters of every stage (uses one worker)",
+    )
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="write a JSON trace of stages"
+    )
+    args = parser.parse_args()
+
+    # Statistics are collected per process, so profiling runs in this one.
+    workers = args.workers
+    if args.profile or args.trace is not None:
+        instrument.enable(trace=args.trace is not None)
+        workers = 1
+
+    start = time.perf_counter()
+    load_state()
+    print(f"State loaded in {time.perf_counter() - start:.1f}s")
+
+    with args.input.open("rt") as i:
+        questions = i.readlines()
+
+    start = time.perf_counter()
+    stages_timings = []
+    with args.output.open("wt") as o:
+        for a, timings in tqdm(
+            answer_batch(questions, workers, args.chunksize),
+            total=len(questions),
+        ):
+            o.write(a)
+            o.write("\n")
+            stages_timings.append(timings)
+    print(summarize(stages_timings, len(questions), time.perf_counter() - start))
+    if instrument.is_enabled():
+        print(instrument.summary())
+    if args.trace is not None:
+        instrument.write_trace(args.trace)
@@ -0,0 +1,502 @@
+import struct
+from array import array
+from bisect import bisect, bisect_left
+from itertools import accumulate, chain
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from textmining import instrument
+
+BLOCK_SIZE = 128
+
+_HEADER = struct.Struct("<II")
+
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varints(data, start: int, end: int) -> List[int]:
+    values = []
+    shift = 0
+    value = 0
+    for byte in data[start:end]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            shift = 0
+            value = 0
+    return values
+
+
+def _decode_gaps(data, start: int, end: int, base: int) -> List[int]:
+    gaps = _decode_varints(data, start, end)
+    return list(accumulate(gaps, initial=base))[1:]
+
+
+def encode(postings: Iterable[int]) -> bytes:
+    """
+    Return compressed, sorted postings.
+
+    Postings are split into blocks of `BLOCK_SIZE` delta-encoded varints.
+    They are preceded by a skip table with the last value
+    and the end offset of every block, so cursors can jump
+    over blocks without decoding them.
+    """
+    postings = list(postings)
+    lasts = []
+    ends = []
+    data = bytearray()
+    previous = 0
+    for block_start in range(0, len(postings), BLOCK_SIZE):
+        for value in postings[block_start : block_start + BLOCK_SIZE]:
+            _encode_varint(value - previous, data)
+            previous = value
+        lasts.append(previous)
+        ends.append(len(data))
+    n_blocks = len(lasts)
+    return b"".join(
+        [
+            _HEADER.pack(len(postings), n_blocks),
+            struct.pack(f"<{n_blocks}I", *lasts),
+            struct.pack(f"<{n_blocks}I", *ends),
+            data,
+        ]
+    )
+
+
+class PostingsList:
+    """
+    Read-only view of postings compressed with `encode`.
+    """
+
+    def __init__(self, blob):
+        blob = memoryview(blob)
+        self._count, n_blocks = _HEADER.unpack_from(blob)
+        table_start = _HEADER.size
+        table_end = table_start + 8 * n_blocks
+        self._lasts = blob[table_start : table_start + 4 * n_blocks].cast("I")
+        self._ends = blob[table_start + 4 * n_blocks : table_end].cast("I")
+        self._data = blob[table_end:]
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self) -> Iterator[int]:
+        for block in range(len(self._lasts)):
+            yield from self.decode_block(block)
+
+    @property
+    def nbytes(self) -> int:
+        return _HEADER.size + 8 * len(self._lasts) + len(self._data)
+
+    def decode_block(self, block: int) -> List[int]:
+        if block == 0:
+            return _decode_gaps(self._data, 0, self._ends[0], 0)
+        return _decode_gaps(
+            self._data, self._ends[block - 1], self._ends[block], self._lasts[block - 1]
+        )
+
+    def cursor(self) -> "PostingsCursor":
+        return PostingsCursor(self)
+
+
+EMPTY_POSTINGS = PostingsList(encode([]))
+
+
+class CachedPostingsList(PostingsList):
+    """
+    `PostingsList` keeping its decoded blocks in a cache, e.g. `LRUCache`,
+    under (key, block index).
+
+    Cursors decode only the blocks they reach, and each of them once,
+    so long lists are not decoded as a whole to be cached.
+    """
+
+    def __init__(self, postings: PostingsList, cache, key):
+        self._count = postings._count
+        self._lasts = postings._lasts
+        self._ends = postings._ends
+        self._data = postings._data
+        self._cache = cache
+        self._key = key
+
+    def decode_block(self, block: int) -> Sequence[int]:
+        key = (self._key, block)
+        values = self._cache.get(key)
+        if values is None:
+            instrument.count("postings_cache", "misses")
+            values = array("I", super().decode_block(block))
+            self._cache.put(key, values, values.itemsize * len(values))
+        else:
+            instrument.count("postings_cache", "hits")
+        return values
+
+
+def encode_frequencies(frequencies: Iterable[int]) -> bytes:
+    """
+    Return compressed frequencies, aligned with blocks of postings.
+
+    Frequencies are stored as plain varints, preceded by
+    the end offsets of blocks of `BLOCK_SIZE` values.
+    """
+    frequencies = list(frequencies)
+    ends = []
+    data = bytearray()
+    for block_start in range(0, len(frequencies), BLOCK_SIZE):
+        for value in frequencies[block_start : block_start + BLOCK_SIZE]:
+            _encode_varint(value, data)
+        ends.append(len(data))
+    return b"".join([struct.pack(f"<I{len(ends)}I", len(ends), *ends), data])
+
+
+class FrequenciesList:
+    """
+    Read-only view of frequencies compressed with `encode_frequencies`.
+    """
+
+    def __init__(self, blob):
+        blob = memoryview(blob)
+        (n_blocks,) = struct.unpack_from("<I", blob)
+        self._ends = blob[4 : 4 + 4 * n_blocks].cast("I")
+        self._data = blob[4 + 4 * n_blocks :]
+
+    def __iter__(self) -> Iterator[int]:
+        for block in range(len(self._ends)):
+            yield from self.decode_block(block)
+
+    def decode_block(self, block: int) -> List[int]:
+        start = self._ends[block - 1] if block else 0
+        return _decode_varints(self._data, start, self._ends[block])
+
+
+def group_positions(
+    positions: Iterable[int], beginnings: Sequence[int]
+) -> Tuple[List[int], List[List[int]]]:
+    """
+    Return documents of sorted global positions
+    and positions local to every of these documents.
+    """
+    docs = []
+    docs_positions = []
+    doc_idx = 0
+    for position in positions:
+        doc_idx = bisect(beginnings, position, doc_idx) - 1
+        if not docs or docs[-1] != doc_idx:
+            docs.append(doc_idx)
+            docs_positions.append([])
+        docs_positions[-1].append(position - beginnings[doc_idx])
+    return docs, docs_positions
+
+
+def _read_varint(data, offset: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_positions(docs_positions: Iterable[Sequence[int]]) -> bytes:
+    """
+    Return compressed local positions, aligned with postings.
+
+    Positions of every document are stored as delta-encoded varints,
+    preceded by their length in bytes, so other documents are skipped
+    without decoding them. The number of documents and end offsets
+    of blocks of `BLOCK_SIZE` documents come first.
+    """
+    n_docs = 0
+    ends = []
+    data = bytearray()
+    doc_data = bytearray()
+    for positions in docs_positions:
+        doc_data.clear()
+        previous = 0
+        for position in positions:
+            _encode_varint(position - previous, doc_data)
+            previous = position
+        _encode_varint(len(doc_data), data)
+        data += doc_data
+        n_docs += 1
+        if n_docs % BLOCK_SIZE == 0:
+            ends.append(len(data))
+    if n_docs % BLOCK_SIZE:
+        ends.append(len(data))
+    return b"".join(
+        [_HEADER.pack(n_docs, len(ends)), struct.pack(f"<{len(ends)}I", *ends), data]
+    )
+
+
+class PositionsList:
+    """
+    Read-only view of positions compressed with `encode_positions`.
+
+    Positions of the i-th document of the postings are `positions[i]`.
+    Lookups in increasing order continue from the previous one
+    within a block, so a forward sweep reads every length once.
+    """
+
+    def __init__(self, blob):
+        blob = memoryview(blob)
+        self._count, n_blocks = _HEADER.unpack_from(blob)
+        table_end = _HEADER.size + 4 * n_blocks
+        self._ends = blob[_HEADER.size : table_end].cast("I")
+        self._data = blob[table_end:]
+        # Index and offset of the document of the last lookup.
+        self._idx = 0
+        self._offset = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, idx: int) -> List[int]:
+        block = idx // BLOCK_SIZE
+        offset = self._offset
+        if not (self._idx <= idx and self._idx // BLOCK_SIZE == block):
+            self._idx = block * BLOCK_SIZE
+            offset = self._ends[block - 1] if block else 0
+        data = self._data
+        while self._idx < idx:
+            length, offset = _read_varint(data, offset)
+            offset += length
+            self._idx += 1
+        self._offset = offset
+        length, start = _read_varint(data, offset)
+        return list(accumulate(_decode_varints(data, start, start + length)))
+
+    def __iter__(self) -> Iterator[List[int]]:
+        for idx in range(self._count):
+            yield self[idx]
+
+
+class PostingsCursor:
+    """
+    Forward-only cursor over a `PostingsList`.
+
+    Only the blocks that may contain the requested values are decoded.
+    """
+
+    __slots__ = ("_postings", "_block", "_values", "_pos")
+
+    def __init__(self, postings: PostingsList):
+        self._postings = postings
+        self._block = -1
+        self._values = []
+        self._pos = 0
+
+    def next_geq(self, target: int) -> Optional[int]:
+        """
+        Return the smallest value not less than target
+        or None if there is no such value.
+        """
+        lasts = self._postings._lasts
+        block = self._block
+        if block < 0 or lasts[block] < target:
+            block = bisect_left(lasts, target, max(block, 0))
+            if block == len(lasts):
+                return None
+            self._block = block
+            self._values = self._postings.decode_block(block)
+            self._pos = 0
+        self._pos = bisect_left(self._values, target, self._pos)
+        return self._values[self._pos]
+
+    def index(self) -> int:
+        """
+        Return index of the value returned by the last `next_geq` in the postings.
+        """
+        return self._block * BLOCK_SIZE + self._pos
+
+
+class PostingsFrequenciesCursor(PostingsCursor):
+    """
+    `PostingsCursor` which also reads frequencies of its postings.
+
+    A block of frequencies is decoded only when
+    a frequency from it is requested.
+    """
+
+    __slots__ = ("_frequencies", "_frequencies_block", "_frequencies_values")
+
+    def __init__(self, postings: PostingsList, frequencies: FrequenciesList):
+        super().__init__(postings)
+        self._frequencies = frequencies
+        self._frequencies_block = -1
+        self._frequencies_values = []
+
+    def frequency(self) -> int:
+        """
+        Return frequency of the value returned by the last `next_geq`.
+        """
+        if self._frequencies_block != self._block:
+            self._frequencies_block = self._block
+            self._frequencies_values = self._frequencies.decode_block(self._block)
+        return self._frequencies_values[self._pos]
+
+
+class SequenceCursor:
+    """
+    Forward-only cursor over a sorted sequence.
+
+    Targets are looked up by galloping from the current position,
+    so a sweep over the whole sequence costs O(n)
+    and a few far jumps cost O(log n) each.
+    """
+
+    __slots__ = ("_values", "_pos")
+
+    def __init__(self, values: Sequence[int]):
+        self._values = values
+        self._pos = 0
+
+    def next_geq(self, target: int) -> Optional[int]:
+        values = self._values
+        lo = self._pos
+        n = len(values)
+        if lo == n:
+            return None
+        if values[lo] >= target:
+            return values[lo]
+
+        step = 1
+        hi = lo + 1
+        while hi < n and values[hi] < target:
+            lo = hi
+            step <<= 1
+            hi = lo + step
+        self._pos = bisect_left(values, target, lo + 1, min(hi, n))
+        if self._pos == n:
+            return None
+        return values[self._pos]
+
+    def index(self) -> int:
+        return self._pos
+
+
+class SequenceFrequenciesCursor(SequenceCursor):
+    """
+    `SequenceCursor` which also reads frequencies aligned with the sequence.
+    """
+
+    __slots__ = ("_frequencies",)
+
+    def __init__(self, values: Sequence[int], frequencies: Sequence[int]):
+        super().__init__(values)
+        self._frequencies = frequencies
+
+    def frequency(self) -> int:
+        return self._frequencies[self._pos]
+
+
+class UnionCursor:
+    """
+    Forward-only cursor over the union of other cursors.
+    """
+
+    __slots__ = ("_cursors",)
+
+    def __init__(self, cursors):
+        self._cursors = list(cursors)
+
+    def next_geq(self, target: int) -> Optional[int]:
+        values = [cursor.next_geq(target) for cursor in self._cursors]
+        return min((value for value in values if value is not None), default=None)
+
+
+class PositionsCursor:
+    """
+    Cursor over documents containing a term,
+    which also reads positions of the term in the current document.
+    """
+
+    __slots__ = ("_cursor", "_positions")
+
+    def __init__(self, postings, positions: Sequence[Sequence[int]]):
+        self._cursor = cursor(postings)
+        self._positions = positions
+
+    def next_geq(self, target: int) -> Optional[int]:
+        return self._cursor.next_geq(target)
+
+    def positions(self) -> Sequence[int]:
+        """
+        Return positions in the document returned by the last `next_geq`.
+        """
+        return self._positions[self._cursor.index()]
+
+
+class UnionPositionsCursor(UnionCursor):
+    """
+    `UnionCursor` over `PositionsCursor`s, with merged positions.
+    """
+
+    __slots__ = ("_values", "_value")
+
+    def __init__(self, cursors):
+        super().__init__(cursors)
+        self._values = []
+        self._value = None
+
+    def next_geq(self, target: int) -> Optional[int]:
+        self._values = [cursor.next_geq(target) for cursor in self._cursors]
+        self._value = min(
+            (value for value in self._values if value is not None), default=None
+        )
+        return self._value
+
+    def positions(self) -> List[int]:
+        return sorted(
+            set(
+                chain.from_iterable(
+                    cursor.positions()
+                    for cursor, value in zip(self._cursors, self._values)
+                    if value == self._value
+                )
+            )
+        )
+
+
+def cursor(postings):
+    if isinstance(postings, PostingsList):
+        return postings.cursor()
+    return SequenceCursor(postings)
+
+
+def frequencies_cursor(postings, frequencies):
+    if isinstance(postings, PostingsList):
+        return PostingsFrequenciesCursor(postings, frequencies)
+    return SequenceFrequenciesCursor(postings, frequencies)
+
+
+def intersect(cursors, shifts: Optional[Sequence[int]] = None) -> Iterator[int]:
+    """
+    Yield every value v such that each cursor contains v + shift.
+
+    Cursors leapfrog each other with `next_geq`,
+    so long postings lists are skipped block by block.
+    """
+    if not cursors:
+        return
+    if shifts is None:
+        shifts = [0] * len(cursors)
+    candidate = 0
+    while True:
+        for postings_cursor, shift in zip(cursors, shifts):
+            value = postings_cursor.next_geq(candidate + shift)
+            if value is None:
+                return
+            if value - shift > candidate:
+                candidate = value - shift
+                break
+        else:
+            yield candidate
+            candidate += 1
@@ -1,60 +1,253 @@
 import re
-from itertools import chain
+import sys
+from bisect import bisect_left
+from itertools import chain, islice
 from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
 
-import torch
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from transformers import AutoModelForQuestionAnswering, AutoTokenizer
 
+from textmining import instrument
+from textmining.cache import CacheStats, LRUCache
 from textmining.tokenization import tokenize
 
-
 DEFAULT_PROVERBS_PATH = Path("data/proverbs.txt")
-BERT_TOKENIZER = AutoTokenizer.from_pretrained("henryk/bert-base-multilingual-cased-finetuned-polish-squad2")
-BERT = AutoModelForQuestionAnswering.from_pretrained("henryk/bert-base-multilingual-cased-finetuned-polish-squad2")
+BERT_MODEL_NAME = "henryk/bert-base-multilingual-cased-finetuned-polish-squad2"
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_ANSWERS_CACHE_SIZE = 2**20
+
+# Beginning of a proverb quoted in a question, with a trailing ellipsis.
+_QUOTED_BEGINNING = re.compile(r"„(?P<beginning>.*?)\s*(?:\.\.\.|…)?”")
+
 
 def normalize(text: str):
     return " ".join(tokenize(text))
 
+
+class QuestionAnswerer:
+    """
+    Extractive question answering with BERT.
+
+    The model is loaded on first use, optionally with linear layers
+    dynamically quantized to int8. Questions are answered in padded
+    batches and answers are cached by (question, context).
+    """
+
+    def __init__(
+        self,
+        model_name: str = BERT_MODEL_NAME,
+        quantize: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        cache_size: int = DEFAULT_ANSWERS_CACHE_SIZE,
+    ):
+        self.model_name = model_name
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.cache = LRUCache(cache_size)
+        self.tokenizer = None
+        self.model = None
+
+    def load(self):
+        if self.model is not None:
+            return
+        import torch
+        from transformers import AutoModelForQuestionAnswering, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForQuestionAnswering.from_pretrained(self.model_name)
+        model.eval()
+        if self.quantize:
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.model = model
+
+    @instrument.timed("proverbs.bert")
+    def _answer_batch(self, pairs: List[Tuple[str, str]]) -> List[Optional[str]]:
+        import torch
+
+        questions, contexts = zip(*pairs)
+        inputs = self.tokenizer(
+            list(questions),
+            list(contexts),
+            padding=True,
+            truncation="only_second",
+            return_tensors="pt",
+        )
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
+
+        padding = inputs.attention_mask == 0
+        start_logits = outputs.start_logits.masked_fill(padding, -float("inf"))
+        end_logits = outputs.end_logits.masked_fill(padding, -float("inf"))
+        answers = []
+        for row, answer_start_index in enumerate(start_logits.argmax(1).tolist()):
+            if answer_start_index == 0:
+                answers.append(None)
+                continue
+            offset = end_logits[row, answer_start_index:].argmax().item()
+            predict_answer_tokens = inputs.input_ids[
+                row, answer_start_index : answer_start_index + offset + 1
+            ]
+            answers.append(self.tokenizer.decode(predict_answer_tokens))
+        return answers
+
+    def answer_batch(self, pairs: Iterable[Tuple[str, str]]) -> List[Optional[str]]:
+        """
+        Return answers to (question, context) pairs, None if there is no answer.
+        """
+        pairs = list(pairs)
+        answers = [None] * len(pairs)
+        missing = {}
+        for idx, pair in enumerate(pairs):
+            cached = self.cache.get(pair)
+            instrument.count("answers_cache", "misses" if cached is None else "hits")
+            if cached is None:
+                missing.setdefault(pair, []).append(idx)
+            else:
+                (answers[idx],) = cached
+
+        if missing:
+            self.load()
+        missing_pairs = iter(missing)
+        while batch := list(islice(missing_pairs, self.batch_size)):
+            for pair, batch_answer in zip(batch, self._answer_batch(batch)):
+                self.cache.put(pair, (batch_answer,), sys.getsizeof(batch_answer))
+                for idx in missing[pair]:
+                    answers[idx] = batch_answer
+        return answers
+
+    def answer(self, question: str, context: str) -> Optional[str]:
+        return self.answer_batch([(question, context)])[0]
+
+    def cache_stats(self) -> CacheStats:
+        return self.cache.stats()
+
+
 class ProverbsHandler:
-    def __init__(self, lemmas, proverbs_path: Path = DEFAULT_PROVERBS_PATH):
+    def __init__(
+        self,
+        lemmas,
+        proverbs_path: Path = DEFAULT_PROVERBS_PATH,
+        answerer: Optional[QuestionAnswerer] = None,
+    ):
         with proverbs_path.open("rt") as f:
             self.PROVERBS = f.read().strip().lower()
+        self.lines = self.PROVERBS.splitlines()
         self.lemmas = lemmas
-        self.TFIDF_VECTORIZER = TfidfVectorizer(tokenizer=self._tfidf_tokenize)
-        self.PROVERBS_TFIDF = self.TFIDF_VECTORIZER.fit_transform(self.PROVERBS.splitlines())
+        self.answerer = QuestionAnswerer() if answerer is None else answerer
+        self.TFIDF_VECTORIZER = TfidfVectorizer(
+            tokenizer=self._tfidf_tokenize, token_pattern=None
+        )
+        self.PROVERBS_TFIDF = self.TFIDF_VECTORIZER.fit_transform(self.lines)
+        # Proverbs of every term, i.e. columns of the TF-IDF matrix.
+        self._terms_proverbs = self.PROVERBS_TFIDF.T.tocsr()
+
+        # Normalized proverbs sorted for prefix lookups, with their line indices.
+        prefixes = sorted(
+            (normalize(line), line_idx) for line_idx, line in enumerate(self.lines)
+        )
+        self._prefixes = [prefix for prefix, _ in prefixes]
+        self._prefixes_lines = [line_idx for _, line_idx in prefixes]
 
     def _tfidf_tokenize(self, text: str):
-        return list(chain.from_iterable([self.lemmas.lemmatize(token) for token in tokenize(text.lower())]))
+        return list(
+            chain.from_iterable(
+                [self.lemmas.lemmatize(token) for token in tokenize(text.lower())]
+            )
+        )
 
-    def get_most_similar_proverbs(self, question: str, k: int = 10):
-        question_tfidf = self.TFIDF_VECTORIZER.transform([question])
-        terms_idxs = question_tfidf.nonzero()[1]
-        proverbs_tfidf_sum = self.PROVERBS_TFIDF[:, terms_idxs].sum(1).A1
-        best_proverbs_idxs = proverbs_tfidf_sum.argsort()[-1:-k:-1]
-        return [self.PROVERBS.splitlines()[idx] for idx in best_proverbs_idxs]
+    @instrument.timed("proverbs.tfidf")
+    def get_most_similar_proverbs_batch(
+        self, questions: List[str], k: int = 10
+    ) -> List[List[str]]:
+        """
+        Return k proverbs with the highest sum of TF-IDF weights
+        of terms of every question, best first.
 
+        Only proverbs sharing a term with a question are scored:
+        all questions are multiplied by the term-proverb matrix
+        at once and the best scores of every row are partitioned out.
+        Proverbs tied at the k-th score are all kept for the final sort,
+        so ties are broken by the proverb order.
+        """
+        if not questions:
+            return []
+        questions_terms = self.TFIDF_VECTORIZER.transform(questions)
+        questions_terms.data[:] = 1
+        scores = (questions_terms @ self._terms_proverbs).tocsr()
 
-    def handle_proverb_question(self, question):
-        question_lemmas = set(chain.from_iterable(map(self.lemmas.lemmatize, tokenize(question.lower()))))
+        proverbs = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            proverbs_idxs = scores.indices[start:end]
+            proverbs_scores = scores.data[start:end]
+            if len(proverbs_scores) > k:
+                kth = np.partition(proverbs_scores, len(proverbs_scores) - k)[-k]
+                best = proverbs_scores >= kth
+                proverbs_idxs = proverbs_idxs[best]
+                proverbs_scores = proverbs_scores[best]
+            order = np.lexsort((proverbs_idxs, -proverbs_scores))[:k]
+            proverbs.append([self.lines[idx] for idx in proverbs_idxs[order]])
+        return proverbs
 
+    def get_most_similar_proverbs(self, question: str, k: int = 10) -> List[str]:
+        return self.get_most_similar_proverbs_batch([question], k)[0]
+
+    def find_proverb(self, beginning: str) -> Optional[str]:
+        """
+        Return the first proverb starting with the beginning,
+        both normalized, or None if there is no such proverb.
+        """
+        prefix = normalize(beginning.lower())
+        if not prefix:
+            return None
+        start = bisect_left(self._prefixes, prefix)
+        end = start
+        while end < len(self._prefixes) and self._prefixes[end].startswith(prefix):
+            end += 1
+        if start == end:
+            return None
+        return self.lines[min(self._prefixes_lines[start:end])]
+
+    @instrument.timed("proverbs.complete")
+    def complete_proverb(self, question: str) -> Optional[str]:
+        """
+        Return ending of the proverb quoted in a "dokończ" question.
+        """
+        question_lemmas = set(
+            chain.from_iterable(map(self.lemmas.lemmatize, tokenize(question.lower())))
+        )
         if question_lemmas.intersection(self.lemmas.lemmatize("dokończ")):
-            match = re.search("„(?P<name>.*)...”", question.lower())
+            match = _QUOTED_BEGINNING.search(question.lower())
             if match:
-                beginning = match["name"]
-                beginning_match = re.search(f"^{beginning}(?P<name>.*)$", self.PROVERBS, flags=re.MULTILINE)
-                if beginning_match:
-                    return normalize(beginning_match["name"])
-
-        context = " [SEP] ".join(self.get_most_similar_proverbs(question.lower()))
-        inputs = BERT_TOKENIZER(question.lower(), context, return_tensors="pt")
-        with torch.no_grad():
-            outputs = BERT(**inputs)
-
-        answer_start_index = outputs.start_logits.argmax()
-        if answer_start_index != 0:
-            offset = outputs.end_logits[0, answer_start_index:].argmax()
-
-            predict_answer_tokens = inputs.input_ids[0, answer_start_index : answer_start_index + offset + 1]
-            return(BERT_TOKENIZER.decode(predict_answer_tokens))
+                beginning = normalize(match["beginning"])
+                proverb = self.find_proverb(beginning)
+                if proverb is not None:
+                    return normalize(proverb)[len(beginning) :].strip()
         return None
+
+    def handle_proverb_questions(self, questions: List[str]) -> List[Optional[str]]:
+        """
+        Return answers to the questions, None if there is no answer.
+
+        Questions without a completed proverb are answered by BERT
+        in batches, with the most similar proverbs as their context.
+        """
+        answers = [self.complete_proverb(question) for question in questions]
+        unanswered = [idx for idx, answer in enumerate(answers) if answer is None]
+        if not unanswered:
+            return answers
+        unanswered_questions = [questions[idx].lower() for idx in unanswered]
+        contexts = self.get_most_similar_proverbs_batch(unanswered_questions)
+        pairs = [
+            (question, " [SEP] ".join(context))
+            for question, context in zip(unanswered_questions, contexts)
+        ]
+        for idx, answer in zip(unanswered, self.answerer.answer_batch(pairs)):
+            answers[idx] = answer
+        return answers
+
+    def handle_proverb_question(self, question: str) -> Optional[str]:
+        return self.handle_proverb_questions([question])[0]
@@ -0,0 +1,202 @@
+import heapq
+from bisect import bisect
+from collections import defaultdict
+from itertools import chain
+from typing import Iterator, List, Sequence
+
+from textmining.postings import (
+    PositionsCursor,
+    UnionCursor,
+    UnionPositionsCursor,
+    cursor,
+    intersect,
+)
+
+
+def _token_cursor(postings_lists: List):
+    cursors = [cursor(postings) for postings in postings_lists if len(postings)]
+    if len(cursors) == 1:
+        return cursors[0]
+    return UnionCursor(cursors)
+
+
+def _rarest_first(groups: List[List]):
+    """
+    Return cursors of query tokens and their positions in the query,
+    ordered by the number of postings, or None if any token has no postings.
+    """
+    sizes = [sum(map(len, postings_lists)) for postings_lists in groups]
+    if not groups or 0 in sizes:
+        return None
+    order = sorted(range(len(groups)), key=sizes.__getitem__)
+    return [_token_cursor(groups[idx]) for idx in order], order
+
+
+def conjunction(groups: List[List]) -> Iterator[int]:
+    """
+    Yield values present in postings of every query token.
+
+    Every group holds postings lists of one token's lemmas.
+    Intersection starts from the rarest token, so frequent
+    tokens are only probed for the candidates it produces.
+    """
+    ordered = _rarest_first(groups)
+    if ordered is None:
+        return iter(())
+    cursors, _ = ordered
+    return intersect(cursors)
+
+
+def phrase(groups: List[List], beginnings: Sequence[int]) -> Iterator[int]:
+    """
+    Yield indices of documents containing query tokens
+    at consecutive positions.
+
+    Adjacency is checked while intersecting, by looking up
+    position p + i in postings of the i-th token. After a match
+    the search continues from the beginning of the next document.
+    """
+    ordered = _rarest_first(groups)
+    if ordered is None:
+        return
+    cursors, shifts = ordered
+
+    candidate = 0
+    while True:
+        for token_cursor, shift in zip(cursors, shifts):
+            value = token_cursor.next_geq(candidate + shift)
+            if value is None:
+                return
+            if value - shift > candidate:
+                candidate = value - shift
+                break
+        else:
+            doc_idx = bisect(beginnings, candidate) - 1
+            yield doc_idx
+            if doc_idx + 1 == len(beginnings):
+                return
+            candidate = beginnings[doc_idx + 1]
+
+
+def _ordered_within(tokens_positions: List[Sequence[int]], slop: int) -> bool:
+    """
+    Return whether tokens occur in order within a span
+    with at most `slop` other words.
+
+    From every occurrence of the first token the chain
+    of the earliest following occurrences is the shortest one.
+    """
+    first, *rest = tokens_positions
+    extra = len(tokens_positions) - 1 + slop
+    for start in first:
+        end = start
+        for positions in rest:
+            idx = bisect(positions, end)
+            if idx == len(positions):
+                return False
+            end = positions[idx]
+            if end - start > extra:
+                break
+        else:
+            return True
+    return False
+
+
+def _matching(tokens_at: List[List[int]], n_tokens: int) -> bool:
+    """
+    Return whether every token can be matched with a distinct position,
+    given tokens occurring at every position.
+    """
+    token_at = [None] * len(tokens_at)
+
+    def augment(token, visited):
+        # Take a free position or move its token to another one.
+        for position, tokens in enumerate(tokens_at):
+            if token in tokens and position not in visited:
+                visited.add(position)
+                other = token_at[position]
+                if other is None or augment(other, visited):
+                    token_at[position] = token
+                    return True
+        return False
+
+    return all(augment(token, set()) for token in range(n_tokens))
+
+
+def _shared_within(tokens_positions: List[Sequence[int]], extra: int) -> bool:
+    tokens_at = defaultdict(list)
+    for token, positions in enumerate(tokens_positions):
+        for position in positions:
+            tokens_at[position].append(token)
+    positions = sorted(tokens_at)
+    for idx, start in enumerate(positions):
+        span = positions[idx : bisect(positions, start + extra, idx)]
+        if len(span) >= len(tokens_positions) and _matching(
+            [tokens_at[position] for position in span], len(tokens_positions)
+        ):
+            return True
+    return False
+
+
+def _unordered_within(tokens_positions: List[Sequence[int]], slop: int) -> bool:
+    """
+    Return whether tokens occur in any order, at distinct positions,
+    within a span with at most `slop` other words.
+
+    The smallest span with an occurrence of every token is found
+    by advancing the earliest of their occurrences. If tokens share
+    positions, e.g. repeated words, spans starting at every occurrence
+    are checked for a matching of tokens with distinct positions instead.
+    """
+    extra = len(tokens_positions) - 1 + slop
+    n_positions = sum(map(len, tokens_positions))
+    if len(set(chain.from_iterable(tokens_positions))) < n_positions:
+        return _shared_within(tokens_positions, extra)
+
+    heap = [
+        (positions[0], token, 0) for token, positions in enumerate(tokens_positions)
+    ]
+    heapq.heapify(heap)
+    end = max(position for position, _, _ in heap)
+    while True:
+        start, token, idx = heap[0]
+        if end - start <= extra:
+            return True
+        positions = tokens_positions[token]
+        if idx + 1 == len(positions):
+            return False
+        end = max(end, positions[idx + 1])
+        heapq.heapreplace(heap, (positions[idx + 1], token, idx + 1))
+
+
+def _positions_cursor(postings_positions: List):
+    cursors = [
+        PositionsCursor(postings, positions)
+        for postings, positions in postings_positions
+        if len(postings)
+    ]
+    if len(cursors) == 1:
+        return cursors[0]
+    return UnionPositionsCursor(cursors)
+
+
+def near(groups: List[List], slop: int, ordered: bool) -> Iterator[int]:
+    """
+    Yield indices of documents containing query tokens
+    within a span with at most `slop` other words,
+    in the order of the query if `ordered` (NEAR/slop).
+
+    Every group holds (documents, positions) pairs of one token's lemmas,
+    with positions local to every document. Documents are intersected
+    first, so positions are read only for documents with all tokens.
+    Phrases are ordered with no other words.
+    """
+    sizes = [sum(len(docs) for docs, _ in postings) for postings in groups]
+    if not groups or 0 in sizes:
+        return
+    cursors = [_positions_cursor(postings) for postings in groups]
+    order = sorted(range(len(groups)), key=sizes.__getitem__)
+    within = _ordered_within if ordered else _unordered_within
+    for doc_idx in intersect([cursors[idx] for idx in order]):
+        if within([token_cursor.positions() for token_cursor in cursors], slop):
+            yield doc_idx
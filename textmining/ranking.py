@@ -0,0 +1,130 @@
+import heapq
+import math
+from operator import attrgetter
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+K1 = 1.2
+B = 0.75
+TITLE_BOOST = 3
+
+
+class BM25:
+    """
+    Okapi BM25 scoring of documents.
+
+    Term frequencies and document lengths are weighted,
+    with title tokens counted `TITLE_BOOST` times.
+    """
+
+    def __init__(self, n_documents: int, avgdl: float, k1: float = K1, b: float = B):
+        self.n_documents = n_documents
+        self.avgdl = avgdl or 1.0
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def from_lengths(cls, lengths: Sequence[int], k1: float = K1, b: float = B):
+        avgdl = sum(lengths) / len(lengths) if len(lengths) else 0.0
+        return cls(len(lengths), avgdl, k1, b)
+
+    def idf(self, df: int) -> float:
+        return math.log(1 + (self.n_documents - df + 0.5) / (df + 0.5))
+
+    def score(self, frequency: int, length: int, idf: float) -> float:
+        norm = self.k1 * (1 - self.b + self.b * length / self.avgdl)
+        return idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+    def upper_bound(
+        self,
+        doc_idxs: Sequence[int],
+        frequencies: Sequence[int],
+        lengths: Sequence[int],
+        idf: Optional[float] = None,
+    ) -> float:
+        """
+        Return the highest score of a term over documents containing it,
+        with idf of the documents if it is not given.
+        """
+        if idf is None:
+            idf = self.idf(len(doc_idxs))
+        return max(
+            (
+                self.score(frequency, lengths[doc_idx], idf)
+                for doc_idx, frequency in zip(doc_idxs, frequencies)
+            ),
+            default=0.0,
+        )
+
+
+class ScoredTerm:
+    """
+    Query term with a cursor over its postings and frequencies,
+    its idf and the upper bound of its score.
+    """
+
+    __slots__ = ("cursor", "idf", "bound", "doc_idx")
+
+    def __init__(self, cursor, idf: float, bound: float):
+        self.cursor = cursor
+        self.idf = idf
+        self.bound = bound
+        self.doc_idx = cursor.next_geq(0)
+
+    def advance(self, target: int):
+        self.doc_idx = self.cursor.next_geq(target)
+
+
+def top_k(
+    terms: Iterable[ScoredTerm], k: int, bm25: BM25, lengths: Sequence[int]
+) -> List[Tuple[int, float]]:
+    """
+    Return k documents with the highest BM25 scores
+    as (document index, score) pairs, best first.
+
+    Documents containing any of the terms are candidates (WAND).
+    Cursors are kept sorted by their current documents
+    and only the shortest prefix of them, whose summed upper bounds
+    exceed the k-th best score so far, has to match a document
+    for it to be scored. Other cursors skip it with `next_geq`.
+    Ties are broken by lower document index.
+    """
+    if k <= 0:
+        return []
+    terms = [term for term in terms if term.doc_idx is not None]
+    heap = []
+    threshold = 0.0
+    doc_idx_of = attrgetter("doc_idx")
+    while terms:
+        terms.sort(key=doc_idx_of)
+        pivot = _pivot(terms, threshold)
+        if pivot is None:
+            break
+        pivot_doc_idx = terms[pivot].doc_idx
+        if terms[0].doc_idx == pivot_doc_idx:
+            score = 0.0
+            length = lengths[pivot_doc_idx]
+            for term in terms:
+                if term.doc_idx != pivot_doc_idx:
+                    break
+                score += bm25.score(term.cursor.frequency(), length, term.idf)
+                term.advance(pivot_doc_idx + 1)
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -pivot_doc_idx))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, -pivot_doc_idx))
+            if len(heap) == k:
+                threshold = heap[0][0]
+        else:
+            for term in terms[:pivot]:
+                term.advance(pivot_doc_idx)
+        terms = [term for term in terms if term.doc_idx is not None]
+    return [(-doc_idx, score) for score, doc_idx in sorted(heap, reverse=True)]
+
+
+def _pivot(terms: List[ScoredTerm], threshold: float) -> Optional[int]:
+    bound = 0.0
+    for idx, term in enumerate(terms):
+        bound += term.bound
+        if bound > threshold:
+            return idx
+    return None
@@ -1,19 +1,80 @@
 import argparse
-import re
+import sys
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from colorama import Fore, Style
 
-from textmining.index import DEFAULT_INDEX_DIR, DiskIndex, DiskPositionIndex, Document, Index
-from textmining.lemmatization import Lemmas
-from textmining.tokenization import tokenize
+from textmining import instrument
+from textmining.index import (
+    DEFAULT_INDEX_DIR,
+    DEFAULT_POSTINGS_CACHE_SIZE,
+    DEFAULT_RESULTS_CACHE_SIZE,
+    DiskIndex,
+    DiskPositionIndex,
+    Document,
+    Index,
+)
+from textmining.lemmatization import DEFAULT_CACHE_SIZE, Lemmas
+from textmining.tokenization import tokenize, tokenize_with_offsets
+
+
+DEFAULT_PAGE_SIZE = 10
 
 
 def get_lemmas(text: str, lemmatize):
     return {lemma for token in tokenize(text) for lemma in lemmatize(token)}
 
 
+def _best_window(matches: List[bool], size: int) -> int:
+    """
+    Return start of the window of `size` items with most matches.
+    """
+    best_start = 0
+    best = count = sum(matches[:size])
+    for start in range(1, len(matches) - size + 1):
+        count += matches[start + size - 1] - matches[start - 1]
+        if count > best:
+            best_start, best = start, count
+    return best_start
+
+
+def highlight(
+    text: str,
+    tokens: List[Tuple[str, int, int]],
+    matching: Dict[str, bool],
+    snippet: Optional[int] = None,
+    start: str = Fore.RED,
+    end: str = Style.RESET_ALL,
+) -> str:
+    """
+    Return text with matching tokens wrapped in `start` and `end`.
+
+    Tokens come with their offsets from `tokenize_with_offsets`,
+    so the text is built in one pass. If `snippet` is given,
+    only the window of that many tokens with most matches is kept,
+    with an ellipsis marking every cut.
+    """
+    text_start, text_end = 0, len(text)
+    if snippet is not None and 0 < snippet < len(tokens):
+        window = _best_window([matching[token] for token, _, _ in tokens], snippet)
+        tokens = tokens[window : window + snippet]
+        text_start, text_end = tokens[0][1], tokens[-1][2]
+
+    parts = ["…"] if text_start > 0 else []
+    position = text_start
+    for token, token_start, token_end in tokens:
+        if matching[token]:
+            parts.extend([text[position:token_start], start, token, end])
+            position = token_end
+    parts.append(text[position:text_end])
+    if text_end < len(text):
+        parts.append("…")
+    return "".join(parts)
+
+
 class SearchEngine:
     def __init__(self, index=None):
         if index is None:
@@ -21,81 +82,336 @@ class SearchEngine:
         else:
             self.index = index
 
-    def process(self, docs: List[Document], query: str, color=False):
-        qtokens = tokenize(query.lower())
+    def _matching_tokens(self, tokens: Iterable[str], qlemmas: Set[str]):
+        """
+        Return table of unique tokens and whether they share a lemma with the query.
+        """
+        return {
+            token: not qlemmas.isdisjoint(self.index.lemmatize(token.lower()))
+            for token in set(tokens)
+        }
+
+    def _query_terms(self, query: str) -> Tuple[Set[str], Set[str]]:
+        qtokens = set(tokenize(query.lower()))
         qlemmas = {lemma for token in qtokens for lemma in self.index.lemmatize(token)}
+        return qtokens, qlemmas
+
+    @instrument.timed("engine.highlight")
+    def _highlight(
+        self, doc: Document, qlemmas: Set[str], snippet: Optional[int] = None
+    ):
+        title_tokens = tokenize_with_offsets(doc.title)
+        content_tokens = tokenize_with_offsets(doc.content)
+        matching = self._matching_tokens(
+            (token for token, _, _ in chain(title_tokens, content_tokens)), qlemmas
+        )
+        doc.title = highlight(doc.title, title_tokens, matching)
+        doc.content = highlight(doc.content, content_tokens, matching, snippet)
+
+    @instrument.timed("engine.process")
+    def process(
+        self,
+        docs: List[Document],
+        query: str,
+        color=False,
+        snippet: Optional[int] = None,
+    ):
+        qtokens, qlemmas = self._query_terms(query)
         for doc in docs:
-            doc.title_matching = 0
-            doc.exact_matching = 0
-            for token in tokenize(doc.title):
-                lemmas = set(self.index.lemmatize(token.lower()))
-                if qlemmas.intersection(lemmas):
-                    doc.title_matching += 1
-                    if color:
-                        doc.title = re.sub(
-                            rf"(\b){token}(\b)",
-                            rf"\1{Fore.RED + token + Style.RESET_ALL}\2",
-                            doc.title,
-                        )
-                if token.lower() in qtokens:
-                    doc.exact_matching += 1
-
-            for token in tokenize(doc.content):
-                lemmas = set(self.index.lemmatize(token.lower()))
-                if qlemmas.intersection(lemmas):
-                    if color:
-                        doc.content = re.sub(
-                            rf"(\b){token}(\b)",
-                            rf"\1{Fore.RED + token + Style.RESET_ALL}\2",
-                            doc.content,
-                        )
-
-                if token.lower() in qtokens:
-                    doc.exact_matching += 1
+            title_tokens = tokenize(doc.title)
+            content_tokens = tokenize(doc.content)
+            matching = self._matching_tokens(
+                chain(title_tokens, content_tokens), qlemmas
+            )
+
+            doc.title_matching = sum(matching[token] for token in title_tokens)
+            doc.exact_matching = sum(
+                token.lower() in qtokens
+                for token in chain(title_tokens, content_tokens)
+            )
+            if color:
+                self._highlight(doc, qlemmas, snippet)
 
         return sorted(
             docs, reverse=True, key=lambda d: (d.title_matching, d.exact_matching)
         )
 
-    def search(self, query: str, color=True):
-        docs = self.index.search(query)
-        return self.process(docs, query, color)
+    @instrument.timed("engine.rank")
+    def rank(
+        self, query: str, near: Optional[int] = None, ordered=False
+    ) -> List[Tuple[int, int, int]]:
+        """
+        Return indices of documents matching the query
+        with their title and exact matching, best first.
+
+        If `near` is given, query tokens have to occur within a span
+        with at most that many other words (NEAR/k), in the query order
+        if `ordered`. It needs an index of positions.
+
+        Matching is computed from token frequencies stored in the index,
+        so no document is loaded or tokenized.
+        """
+        qtokens, qlemmas = self._query_terms(query)
+        if near is None:
+            docs_idxs = self.index._get_docs_idxs(query.lower())
+        elif hasattr(self.index, "_get_near_docs_idxs"):
+            docs_idxs = self.index._get_near_docs_idxs(query.lower(), near, ordered)
+        else:
+            raise ValueError("Proximity queries need an index of positions.")
+        ranking = []
+        for doc_idx in sorted(docs_idxs):
+            features = self.index.load_features(doc_idx)
+            ranking.append(
+                (
+                    doc_idx,
+                    features.title_matching(qlemmas, self.index.lemmatize),
+                    features.exact_matching(qtokens),
+                )
+            )
+        return sorted(ranking, reverse=True, key=itemgetter(1, 2))
+
+    def search(
+        self,
+        query: str,
+        color=True,
+        k: Optional[int] = None,
+        snippet: Optional[int] = None,
+        near: Optional[int] = None,
+        ordered=False,
+    ):
+        """
+        Return k best documents matching the query (all if k is None).
+
+        If `snippet` is given, highlighted content is cut
+        to the window of that many tokens with most matches.
+        See `rank` for `near` and `ordered`.
+        """
+        results = self.results(
+            query, color=color, snippet=snippet, near=near, ordered=ordered
+        )
+        return results.page(0, k)
+
+    def search_ranked(
+        self, query: str, k: int = 10, color=True, snippet: Optional[int] = None
+    ) -> List[Document]:
+        """
+        Return k documents with the highest BM25 scores,
+        which contain any of the query lemmas.
+        """
+        results = self.results(query, ranked=True, color=color, snippet=snippet)
+        return results.page(0, k)
+
+    def results(
+        self,
+        query: str,
+        ranked=False,
+        color=True,
+        snippet: Optional[int] = None,
+        near: Optional[int] = None,
+        ordered=False,
+    ) -> "Results":
+        """
+        Return lazy results of the query, ranked with BM25
+        or by title and exact matching of all query tokens.
+        """
+        return Results(self, query, ranked, color, snippet, near, ordered)
+
+
+class Results:
+    """
+    Lazy, ranked results of a query.
+
+    Ranking is computed from index statistics only.
+    Documents are loaded and highlighted when they are paged through.
+    BM25 ranking is extended on demand, by asking the index
+    for twice as many best documents as fetched so far.
+    """
+
+    def __init__(
+        self,
+        engine: SearchEngine,
+        query: str,
+        ranked=False,
+        color=True,
+        snippet: Optional[int] = None,
+        near: Optional[int] = None,
+        ordered=False,
+    ):
+        if ranked and near is not None:
+            raise ValueError("Proximity queries are not ranked with BM25.")
+        if ranked and not hasattr(engine.index, "top_k"):
+            raise ValueError("BM25 ranking needs an index of documents.")
+        self.engine = engine
+        self.query = query
+        self.ranked = ranked
+        self.color = color
+        self.snippet = snippet
+        self.near = near
+        self.ordered = ordered
+        self._qlemmas = engine._query_terms(query)[1]
+        self._ranking = []
+        self._exhausted = False
+
+    def _fetch(self, n: Optional[int]):
+        """
+        Make at least n best entries of the ranking fetched (all if n is None).
+        """
+        if self._exhausted or (n is not None and n <= len(self._ranking)):
+            return
+        if not self.ranked:
+            self._ranking = self.engine.rank(self.query, self.near, self.ordered)
+            self._exhausted = True
+            return
+        k = sys.maxsize if n is None else max(n, 2 * len(self._ranking))
+        ranking = self.engine.index.top_k(self.query, k)
+        # Extend the ranking, so already fetched entries keep their places.
+        fetched = {doc_idx for doc_idx, *_ in self._ranking}
+        self._ranking.extend(entry for entry in ranking if entry[0] not in fetched)
+        self._exhausted = len(ranking) < k
+
+    def _load(self, entry) -> Document:
+        doc = self.engine.index.load_doc(entry[0])
+        if self.ranked:
+            (doc.score,) = entry[1:]
+        else:
+            doc.title_matching, doc.exact_matching = entry[1:]
+        if self.color:
+            self.engine._highlight(doc, self._qlemmas, self.snippet)
+        return doc
+
+    def __len__(self):
+        """
+        Return the number of all results, ranking all of them.
+        """
+        self._fetch(None)
+        return len(self._ranking)
+
+    def page(self, offset: int = 0, limit: Optional[int] = 10) -> List[Document]:
+        """
+        Return `limit` documents starting at `offset` (all if limit is None).
+        """
+        self._fetch(None if limit is None else offset + limit)
+        end = None if limit is None else offset + limit
+        return [self._load(entry) for entry in self._ranking[offset:end]]
+
+    def __iter__(self) -> Iterator[Document]:
+        """
+        Yield documents one by one, loading each of them only when requested.
+        """
+        position = 0
+        self._fetch(DEFAULT_PAGE_SIZE)
+        while position < len(self._ranking):
+            yield self._load(self._ranking[position])
+            position += 1
+            if position == len(self._ranking):
+                self._fetch(2 * position)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("Wyszukiwarka")
     parser.add_argument("-d", "--dir", default=None)
     parser.add_argument("-p", "--position", action="store_true")
+    order = parser.add_mutually_exclusive_group()
+    order.add_argument(
+        "-r",
+        "--ranked",
+        action="store_true",
+        help="rank documents with BM25 (default without -p and --near)",
+    )
+    order.add_argument(
+        "-m",
+        "--matching",
+        action="store_true",
+        help="sort all matching documents by title and exact matching,"
+        " which loads features of every match before the first result",
+    )
+    parser.add_argument(
+        "-k", type=int, default=None, help="show at most k documents of every query"
+    )
+    parser.add_argument(
+        "-n",
+        "--near",
+        type=int,
+        default=None,
+        help="match query tokens within a span with at most that many other words"
+        " (needs -p)",
+    )
+    parser.add_argument(
+        "-o", "--ordered", action="store_true", help="keep query order with --near"
+    )
+    parser.add_argument(
+        "-s",
+        "--snippet",
+        type=int,
+        default=None,
+        help="show only the best window of that many tokens of every document",
+    )
+    parser.add_argument("--lemma-cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print time, calls and counters of every stage on exit",
+    )
+    parser.add_argument(
+        "--postings-cache-mb",
+        type=int,
+        default=DEFAULT_POSTINGS_CACHE_SIZE // 2**20,
+        help="size of the cache of decoded postings in MiB (0 disables it)",
+    )
+    parser.add_argument(
+        "--results-cache-mb",
+        type=int,
+        default=DEFAULT_RESULTS_CACHE_SIZE // 2**20,
+        help="size of the cache of query results in MiB (0 disables it)",
+    )
     args = parser.parse_args()
+    if args.ranked and args.position:
+        parser.error("--ranked needs an index of documents, not of positions (-p)")
+    if args.ranked and args.near is not None:
+        parser.error("proximity queries (--near) are not ranked with BM25")
+    ranked = not (args.matching or args.position or args.near is not None)
+    if args.profile:
+        instrument.enable()
 
     print("Ładowanie lematów")
-    lemmas = Lemmas.from_file()
+    lemmas = Lemmas.from_file(cache_size=args.lemma_cache_size)
     print("Lematy gotowe")
+    cache_sizes = dict(
+        postings_cache_size=args.postings_cache_mb * 2**20,
+        results_cache_size=args.results_cache_mb * 2**20,
+    )
     if args.position:
         if args.dir is not None:
-            index = DiskPositionIndex(lemmas.lemmatize, dir)
+            index = DiskPositionIndex(lemmas.lemmatize, Path(args.dir), **cache_sizes)
         else:
-            index = DiskPositionIndex(lemmas.lemmatize)
+            index = DiskPositionIndex(lemmas.lemmatize, **cache_sizes)
     else:
         if args.dir is not None:
-            index = DiskIndex(lemmas.lemmatize, dir)
+            index = DiskIndex(lemmas.lemmatize, Path(args.dir), **cache_sizes)
         else:
-            index = DiskIndex(lemmas.lemmatize)
+            index = DiskIndex(lemmas.lemmatize, **cache_sizes)
     se = SearchEngine(index)
 
     prompt = "Naciśnij ENTER, aby zobaczyć kolejny dokument..."
     try:
         while True:
             query = input("Wprowadź zapytanie: ")
-            docs = se.search(query)
-            if docs:
-                print(f"[{docs[0].id}]  {docs[0].title}", docs[0].content, sep="\n", end="\n\n")
-
-            for doc in docs[1:]:
-                if not (response := input(prompt)):
+            results = se.results(
+                query,
+                ranked=ranked,
+                snippet=args.snippet,
+                near=args.near,
+                ordered=args.ordered,
+            )
+            for position, doc in enumerate(islice(results, args.k)):
+                if position:
+                    if input(prompt):
+                        break
                     print("\033[A", len(prompt) * " ", "\033[A")
-                    print(f"[{doc.id}]  {doc.title}", doc.content, sep="\n", end="\n\n")
-                else:
-                    break
+                print(f"[{doc.id}]  {doc.title}", doc.content, sep="\n", end="\n\n")
     except KeyboardInterrupt:
-        pass
+        print("\nPamięć podręczna lematów:", lemmas.cache_stats())
+        for name, stats in index.cache_stats().items():
+            print(f"Pamięć podręczna ({name}):", stats)
+        if args.profile:
+            print(instrument.summary())
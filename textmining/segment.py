@@ -0,0 +1,571 @@
+import heapq
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect
+from contextlib import ExitStack
+from dataclasses import asdict
+from functools import partial
+from itertools import accumulate, groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from tqdm import tqdm
+
+from textmining import instrument, postings
+from textmining.corpus import (
+    Document,
+    SourceDocuments,
+    map_corpus,
+    read_document_at,
+)
+from textmining.features import DocumentFeatures
+from textmining.postings import (
+    EMPTY_POSTINGS,
+    FrequenciesList,
+    PositionsList,
+    PostingsFrequenciesCursor,
+    PostingsList,
+    group_positions,
+)
+from textmining.ranking import TITLE_BOOST, BM25, ScoredTerm
+
+FORMAT_VERSION = 4
+
+META_FILE = "meta.json"
+TERMS_FILE = "terms.dat"
+POSTINGS_FILE = "postings.dat"
+DOCS_FILE = "docs.dat"
+FEATURES_FILE = "features.dat"
+BEGINNINGS_FILE = "beginnings.dat"
+FREQUENCIES_FILE = "frequencies.dat"
+BOUNDS_FILE = "bounds.dat"
+LENGTHS_FILE = "lengths.dat"
+DOC_POSTINGS_FILE = "doc_postings.dat"
+DOC_POSITIONS_FILE = "doc_positions.dat"
+
+INDEX_KIND = "index"
+POSITION_INDEX_KIND = "position_index"
+
+_FOOTER = struct.Struct("<Q")
+_OFFSET = struct.Struct("<Q")
+
+
+class BlobTableWriter:
+    """
+    Write a sequence of byte strings into a single file.
+
+    Blobs are stored back to back, followed by
+    a table of their offsets and the number of blobs.
+    """
+
+    def __init__(self, path: Path):
+        self._file = path.open("wb")
+        self._offsets = array("Q", [0])
+
+    def append(self, blob: bytes):
+        self._file.write(blob)
+        self._offsets.append(self._offsets[-1] + len(blob))
+
+    def close(self):
+        padding = -self._offsets[-1] % self._offsets.itemsize
+        self._file.write(bytes(padding))
+        self._file.write(self._offsets.tobytes())
+        self._file.write(_FOOTER.pack(len(self._offsets) - 1))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BlobTable:
+    """
+    Read-only, memory-mapped view of a file written by `BlobTableWriter`.
+    """
+
+    def __init__(self, path: Path):
+        with path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        (n,) = _FOOTER.unpack_from(self._mmap, len(self._mmap) - _FOOTER.size)
+        end = len(self._mmap) - _FOOTER.size
+        self._offsets = self._view[end - 8 * (n + 1) : end].cast("Q")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx: int) -> memoryview:
+        return self._view[self._offsets[idx] : self._offsets[idx + 1]]
+
+    def nbytes(self, idx: int) -> int:
+        return self._offsets[idx + 1] - self._offsets[idx]
+
+
+def _write_array(path: Path, values: array):
+    with path.open("wb") as f:
+        f.write(values.tobytes())
+
+
+def _load_array(path: Path, typecode: str) -> array:
+    values = array(typecode)
+    with path.open("rb") as f:
+        values.frombytes(f.read())
+    return values
+
+
+def _write_segment(
+    dir: Path,
+    kind: str,
+    terms_postings: Iterable[Tuple[bytes, Sequence[int], Optional[Sequence[int]]]],
+    docs: Iterable[bytes],
+    features: Iterable[bytes],
+    beginnings: Optional[Iterable[int]] = None,
+    n_positions: Optional[int] = None,
+    lengths: Optional[Sequence[int]] = None,
+    source: Optional[Path] = None,
+    progress: bool = True,
+):
+    """
+    Write terms with their postings and documents into a segment.
+
+    If lengths of documents are given, frequencies aligned
+    with postings are written too, together with the upper bound
+    of BM25 score of every term.
+
+    Global positions of a position index are also written grouped
+    by documents: documents of every term and positions local to them.
+    Both copies are kept, which takes about twice the space of global
+    positions, as phrases are fastest over global positions while
+    NEAR queries read positions only of documents with all tokens.
+    """
+    dir.mkdir(parents=True, exist_ok=True)
+    if beginnings is not None:
+        beginnings = array("Q", beginnings)
+
+    if progress:
+        print("Saving inverse mapping to", dir)
+    n_terms = 0
+    bm25 = None
+    bounds = array("d")
+    with ExitStack() as stack:
+        terms_writer = stack.enter_context(BlobTableWriter(dir / TERMS_FILE))
+        postings_writer = stack.enter_context(BlobTableWriter(dir / POSTINGS_FILE))
+        if lengths is not None:
+            bm25 = BM25.from_lengths(lengths)
+            frequencies_writer = stack.enter_context(
+                BlobTableWriter(dir / FREQUENCIES_FILE)
+            )
+        if beginnings is not None:
+            doc_postings_writer = stack.enter_context(
+                BlobTableWriter(dir / DOC_POSTINGS_FILE)
+            )
+            doc_positions_writer = stack.enter_context(
+                BlobTableWriter(dir / DOC_POSITIONS_FILE)
+            )
+        for term, term_postings, term_frequencies in tqdm(
+            terms_postings, disable=not progress
+        ):
+            terms_writer.append(term)
+            postings_writer.append(postings.encode(term_postings))
+            if bm25 is not None:
+                frequencies_writer.append(postings.encode_frequencies(term_frequencies))
+                bounds.append(
+                    bm25.upper_bound(term_postings, term_frequencies, lengths)
+                )
+            if beginnings is not None:
+                term_docs, term_positions = group_positions(term_postings, beginnings)
+                doc_postings_writer.append(postings.encode(term_docs))
+                doc_positions_writer.append(postings.encode_positions(term_positions))
+            n_terms += 1
+
+    if progress:
+        print("Saving docs to", dir)
+    n_documents = 0
+    with BlobTableWriter(dir / DOCS_FILE) as docs_writer:
+        for doc in tqdm(docs, disable=not progress):
+            docs_writer.append(doc)
+            n_documents += 1
+
+    with BlobTableWriter(dir / FEATURES_FILE) as features_writer:
+        for document_features in features:
+            features_writer.append(document_features)
+
+    if beginnings is not None:
+        _write_array(dir / BEGINNINGS_FILE, beginnings)
+    if bm25 is not None:
+        _write_array(dir / BOUNDS_FILE, bounds)
+        _write_array(dir / LENGTHS_FILE, array("I", lengths))
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "kind": kind,
+        "terms": n_terms,
+        "documents": n_documents,
+    }
+    if n_positions is not None:
+        meta["positions"] = n_positions
+    if beginnings is not None:
+        meta["grouped_positions"] = True
+    if bm25 is not None:
+        meta["ranking"] = {
+            "k1": bm25.k1,
+            "b": bm25.b,
+            "title_boost": TITLE_BOOST,
+            "avgdl": bm25.avgdl,
+        }
+    if source is not None:
+        meta["source"] = str(source.resolve())
+        meta["source_size"] = source.stat().st_size
+    with (dir / META_FILE).open("wt") as f:
+        json.dump(meta, f)
+
+
+def write_segment(
+    dir: Path,
+    kind: str,
+    inverse_mapping,
+    documents: Iterable,
+    features: Iterable[bytes],
+    beginnings: Optional[Iterable[int]] = None,
+    n_positions: Optional[int] = None,
+    frequencies=None,
+    lengths: Optional[Sequence[int]] = None,
+    progress: bool = True,
+):
+    """
+    Write index into a segment.
+
+    Documents kept as `SourceDocuments` are stored as offsets
+    into their corpus, other ones are stored as JSON.
+    Features are encoded `DocumentFeatures` of the documents.
+    Frequencies of terms, aligned with postings, and lengths
+    of documents make the segment support BM25 ranking.
+    """
+    terms_postings = (
+        (
+            term.encode(),
+            inverse_mapping[term],
+            None if frequencies is None else frequencies[term],
+        )
+        for term in sorted(inverse_mapping)
+    )
+    source = None
+    if isinstance(documents, SourceDocuments):
+        source = documents.path
+        docs = (_OFFSET.pack(offset) for offset in documents.offsets)
+    else:
+        docs = (json.dumps(asdict(document)).encode() for document in documents)
+    _write_segment(
+        dir,
+        kind,
+        terms_postings,
+        docs,
+        features,
+        beginnings,
+        n_positions,
+        lengths,
+        source,
+        progress,
+    )
+
+
+def _shard_terms(segment: "Segment", shard: int):
+    for term_id in range(len(segment.terms)):
+        yield bytes(segment.terms[term_id]), shard, term_id
+
+
+class _Remap:
+    """
+    Map of values (documents or positions) of a segment
+    to values of the merged segment, which skips deleted documents.
+    """
+
+    def __init__(self, segment: "Segment", deleted: Set[int]):
+        self.deleted = deleted
+        self.offset = 0
+        n_documents = len(segment)
+        if segment.kind == POSITION_INDEX_KIND:
+            self.beginnings = segment.load_beginnings()
+            ends = self.beginnings[1:] + array("Q", [segment.meta["positions"]])
+            sizes = [end - beginning for beginning, end in zip(self.beginnings, ends)]
+            self.size = segment.meta["positions"]
+        else:
+            self.beginnings = None
+            sizes = [1] * n_documents
+            self.size = n_documents
+
+        # Number of values of deleted documents before every document.
+        self.shifts = array("Q")
+        removed = 0
+        for doc_idx in range(n_documents):
+            self.shifts.append(removed)
+            if doc_idx in deleted:
+                removed += sizes[doc_idx]
+        self.size -= removed
+
+    def document(self, value: int) -> int:
+        if self.beginnings is None:
+            return value
+        return bisect(self.beginnings, value) - 1
+
+    def values(self, values: Iterable[int]) -> Iterator[Optional[int]]:
+        """
+        Yield mapped values, None for values of deleted documents.
+        """
+        if not self.deleted:
+            for value in values:
+                yield value + self.offset
+            return
+        for value in values:
+            doc_idx = self.document(value)
+            if doc_idx in self.deleted:
+                yield None
+            else:
+                yield value - self.shifts[doc_idx] + self.offset
+
+
+def _live_documents(segments: List["Segment"], deleted: List[Set[int]]):
+    for shard, segment in enumerate(segments):
+        for doc_idx in range(len(segment)):
+            if doc_idx not in deleted[shard]:
+                yield shard, doc_idx
+
+
+def _merged_terms_postings(
+    segments: List["Segment"], remaps: List[_Remap], ranked: bool
+):
+    terms = heapq.merge(
+        *(_shard_terms(segment, shard) for shard, segment in enumerate(segments))
+    )
+    for term, group in groupby(terms, key=itemgetter(0)):
+        values = []
+        frequencies = [] if ranked else None
+        for _, shard, term_id in group:
+            segment = segments[shard]
+            mapped = remaps[shard].values(PostingsList(segment.postings[term_id]))
+            if ranked:
+                for value, frequency in zip(
+                    mapped, FrequenciesList(segment.frequencies[term_id])
+                ):
+                    if value is not None:
+                        values.append(value)
+                        frequencies.append(frequency)
+            else:
+                values.extend(value for value in mapped if value is not None)
+        if values:
+            yield term, values, frequencies
+
+
+def merge_segments(
+    dirs: List[Path],
+    output: Path,
+    progress: bool = True,
+    deleted: Optional[List[Set[int]]] = None,
+):
+    """
+    Merge segments into one, in the given order.
+
+    Document indices (and positions) of every segment
+    are shifted by the number of documents (and positions)
+    in the preceding ones. Bounds of BM25 scores are
+    computed again for the merged collection.
+
+    Documents with indices in `deleted` sets of their segments are dropped.
+    """
+    segments = [Segment(dir) for dir in dirs]
+    kinds = {segment.kind for segment in segments}
+    if len(kinds) != 1:
+        raise ValueError(f"Cannot merge segments of different kinds ({kinds}).")
+    (kind,) = kinds
+    sources = {segment.meta.get("source") for segment in segments}
+    if len(sources) != 1:
+        raise ValueError(f"Cannot merge segments of different sources ({sources}).")
+    (source,) = sources
+    if deleted is None:
+        deleted = [set() for _ in segments]
+
+    remaps = [
+        _Remap(segment, segment_deleted)
+        for segment, segment_deleted in zip(segments, deleted)
+    ]
+    offsets = list(accumulate((remap.size for remap in remaps), initial=0))
+    for remap, offset in zip(remaps, offsets):
+        remap.offset = offset
+    live = partial(_live_documents, segments, deleted)
+
+    n_positions = None
+    beginnings = None
+    if kind == POSITION_INDEX_KIND:
+        n_positions = offsets[-1]
+        beginnings = [
+            remaps[shard].beginnings[doc_idx]
+            - remaps[shard].shifts[doc_idx]
+            + offsets[shard]
+            for shard, doc_idx in live()
+        ]
+    lengths = None
+    ranked = all(segment.bm25 is not None for segment in segments)
+    if ranked:
+        lengths = array(
+            "I", (segments[shard].lengths[doc_idx] for shard, doc_idx in live())
+        )
+    docs = (bytes(segments[shard].docs[doc_idx]) for shard, doc_idx in live())
+    features = (bytes(segments[shard].features[doc_idx]) for shard, doc_idx in live())
+    _write_segment(
+        output,
+        kind,
+        _merged_terms_postings(segments, remaps, ranked),
+        docs,
+        features,
+        beginnings,
+        n_positions,
+        lengths,
+        None if source is None else Path(source),
+        progress,
+    )
+
+
+class Segment:
+    """
+    Read-only index segment.
+
+    Consists of a sorted term dictionary, postings aligned with it
+    and a document store, all of them opened through `mmap`.
+    Segments of the index may also have frequencies of terms
+    and lengths of documents for BM25 ranking.
+    """
+
+    def __init__(self, dir: Path):
+        self.dir = dir
+        with (dir / META_FILE).open("rt") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported index format version ({self.meta['version']})."
+            )
+        self.kind = self.meta["kind"]
+        self.terms = BlobTable(dir / TERMS_FILE)
+        self.postings = BlobTable(dir / POSTINGS_FILE)
+        self.docs = BlobTable(dir / DOCS_FILE)
+        self.features = BlobTable(dir / FEATURES_FILE)
+
+        self.bm25 = None
+        if "ranking" in self.meta:
+            ranking = self.meta["ranking"]
+            self.frequencies = BlobTable(dir / FREQUENCIES_FILE)
+            self.bounds = _load_array(dir / BOUNDS_FILE, "d")
+            self.lengths = _load_array(dir / LENGTHS_FILE, "I")
+            self.bm25 = BM25(len(self), ranking["avgdl"], ranking["k1"], ranking["b"])
+
+        self.grouped_positions = self.meta.get("grouped_positions", False)
+        if self.grouped_positions:
+            self.doc_postings = BlobTable(dir / DOC_POSTINGS_FILE)
+            self.doc_positions = BlobTable(dir / DOC_POSITIONS_FILE)
+
+        self.source = None
+        if "source" in self.meta:
+            source = Path(self.meta["source"])
+            if source.stat().st_size != self.meta["source_size"]:
+                raise ValueError(f"Source of the index ({source}) has changed.")
+            self.source = map_corpus(source)
+
+    def __len__(self):
+        return self.meta["documents"]
+
+    def term_id(self, term: str) -> Optional[int]:
+        key = term.encode()
+        lo, hi = 0, len(self.terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bytes(self.terms[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.terms) and self.terms[lo] == key:
+            return lo
+        return None
+
+    def get_postings(self, term: str) -> PostingsList:
+        term_id = self.term_id(term)
+        if term_id is None:
+            return EMPTY_POSTINGS
+        instrument.count("segment.postings", "bytes", self.postings.nbytes(term_id))
+        return PostingsList(self.postings[term_id])
+
+    def get_doc_postings(self, term: str) -> PostingsList:
+        """
+        Return documents containing the term, in a segment with grouped positions.
+        """
+        term_id = self.term_id(term)
+        if term_id is None:
+            return EMPTY_POSTINGS
+        instrument.count(
+            "segment.doc_postings", "bytes", self.doc_postings.nbytes(term_id)
+        )
+        return PostingsList(self.doc_postings[term_id])
+
+    def get_doc_positions(self, term: str) -> Optional[PositionsList]:
+        """
+        Return positions of the term local to its documents,
+        aligned with `get_doc_postings`, or None if it is missing.
+        """
+        term_id = self.term_id(term)
+        if term_id is None:
+            return None
+        instrument.count(
+            "segment.doc_positions", "bytes", self.doc_positions.nbytes(term_id)
+        )
+        return PositionsList(self.doc_positions[term_id])
+
+    def get_scored_term(
+        self, term: str, bm25: Optional[BM25] = None, df: Optional[int] = None
+    ) -> Optional[ScoredTerm]:
+        """
+        Return term prepared for BM25 ranking or None if it is missing.
+
+        Statistics of the segment are used, unless `bm25` and the document
+        frequency of the term in a whole collection are given. The stored
+        upper bound is then rescaled to them: a longer average document
+        raises scores of long documents at most by the ratio of averages.
+        """
+        if self.bm25 is None:
+            raise ValueError(f"Segment {self.dir} does not support ranking.")
+        term_id = self.term_id(term)
+        if term_id is None:
+            return None
+        instrument.count(
+            "segment.postings",
+            "bytes",
+            self.postings.nbytes(term_id) + self.frequencies.nbytes(term_id),
+        )
+        term_postings = PostingsList(self.postings[term_id])
+        cursor = PostingsFrequenciesCursor(
+            term_postings, FrequenciesList(self.frequencies[term_id])
+        )
+        idf = self.bm25.idf(len(term_postings))
+        bound = self.bounds[term_id]
+        if bm25 is not None:
+            collection_idf = bm25.idf(df)
+            bound *= collection_idf / idf * max(1.0, bm25.avgdl / self.bm25.avgdl)
+            idf = collection_idf
+        return ScoredTerm(cursor, idf, bound)
+
+    def load_beginnings(self):
+        return _load_array(self.dir / BEGINNINGS_FILE, "Q")
+
+    def load_document(self, doc_idx: int) -> Document:
+        if self.source is not None:
+            (offset,) = _OFFSET.unpack(self.docs[doc_idx])
+            document = read_document_at(self.source, offset)
+            instrument.count("segment.documents", "bytes", document.nbytes)
+            return document
+        instrument.count("segment.documents", "bytes", self.docs.nbytes(doc_idx))
+        return Document(**json.loads(bytes(self.docs[doc_idx])))
+
+    def load_features(self, doc_idx: int) -> DocumentFeatures:
+        return DocumentFeatures.decode(self.features[doc_idx])
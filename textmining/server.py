@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from textmining.index import DiskIndex, DiskPositionIndex
+from textmining.lemmatization import DEFAULT_CACHE_SIZE, Lemmas
+from textmining.search import SearchEngine
+
+DEFAULT_SOCKET_PATH = Path("data/textmining.sock")
+
+
+class Service:
+    """
+    Search and question answering methods callable with JSON parameters.
+    """
+
+    def __init__(
+        self,
+        engine: SearchEngine,
+        answer: Optional[Callable[[str], str]] = None,
+        lemmas: Optional[Lemmas] = None,
+    ):
+        self.engine = engine
+        self.answer_question = answer
+        self.lemmas = lemmas
+
+    def search(
+        self,
+        query: str,
+        k: Optional[int] = 10,
+        offset: int = 0,
+        ranked: bool = False,
+        color: bool = False,
+        snippet: Optional[int] = None,
+        near: Optional[int] = None,
+        ordered: bool = False,
+    ) -> List[Dict]:
+        results = self.engine.results(query, ranked, color, snippet, near, ordered)
+        return [vars(doc) for doc in results.page(offset, k)]
+
+    def answer(self, question: str) -> str:
+        if self.answer_question is None:
+            raise ValueError("Question answering is not enabled.")
+        return self.answer_question(question)
+
+    def stats(self) -> Dict[str, str]:
+        stats = {}
+        if self.lemmas is not None:
+            stats["lemmas"] = str(self.lemmas.cache_stats())
+        if hasattr(self.engine.index, "cache_stats"):
+            for name, cache_stats in self.engine.index.cache_stats().items():
+                stats[name] = str(cache_stats)
+        return stats
+
+    def call(self, method: str, params: Dict):
+        if method not in ("search", "answer", "stats"):
+            raise ValueError(f"Unknown method {method!r}.")
+        return getattr(self, method)(**params)
+
+
+# Set before a process pool is started, so forked workers share it.
+_service: Optional[Service] = None
+
+
+def _call(method: str, params: Dict):
+    return _service.call(method, params)
+
+
+class Server:
+    """
+    Server of newline-delimited JSON requests over a Unix socket.
+
+    Every request is an object with "method", "params" and optional "id",
+    answered with an object with the same "id" and either
+    "result" or "error". Requests of one connection are answered in order,
+    connections are served concurrently. Methods run in an executor,
+    so the event loop only moves bytes.
+    """
+
+    def __init__(self, service: Service, executor: Executor):
+        self.service = service
+        self.executor = executor
+
+    async def _respond(self, request: Dict) -> Dict:
+        response = {"id": request.get("id")}
+        try:
+            method = request["method"]
+            params = request.get("params", {})
+            loop = asyncio.get_running_loop()
+            if isinstance(self.executor, ProcessPoolExecutor):
+                call = partial(_call, method, params)
+            else:
+                call = partial(self.service.call, method, params)
+            response["result"] = await loop.run_in_executor(self.executor, call)
+        except Exception as e:
+            response["error"] = f"{type(e).__name__}: {e}"
+        return response
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    response = {"id": None, "error": f"JSONDecodeError: {e}"}
+                else:
+                    response = await self._respond(request)
+                writer.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self, path: Path = DEFAULT_SOCKET_PATH) -> asyncio.AbstractServer:
+        path.unlink(missing_ok=True)
+        return await asyncio.start_unix_server(
+            self._handle_connection, path=str(path), limit=2**24
+        )
+
+    async def serve_forever(self, path: Path = DEFAULT_SOCKET_PATH):
+        server = await self.start(path)
+        print("Listening on", path)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--socket", type=Path, default=DEFAULT_SOCKET_PATH)
+    parser.add_argument("-d", "--dir", type=Path, default=None)
+    parser.add_argument("-p", "--position", action="store_true")
+    parser.add_argument(
+        "--qa",
+        action="store_true",
+        help="answer questions with the poleval solution and use its index",
+    )
+    parser.add_argument("-t", "--threads", type=int, default=4)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="run requests in that many forked processes instead of threads",
+    )
+    parser.add_argument("--lemma-cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    args = parser.parse_args()
+
+    if args.qa:
+        from textmining.poleval import solution
+
+        print("Loading lemmas, index, proverbs and BERT")
+        state = solution.load_state()
+        state.proverbs_handler.answerer.load()
+        service = Service(state.se, solution.answer, state.lemmas)
+    else:
+        print("Loading lemmas")
+        lemmas = Lemmas.from_file(cache_size=args.lemma_cache_size)
+        index_cls = DiskPositionIndex if args.position else DiskIndex
+        if args.dir is not None:
+            index = index_cls(lemmas.lemmatize, args.dir)
+        else:
+            index = index_cls(lemmas.lemmatize)
+        service = Service(SearchEngine(index), lemmas=lemmas)
+    print("State loaded")
+
+    _service = service
+    if args.processes:
+        executor = ProcessPoolExecutor(
+            args.processes, mp_context=mp.get_context("fork")
+        )
+    else:
+        executor = ThreadPoolExecutor(args.threads)
+    with executor:
+        try:
+            asyncio.run(Server(service, executor).serve_forever(args.socket))
+        except KeyboardInterrupt:
+            pass
@@ -1,4 +1,6 @@
+import re
 import unicodedata
+from typing import Iterable, List, Tuple
 
 
 def lstrip_punctuation(word: str) -> str:
@@ -55,15 +57,35 @@ def strip_notalnum(word: str) -> str:
     return rstrip_notalnum(lstrip_notalnum(word))
 
 
-def tokenize(text: str):
+# A token runs from the first to the last alphanumeric character
+# of a chunk of text without whitespaces.
+TOKEN_PATTERN = re.compile(r"[^\W_](?:\S*[^\W_])?")
+
+
+def tokenize(text: str) -> List[str]:
     """
     Return tokenized text.
 
     Tokenization is applied by splitting on whitespaces
-    and removing every leading and trailing not alphanumeric character.
+    and removing every leading and trailing not alphanumeric character,
+    in a single pass of `TOKEN_PATTERN` over the text.
+    """
+    return TOKEN_PATTERN.findall(text)
+
+
+def tokenize_with_offsets(text: str) -> List[Tuple[str, int, int]]:
+    """
+    Return tokens of the text with their start and end character offsets.
     """
     return [
-        tokenized_word
-        for tokenized_word in map(strip_notalnum, text.split())
-        if tokenized_word
+        (match.group(), match.start(), match.end())
+        for match in TOKEN_PATTERN.finditer(text)
     ]
+
+
+def tokenize_batch(texts: Iterable[str]) -> List[List[str]]:
+    """
+    Return tokenized texts.
+    """
+    findall = TOKEN_PATTERN.findall
+    return [findall(text) for text in texts]